@@ -5,9 +5,22 @@
  * - A1: capacitive soil moisture sensor (analogico)
  * - A2: bioelectrical sensor (analogico)
  * 
- * Output: serial data in CSV format "umidita_raw,bio_raw"
+ * Output: serial data in CSV format "umidita_raw,bio_raw" (9600 baud, 20 Hz)
+ *         or, with USE_BINARY_PROTOCOL 1, 6-byte binary frames (115200 baud, 200 Hz):
+ *           0xA5 | seq | umidita (10 bit) + bio (10 bit) packed little endian in 3 bytes | checksum
+ *         checksum = (seq + the 3 data bytes) & 0xFF. The Python controller
+ *         detects the format by itself.
  */
 
+#define USE_BINARY_PROTOCOL 0
+
+#if USE_BINARY_PROTOCOL
+const long BAUD = 115200;
+const unsigned long SAMPLE_PERIOD_US = 5000;   // 200 Hz
+#else
+const long BAUD = 9600;
+#endif
+
 const uint8_t PIN_UMIDITA = A1;
 const uint8_t PIN_BIO     = A2;
 
@@ -15,17 +28,58 @@ const uint8_t PIN_BIO     = A2;
 const uint8_t LED_PIN = LED_BUILTIN;
 
 void setup() {
-  Serial.begin(9600);
+  Serial.begin(BAUD);
   pinMode(LED_PIN, OUTPUT);
   
   // Initial message (wait 2 sec for Serial Monitor to open)
   delay(2000);
   Serial.println("# LIVE PLANTING - Arduino Ready");
   Serial.println("# Sensori: A1=Umidita, A2=Bio");
+#if USE_BINARY_PROTOCOL
+  Serial.println("# Format: binary frames (0xA5, seq, 2x10 bit, checksum)");
+#else
   Serial.println("# Format: umidita_raw,bio_raw");
+#endif
   delay(500);
 }
 
+#if USE_BINARY_PROTOCOL
+uint8_t seq = 0;
+
+void sendFrame(int umidita, int bio_raw) {
+  uint32_t packed = ((uint32_t)(umidita & 0x3FF)) | ((uint32_t)(bio_raw & 0x3FF) << 10);
+  uint8_t frame[6];
+  frame[0] = 0xA5;
+  frame[1] = seq++;
+  frame[2] = packed & 0xFF;
+  frame[3] = (packed >> 8) & 0xFF;
+  frame[4] = (packed >> 16) & 0x0F;
+  frame[5] = (uint8_t)(frame[1] + frame[2] + frame[3] + frame[4]);
+  Serial.write(frame, 6);
+}
+
+void loop() {
+  static unsigned long next_us = micros();
+
+  // 4 back-to-back readings per channel (~0.9 ms), no delays
+  int umidita = 0;
+  int bio_raw = 0;
+  for (int i = 0; i < 4; i++) {
+    umidita += analogRead(PIN_UMIDITA);
+    bio_raw += analogRead(PIN_BIO);
+  }
+  sendFrame(umidita / 4, bio_raw / 4);
+
+  // Slow blink = running (no blocking delays in this mode)
+  digitalWrite(LED_PIN, (millis() % 2000 < 100) ? HIGH : LOW);
+
+  next_us += SAMPLE_PERIOD_US;
+  while ((long)(micros() - next_us) < 0) {
+  }
+}
+
+#else
+
 void loop() {
   // Read humidity (average of 5 readings to reduce noise)
   long umidita_sum = 0;
@@ -69,3 +123,4 @@ void loop() {
   // Sampling frequency: 20 Hz (50ms total between readings and delay)
   delay(20);
 }
+#endif
@@ -6,43 +6,59 @@ Architecture:
 - Audio: sounddevice (perfect quality, outputs through PC speakers)
 - Commands: HTTP REST API (web buttons → boolean flags)
 - Visualization: WebSocket (only decimated data for canvas)
+- Offline: render_offline() drives the same engine without an audio device
 
 HTTP Endpoints:
 - POST /start         → Start audio + send test notes
 - POST /stop          → Stop audio
 - POST /start_rec     → Start loop recording
 - POST /stop_rec      → Stop loop recording
-- POST /clear_loops   → Clear all loops
+- POST /clear_loops   → Stop all loops (kept in the library)
+- GET  /loops         → Stored loops; POST /loops stores one
+- GET  /loops/{id}    → Events of a loop; DELETE deletes it
+- POST /loops/{id}/load → Play a stored loop
 - POST /clear_ambient → Clear ambient voices
+- GET  /viz_stats     → Bandwidth per WebSocket client
+- GET  /serial_stats  → Serial ingestion metrics
+- GET  /metrics       → Prometheus metrics (sensor → speaker latency, callback, voices, underruns)
+- POST /start_session → Archive the master mix to WAV/FLAC files (POST /stop_session, GET /session_stats)
+- GET  /plants        → Plants (multi-plant mode); /plants/{name}/start_rec, stop_rec,
+                        clear_loops, clear_ambient, loops, serial_stats act on one plant
 
 WebSocket (ws://localhost:8765):
-- Sends: Decimated Float32Array (256 samples) for visualization
-- Receives: Nothing (commands go via HTTP)
+- Sends: binary viz frames (24-byte header + samples, see VIZ PROTOCOL)
+- Receives: JSON {"type": "hello", "points", "format", "channels"} to
+  choose resolution / sample format (answered with {"type": "welcome"})
+- ws://localhost:8765/plants/{name}: same, plus {"type": "plant"} status per frame
 """
 
-import time, math, threading, asyncio, queue
+import os, time, math, heapq, itertools, threading, asyncio, queue, wave, struct
+import multiprocessing as mp
+from multiprocessing import shared_memory
 import numpy as np
-import sounddevice as sd
 import serial
 from collections import deque
 from aiohttp import web
 import websockets
 import json
 
+try:
+    import sounddevice as sd
+except (ImportError, OSError):  # no PortAudio: offline rendering still works
+    sd = None
+
+try:
+    import soundfile as sf
+except (ImportError, OSError):  # no libsndfile: sessions are recorded as WAV only
+    sf = None
+
 # -----------------------------
 # GLOBAL VARIABLES
 # -----------------------------
-MAX_LOOPS = 10
-
-# Recording state
-is_recording = False
-rec_start_t = 0.0
-rec_events = []
-recording_lock = threading.Lock()
-
-# Loops storage
-loops = []
-loops_lock = threading.Lock()
+MAX_LOOPS = 10  # loops playing at once (the library keeps any number)
+LOOP_LIBRARY_PATH = "loops.lpl"
+SESSIONS_PATH = "sessions"
+MAX_VOICES_PER_PLANT = 8  # per bus, multi-plant mode (at least 24 per bus overall)
 
 # Audio playing state (controlled by HTTP)
 is_audio_playing = False
@@ -91,86 +107,267 @@ def humidity_to_note(h: float, base_root: int, h_min=200.0, h_max=400.0):
     nearest = min(MAJOR_OFFSETS, key=lambda o: abs(o - semis))
     return base_root + nearest, nearest
 
+# Scale degrees in cents (custom scales: any list of cents within the octave)
+SCALES = {
+    "major": (0, 200, 400, 500, 700, 900, 1100),
+    "minor": (0, 200, 300, 500, 700, 800, 1000),
+    "pentatonic": (0, 200, 400, 700, 900),
+    "chromatic": tuple(range(0, 1200, 100)),
+}
+
+def scale_offsets(scale, span):
+    """Sorted semitone offsets of a scale (name or cents) over [0, span], octave roots included."""
+    if isinstance(scale, str) and scale not in SCALES:
+        raise ValueError(f"Unknown scale {scale!r} (known: {', '.join(SCALES)})")
+    cents = SCALES[scale] if isinstance(scale, str) else tuple(float(c) for c in scale)
+    if not cents or any(c < 0 or c >= 1200 for c in cents):
+        raise ValueError(f"Scale degrees must be cents in [0, 1200): {scale!r}")
+    offs = sorted({octv * 12 + c / 100.0 for octv in range(int(span // 12) + 1) for c in cents})
+    offs = [o for o in offs if o <= span]
+    return [int(o) if float(o).is_integer() else o for o in offs]
+
+
+class Tuning:
+    """
+    Sensor value → note lookup for one scale and range, built once:
+    a reading in [value_min, value_max] spans `span` semitones above
+    `base_root` (rounded to the semitone, then snapped to the nearest scale
+    degree, the lower one on ties: the same rule as humidity_to_note /
+    quantize_to_major). Tables cover every ADC value (0..ADC_MAX), so a
+    reading, or a whole array of them, costs one index. configure() only
+    rebuilds when a parameter actually changes; the tables are swapped in
+    one assignment, readers never see half a table.
+    """
+    ADC_MAX = 1023
+
+    def __init__(self, scale="major", base_root=24, span=60, value_min=0, value_max=ADC_MAX):
+        self.params = {}
+        self.rebuilds = 0
+        self.configure(scale=scale, base_root=base_root, span=span, value_min=value_min, value_max=value_max)
+
+    def configure(self, **params):
+        """Changes scale / base_root / span / value_min / value_max; True if the tables were rebuilt."""
+        new = dict(self.params, **params)
+        if isinstance(new["scale"], list):
+            new["scale"] = tuple(new["scale"])
+        if new == self.params:
+            return False
+        if new["value_max"] <= new["value_min"]:
+            raise ValueError("value_max must be > value_min")
+        offs = np.asarray(scale_offsets(new["scale"], new["span"]), dtype=np.float64)
+
+        # semitone position of every integer position 0..span → nearest degree
+        pos = np.arange(int(new["span"]) + 1, dtype=np.float64)
+        hi = np.minimum(np.searchsorted(offs, pos), len(offs) - 1)
+        lo = np.maximum(hi - 1, 0)
+        snap = np.where(pos - offs[lo] <= np.abs(offs[hi] - pos), offs[lo], offs[hi])
+
+        # every ADC value → position (same arithmetic as the scalar mappings)
+        adc = np.arange(self.ADC_MAX + 1, dtype=np.float64)
+        x = np.clip((adc - new["value_min"]) / (new["value_max"] - new["value_min"]), 0.0, 1.0)
+        semis = snap[np.rint(x * new["span"]).astype(np.int64)]
+        midi = new["base_root"] + semis
+        freq = 440.0 * np.exp2((midi - 69.0) / 12.0)
+
+        # int notes for 12-TET scales (Python lists for the per-reading path)
+        cast = int if np.all(snap == np.rint(snap)) else float
+        if cast is int:
+            semis, midi = semis.astype(np.int64), midi.astype(np.int64)
+        snap_list = [cast(v) for v in snap.tolist()]
+        semis_list = [cast(v) for v in semis.tolist()]
+        midi_list = [new["base_root"] + v for v in semis_list]
+        # one assignment: a reader sees either the old or the new tables
+        self._tables = (snap_list, semis_list, midi_list, semis, midi, freq)
+        self.params = new
+        self.rebuilds += 1
+        return True
+
+    def lookup(self, adc):
+        """(midi, semis) of one ADC reading (table index; other values go through note())."""
+        _, semis, midi, *_ = self._tables
+        if type(adc) is int and 0 <= adc <= self.ADC_MAX:
+            return midi[adc], semis[adc]
+        return self.note(adc)
+
+    def note(self, value):
+        """(midi, semis) of any value, e.g. an average (not rounded to the ADC grid)."""
+        snap = self._tables[0]
+        p = self.params
+        x = min(1.0, max(0.0, (value - p["value_min"]) / (p["value_max"] - p["value_min"])))
+        semis = snap[int(round(x * p["span"]))]
+        return p["base_root"] + semis, semis
+
+    def map(self, readings):
+        """Vectorized lookup of an array of ADC readings: (midi, freq, semis) arrays."""
+        *_, semis, midi, freq = self._tables
+        idx = np.asarray(readings).astype(np.intp)
+        np.maximum(idx, 0, out=idx)  # (np.clip's scalar handling costs more than the lookup)
+        np.minimum(idx, self.ADC_MAX, out=idx)
+        return midi[idx], freq[idx], semis[idx]
+
+    def describe(self):
+        p = dict(self.params)
+        if isinstance(p["scale"], tuple):
+            p["scale"] = list(p["scale"])
+        return dict(p, rebuilds=self.rebuilds)
+
 # -----------------------------
-# PULSE tools
+# SCRATCH BUFFERS
 # -----------------------------
-def hann_env(t, dur, fade_in_ratio=0.15, fade_out_ratio=0.25):
-    """Super smooth envelope with separate fade-in/out to eliminate clicks."""
-    env = np.zeros_like(t, dtype=np.float32)
-    m = (t >= 0.0) & (t <= dur)
+class ScratchPool:
+    """
+    Named work buffers reused from block to block by the render path.
+    A buffer is only allocated the first time it is requested or when a
+    bigger one is needed; `allocations` counts those events, so once the
+    engine is warm for a blocksize it must stay flat.
+    """
+    def __init__(self):
+        self.buffers = {}
+        self.allocations = 0
+
+    def get(self, name, shape, dtype=np.float32):
+        size = 1
+        for d in shape:
+            size *= d
+        buf = self.buffers.get(name)
+        if buf is None or buf.shape[0] < size or buf.dtype != dtype:
+            buf = np.empty(max(size, 1), dtype=dtype)
+            self.buffers[name] = buf
+            self.allocations += 1
+        return buf[:size].reshape(shape)
 
-    fade_in_dur = dur * fade_in_ratio
-    m_in = (t >= 0.0) & (t <= fade_in_dur)
-    if fade_in_dur > 0:
-        x_in = (t[m_in] / fade_in_dur).astype(np.float32)
-        env[m_in] = (x_in * x_in).astype(np.float32)
 
-    fade_out_start = dur * (1.0 - fade_out_ratio)
-    m_sustain = (t > fade_in_dur) & (t < fade_out_start)
-    env[m_sustain] = 1.0
+# -----------------------------
+# PULSE tools
+# -----------------------------
+def hann_env(t, dur, fade_in_ratio=0.15, fade_out_ratio=0.25, out=None, tmp=None):
+    """
+    Super smooth envelope with separate fade-in/out to eliminate clicks.
+    `dur` can be a scalar or an array broadcasting against `t` (one row per voice).
+    `out`/`tmp` are optional float32 buffers shaped like the result.
+    """
+    t = np.asarray(t, dtype=np.float32)
+    shape = np.broadcast_shapes(t.shape, np.shape(dur))
+    env = np.empty(shape, dtype=np.float32) if out is None else out
+    tmp = np.empty(shape, dtype=np.float32) if tmp is None else tmp
+
+    # Work in normalized time u = t / dur: both fades then only need scalars.
+    # Clipping u also zeroes the envelope outside [0, dur].
+    np.divide(t, dur, out=env)
 
-    m_out = (t >= fade_out_start) & (t <= dur)
     if fade_out_ratio > 0:
-        x_out = ((t[m_out] - fade_out_start) / (dur - fade_out_start)).astype(np.float32)
-        env[m_out] = (0.5 + 0.5 * np.cos(np.pi * x_out)).astype(np.float32)
+        np.subtract(env, 1.0 - fade_out_ratio, out=tmp)
+        tmp *= 1.0 / fade_out_ratio
+        np.clip(tmp, 0.0, 1.0, out=tmp)
+        tmp *= np.float32(np.pi)
+        np.cos(tmp, out=tmp)
+        tmp *= 0.5
+        tmp += 0.5
+    else:
+        np.greater(env, 1.0, out=tmp, casting="unsafe")
+        np.subtract(1.0, tmp, out=tmp)
 
+    if fade_in_ratio > 0:
+        env *= 1.0 / fade_in_ratio
+        np.clip(env, 0.0, 1.0, out=env)
+        env *= env
+    else:
+        np.greater_equal(env, 0.0, out=env, casting="unsafe")
+
+    np.minimum(env, tmp, out=env)
     return env
 
-def softclip(x, drive=1.08):
+def softclip(x, drive=1.08, out=None):
     """Smoothness: reduces harshness without distorting."""
-    return np.tanh(drive * x).astype(np.float32)
+    out = np.multiply(x, drive, out=out, dtype=np.float32)
+    return np.tanh(out, out=out)
 
 # -----------------------------
 # REVERB (Schroeder: comb + allpass)
 # -----------------------------
 class Comb:
+    """
+    Feedback comb filter processed a whole block at a time.
+    The block is split into slices no longer than the delay line (and never
+    crossing its wrap point), so every slice only reads samples written by
+    previous slices: each slice becomes plain vector math.
+    """
     def __init__(self, delay_samp: int, feedback: float):
         self.buf = np.zeros(delay_samp, dtype=np.float32)
+        self.tmp = np.empty(delay_samp, dtype=np.float32)
         self.i = 0
         self.fb = float(feedback)
 
-    def process(self, x: np.ndarray) -> np.ndarray:
-        y = np.empty_like(x, dtype=np.float32)
+    def process(self, x: np.ndarray, out=None) -> np.ndarray:
+        """`out` must not overlap `x`."""
+        y = np.empty_like(x, dtype=np.float32) if out is None else out
         buf = self.buf
         i = self.i
         fb = self.fb
         n = buf.shape[0]
-        for k in range(x.shape[0]):
-            out = buf[i]
-            buf[i] = float(x[k]) + fb * out
-            y[k] = out
-            i += 1
+        pos = 0
+        total = x.shape[0]
+        while pos < total:
+            step = min(n - i, total - pos)
+            seg = y[pos:pos + step]
+            seg[:] = buf[i:i + step]
+            tmp = np.multiply(seg, fb, out=self.tmp[:step])
+            np.add(x[pos:pos + step], tmp, out=buf[i:i + step])
+            pos += step
+            i += step
             if i >= n:
                 i = 0
         self.i = i
         return y
 
 class Allpass:
+    """Schroeder allpass, same slice-by-slice scheme as Comb (`out` may be `x`)."""
     def __init__(self, delay_samp: int, g: float):
         self.buf = np.zeros(delay_samp, dtype=np.float32)
+        self.w64 = np.empty(delay_samp, dtype=np.float64)
+        self.w32 = np.empty(delay_samp, dtype=np.float32)
         self.i = 0
         self.g = float(g)
 
-    def process(self, x: np.ndarray) -> np.ndarray:
-        y = np.empty_like(x, dtype=np.float32)
+    def process(self, x: np.ndarray, out=None) -> np.ndarray:
+        y = np.empty_like(x, dtype=np.float32) if out is None else out
         buf = self.buf
         i = self.i
         g = self.g
         n = buf.shape[0]
-        for k in range(x.shape[0]):
-            b = buf[i]
-            inp = float(x[k])
-            out = -g * inp + b
-            buf[i] = inp + g * out
-            y[k] = out
-            i += 1
+        pos = 0
+        total = x.shape[0]
+        while pos < total:
+            step = min(n - i, total - pos)
+            inp = x[pos:pos + step]
+            w64 = self.w64[:step]
+            w32 = self.w32[:step]
+            # -g * inp is evaluated in float64 (like the old per-sample code) before the float32 add
+            w64[:] = inp
+            w64 *= -g
+            w32[:] = w64
+            w32 += buf[i:i + step]
+            # buf = inp + g * out, then publish out (safe when y is x)
+            bslot = buf[i:i + step]
+            np.multiply(w32, g, out=bslot)
+            bslot += inp
+            y[pos:pos + step] = w32
+            pos += step
+            i += step
             if i >= n:
                 i = 0
         self.i = i
         return y
 
 class SchroederReverb:
-    def __init__(self, sr: int):
+    """
+    Stereo Schroeder reverb. process() returns arrays owned by the reverb
+    (reused on the next call), so the render path allocates nothing.
+    """
+    # Chunk length of the block IIR used by the pre-lowpass
+    LP_CHUNK = 64
+
+    def __init__(self, sr: int, pool=None):
         def ms(x):
             return max(1, int(sr * (x / 1000.0)))
 
@@ -185,38 +382,647 @@ class SchroederReverb:
         self.zL = 0.0
         self.zR = 0.0
 
-    def _lp(self, x: np.ndarray, z: float):
+        self.pool = pool if pool is not None else ScratchPool()
+
+        self._lp_coef = None
+        self._lp_T = None
+        self._lp_pow = None
+
+    def _lp_tables(self):
+        """(Re)build the block IIR matrices when pre_lp changes."""
         a = float(self.pre_lp)
-        y = np.empty_like(x, dtype=np.float32)
+        if self._lp_coef != a:
+            L = self.LP_CHUNK
+            k = np.arange(L)
+            lag = k[:, None] - k[None, :]
+            # y[j] = b * sum_{k<=j} a^(j-k) x[k] + a^(j+1) z
+            T = np.where(lag >= 0, (1.0 - a) * a ** np.maximum(lag, 0), 0.0)
+            self._lp_T = np.ascontiguousarray(T.T)
+            self._lp_pow = a ** (k + 1.0)
+            self._lp_coef = a
+        return self._lp_T, self._lp_pow
+
+    def _lp(self, x: np.ndarray, z: float, out=None):
+        """One-pole lowpass y = a*y + (1-a)*x, computed chunk-wise in float64."""
+        T, p = self._lp_tables()
+        L = self.LP_CHUNK
+        n = x.shape[0]
+        chunks = -(-n // L)
+        X = self.pool.get("rev.lp_x", (chunks, L), np.float64)
+        Y = self.pool.get("rev.lp_y", (chunks, L), np.float64)
+        carry = self.pool.get("rev.lp_carry", (L,), np.float64)
+        flat = X.reshape(-1)
+        flat[:n] = x
+        flat[n:] = 0.0
+        np.matmul(X, T, out=Y)
         y0 = float(z)
-        b = 1.0 - a
-        for i in range(x.shape[0]):
-            y0 = a * y0 + b * float(x[i])
-            y[i] = y0
-        return y, y0
+        for c in range(chunks):
+            np.multiply(p, y0, out=carry)
+            Y[c] += carry
+            y0 = float(Y[c, -1])
+        Yf = Y.reshape(-1)[:n]
+        y = np.empty(n, dtype=np.float32) if out is None else out
+        y[:] = Yf
+        return y, float(Yf[-1]) if n else float(z)
 
     def process(self, xL: np.ndarray, xR: np.ndarray):
-        inL, self.zL = self._lp(xL, self.zL)
-        inR, self.zR = self._lp(xR, self.zR)
-
-        yL = np.zeros_like(inL, dtype=np.float32)
-        yR = np.zeros_like(inR, dtype=np.float32)
+        n = xL.shape[0]
+        pool = self.pool
+        inL, self.zL = self._lp(xL, self.zL, out=pool.get("rev.inL", (n,)))
+        inR, self.zR = self._lp(xR, self.zR, out=pool.get("rev.inR", (n,)))
+
+        tmp = pool.get("rev.tmp", (n,))
+        yL = pool.get("rev.yL", (n,))
+        yR = pool.get("rev.yR", (n,))
+        yL.fill(0.0)
+        yR.fill(0.0)
         for c in self.combL:
-            yL += c.process(inL)
+            yL += c.process(inL, out=tmp)
         for c in self.combR:
-            yR += c.process(inR)
+            yR += c.process(inR, out=tmp)
 
         yL *= (1.0 / len(self.combL))
         yR *= (1.0 / len(self.combR))
 
         for ap in self.apL:
-            yL = ap.process(yL)
+            ap.process(yL, out=yL)
         for ap in self.apR:
-            yR = ap.process(yR)
+            ap.process(yR, out=yR)
+
+        outL = pool.get("rev.outL", (n,))
+        outR = pool.get("rev.outR", (n,))
+        np.multiply(xL, self.dry, out=outL)
+        yL *= self.wet
+        outL += yL
+        np.multiply(xR, self.dry, out=outR)
+        yR *= self.wet
+        outR += yR
+        return outL, outR
+
+
+# -----------------------------
+# WAVETABLE OSCILLATOR
+# -----------------------------
+class Wavetable:
+    """
+    One period of an additive recipe (h1*sin(p) + h2*sin(2p) + ...) sampled
+    into a float32 table, read at the nearest entry to an accumulated phase:
+    one multiply, one integer index and one gather replace one np.sin per
+    harmonic. The table is large enough (64K entries) that the rounding
+    error stays under 1e-4 without interpolating.
+    Called like a ufunc: table(phase, out=buf).
+    """
+    def __init__(self, harmonics, size=1 << 16, pool=None):
+        if size & (size - 1):
+            raise ValueError("Wavetable size must be a power of two")
+        self.harmonics = tuple(float(h) for h in harmonics)
+        self.size = int(size)
+        p = np.arange(self.size, dtype=np.float64) * (2.0 * np.pi / self.size)
+        self.table = sum(h * np.sin((k + 1) * p) for k, h in enumerate(self.harmonics)).astype(np.float32)
+        self.scale = np.float32(self.size / (2.0 * np.pi))
+        self.pool = pool if pool is not None else ScratchPool()
+
+    def __call__(self, phase, out=None):
+        shape = phase.shape
+        pos = self.pool.get("wt.pos", shape)
+        i = self.pool.get("wt.idx", shape, np.intp)
+        x = np.empty(shape, dtype=np.float32) if out is None else out
+        # The render functions wrap the phase once per block, so the index
+        # stays small and masking it to the table does the modulo 2*pi
+        np.multiply(phase, self.scale, out=pos)
+        pos += np.float32(0.5)
+        np.copyto(i, pos, casting="unsafe")
+        i &= self.size - 1
+        np.take(self.table, i, out=x, mode="clip")  # "raise" would buffer out
+        return x
+
+
+# -----------------------------
+# VOICE BANK (structure of arrays)
+# -----------------------------
+class VoiceBank:
+    """
+    Fixed-capacity voice storage: one float32 array per parameter.
+    Active voices always occupy slots [0, n), so a whole bank renders as one
+    2-D (voices x frames) computation on contiguous views.
+    When full, a new voice reuses the slot of the oldest one.
+    """
+    def __init__(self, capacity: int, fields):
+        self.capacity = int(capacity)
+        self.fields = tuple(fields)
+        self.n = 0
+        self.cols = {f: np.zeros(self.capacity, dtype=np.float32) for f in self.fields}
+        # Insertion order, used to find the oldest voice
+        self.serial = np.zeros(self.capacity, dtype=np.int64)
+        self._next_serial = 0
+        # Render-side flags (e.g. "still sounding"), one per slot
+        self.flags = np.zeros(self.capacity, dtype=bool)
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, field):
+        """Active part of a parameter column (view)."""
+        return self.cols[field][:self.n]
+
+    def add(self, **values) -> int:
+        if self.capacity <= 0:
+            return -1
+        if self.n < self.capacity:
+            slot = self.n
+            self.n += 1
+        else:
+            slot = int(np.argmin(self.serial[:self.n]))
+        for f in self.fields:
+            self.cols[f][slot] = values.get(f, 0.0)
+        self.serial[slot] = self._next_serial
+        self._next_serial += 1
+        return slot
+
+    def keep(self, mask: np.ndarray):
+        """
+        Drops the active voices where mask is False. Freed slots are filled
+        by moving the last active voice in (order is not preserved; `serial`
+        still tells which voice is oldest). Allocation-free.
+        """
+        n = self.n
+        for k in range(n - 1, -1, -1):
+            if mask[k]:
+                continue
+            last = n - 1
+            if k != last:
+                for col in self.cols.values():
+                    col[k] = col[last]
+                self.serial[k] = self.serial[last]
+            n = last
+        self.n = n
+
+    def clear(self):
+        self.n = 0
+
+
+# Additive recipes (h1, h2, h3): fundamental + 2 overtones
+AMBIENT_HARMONICS = (1.0, 0.20, 0.06)
+PULSE_HARMONICS = (1.0, 0.16, 0.045)
+
+# Voice parameters, then per-voice constants derived once in add_*()
+# so the render path never builds per-voice temporaries.
+AMBIENT_FIELDS = (
+    "freq_base", "phase", "volume", "pan", "t", "attack",
+    "h1", "h2", "h3",
+    "vib_rate_hz", "vib_depth_hz", "vib_depth_min", "vib_depth_max",
+    "trem_hz", "trem_depth",
+    "group",  # plant the voice belongs to (multi-plant mode)
+    "fade",   # polyphony governor: seconds of fade-out left (0 = not stolen, < 0 = done)
+    # derived
+    "w_step", "w_vib", "w_depth", "w_trem", "inv_attack",
+    "oct_mid", "oct_half", "amp_mid", "amp_half", "gain_l", "gain_r",
+)
+
+PULSE_FIELDS = (
+    "freq_base", "phase", "t", "duration",
+    "h1", "h2", "h3",
+    "vib_rate_hz", "vib_cents", "trem_hz", "trem_depth",
+    "volume", "pan", "group", "fade",
+    # derived
+    "w_step", "w_vib", "w_trem", "vib_oct", "amp_mid", "amp_half", "t_half",
+    "gain_l", "gain_r",
+)
+
+
+# -----------------------------
+# COMMAND RING (control threads → audio thread)
+# -----------------------------
+class CommandRing:
+    """
+    Single-producer / single-consumer ring of commands. The producer only
+    moves `head`, the consumer only moves `tail`; list slot and int stores
+    are atomic under the GIL, so neither side ever takes a lock or waits.
+    When the ring is full the command is dropped and counted.
+    """
+    def __init__(self, capacity=1024):
+        self.slots = [None] * capacity
+        self.capacity = capacity
+        self.head = 0
+        self.tail = 0
+        self.pushed = 0
+        self.dropped = 0
+
+    def push(self, cmd) -> bool:
+        h = self.head
+        nxt = h + 1 if h + 1 < self.capacity else 0
+        if nxt == self.tail:
+            self.dropped += 1
+            return False
+        self.slots[h] = cmd
+        self.head = nxt
+        self.pushed += 1
+        return True
+
+    def drain(self, handler) -> int:
+        t = self.tail
+        h = self.head
+        n = 0
+        while t != h:
+            cmd = self.slots[t]
+            self.slots[t] = None
+            handler(cmd)
+            t = t + 1 if t + 1 < self.capacity else 0
+            n += 1
+        self.tail = t
+        return n
+
+    def __len__(self):
+        return (self.head - self.tail) % self.capacity
+
+
+# -----------------------------
+# VIZ RING (audio thread → asyncio)
+# -----------------------------
+class VizRing:
+    """
+    Single-producer ring of visualization frames in one preallocated
+    (slots x (channels + buses) x window) float32 array: the mix channels,
+    then the unmixed bus channels the broadcaster measures the bus levels
+    on. The audio thread writes its blocks
+    straight into the slot being filled and publishes it by moving `head`,
+    then wakes the asyncio reader with loop.call_soon_threadsafe (once per
+    frame). The writer never waits: a reader that falls behind skips to
+    the newest frames and the skipped ones are counted in `dropped`.
+    """
+    def __init__(self, slots=8, window=2048, channels=2, buses=0):
+        self.slots = slots
+        self.window = window
+        self.channels = channels
+        self.frames = np.zeros((slots, channels + buses, window), dtype=np.float32)
+        self._views = [self.frames[i] for i in range(slots)]
+        self.timestamps = np.zeros(slots, dtype=np.int64)
+        self.lengths = np.zeros(slots, dtype=np.int64)
+        self.head = 0  # frames published
+        self.tail = 0  # frames taken by the reader
+        self.dropped = 0
+        self._loop = None
+        self._event = None
+
+    def slot(self):
+        """((channels + buses) x window) array of the frame being filled (writer side)."""
+        return self._views[self.head % self.slots]
+
+    def publish(self, timestamp, length):
+        i = self.head % self.slots
+        self.timestamps[i] = timestamp
+        self.lengths[i] = length
+        self.head += 1
+        loop = self._loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._event.set)
+            except RuntimeError:  # event loop closed
+                self._loop = None
+
+    def attach(self, loop):
+        """Registers the asyncio loop of the reader (from inside that loop)."""
+        self._event = asyncio.Event()
+        self.tail = self.head
+        self._loop = loop
+
+    async def next_frame(self):
+        """
+        Waits for the next frame: (timestamp, (channels x length) view of the
+        mix, (buses x length) view of the bus channels). The views stay valid
+        until the reader awaits again: use them right away.
+        """
+        while self.tail >= self.head:
+            self._event.clear()
+            if self.tail >= self.head:
+                await self._event.wait()
+        # one slot stays between reader and writer, the one being filled
+        lag = self.head - self.tail
+        if lag > self.slots - 2:
+            self.dropped += lag - (self.slots - 2)
+            self.tail = self.head - (self.slots - 2)
+        i = self.tail % self.slots
+        self.tail += 1
+        view = self._views[i][:, :int(self.lengths[i])]
+        return int(self.timestamps[i]), view[:self.channels], view[self.channels:]
+
+    def __len__(self):
+        return self.head - self.tail
+
+
+# -----------------------------
+# BUS WORKERS (optional multiprocess rendering)
+# -----------------------------
+# Which worker receives each command kind
+BUS_OF_COMMAND = {
+    "ambient": ("ambient",), "clear_ambient": ("ambient",),
+    "pulse": ("pulse",), "clear_pulse": ("pulse",),
+    "loop_add": ("pulse",), "loop_remove": ("pulse",),
+    "set": ("ambient", "pulse"),
+}
+
+def _bus_worker_main(bus, synth_kwargs, shm_name, depth, frames, commands, free, filled, stop):
+    """
+    Worker process: renders one bus (ambient, or pulse + reverb) ahead of the
+    callback into a ring of `depth` shared-memory blocks. `free`/`filled`
+    semaphores count the empty / ready slots.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        ring = np.ndarray((depth, 2, frames), dtype=np.float32, buffer=shm.buf)
+        synth = CombinedSynth(realtime=False, **synth_kwargs)
+        if bus == "ambient":
+            synth.reverb_enabled = False
+        slot = 0
+        while not stop.is_set():
+            # commands keep applying while the ring is full (e.g. audio paused)
+            while True:
+                try:
+                    synth._apply_command(commands.get_nowait())
+                except queue.Empty:
+                    break
+            if not free.acquire(timeout=0.05):
+                continue
+            ambL, ambR, pulL, pulR = synth.render_buses(frames)
+            if bus == "ambient":
+                ring[slot, 0], ring[slot, 1] = ambL, ambR
+            else:
+                ring[slot, 0], ring[slot, 1] = pulL, pulR
+            filled.release()
+            slot = slot + 1 if slot + 1 < depth else 0
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shm.close()
+
+
+class BusWorker:
+    """Main-process handle of one bus worker: command queue + block ring reader."""
+    def __init__(self, bus, synth_kwargs, frames, depth=2):
+        ctx = mp.get_context("spawn")
+        self.bus = bus
+        self.frames = frames
+        self.depth = depth
+        self.shm = shared_memory.SharedMemory(create=True, size=depth * 2 * frames * 4)
+        self.ring = np.ndarray((depth, 2, frames), dtype=np.float32, buffer=self.shm.buf)
+        self.ring.fill(0.0)
+        self.commands = ctx.Queue()
+        self.free = ctx.Semaphore(depth)
+        self.filled = ctx.Semaphore(0)
+        self.stop_event = ctx.Event()
+        self.slot = 0
+        self.underruns = 0
+        self.process = ctx.Process(
+            target=_bus_worker_main,
+            args=(bus, synth_kwargs, self.shm.name, depth, frames,
+                  self.commands, self.free, self.filled, self.stop_event),
+            daemon=True,
+        )
+        self.process.start()
+
+    def read(self, outL, outR) -> bool:
+        """Copies the next ready block into outL/outR; never waits (False = underrun)."""
+        if not self.filled.acquire(block=False):
+            self.underruns += 1
+            outL.fill(0.0)
+            outR.fill(0.0)
+            return False
+        np.copyto(outL, self.ring[self.slot, 0])
+        np.copyto(outR, self.ring[self.slot, 1])
+        self.free.release()
+        self.slot = self.slot + 1 if self.slot + 1 < self.depth else 0
+        return True
+
+    def flush(self) -> int:
+        """
+        Drops the blocks rendered ahead (audio thread, on restart after a
+        pause): they predate the pause. The worker renders fresh ones into
+        the freed slots. Returns the number of blocks dropped.
+        """
+        n = 0
+        while self.filled.acquire(block=False):
+            self.free.release()
+            self.slot = self.slot + 1 if self.slot + 1 < self.depth else 0
+            n += 1
+        return n
+
+    def close(self):
+        self.stop_event.set()
+        self.process.join(timeout=2.0)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.ring = None
+        self.shm.close()
+        self.shm.unlink()
+
+
+# -----------------------------
+# METRICS (audio thread → /metrics)
+# -----------------------------
+class RollingStats:
+    """
+    The last `capacity` values of a measurement in a preallocated ring,
+    plus running count and sum. Only the audio thread calls add(); readers
+    compute quantiles on a copy, so the writer never waits.
+    """
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.values = np.zeros(capacity, dtype=np.float64)
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, x):
+        self.values[self.count % self.capacity] = x
+        self.sum += x
+        self.count += 1
+
+    def reset(self):
+        self.count = 0
+        self.sum = 0.0
 
-        outL = self.dry * xL + self.wet * yL
-        outR = self.dry * xR + self.wet * yR
-        return outL.astype(np.float32), outR.astype(np.float32)
+    def quantiles(self, qs=(0.5, 0.95, 0.99)):
+        n = min(self.count, self.capacity)
+        if n == 0:
+            return [float("nan")] * len(qs)
+        return np.quantile(self.values[:n].copy(), qs).tolist()
+
+
+# Sensor → DAC latency is tracked per bus; index stored with each stamp
+LATENCY_BUSES = ("ambient", "pulse")
+# sounddevice CallbackFlags counted by the callback
+AUDIO_STATUS_FLAGS = ("output_underflow", "output_overflow", "priming_output")
+
+
+# -----------------------------
+# SESSION RECORDER (audio thread → disk)
+# -----------------------------
+class SessionRecorder:
+    """
+    Archives the master mix. The audio callback copies each block into a
+    preallocated float32 ring with push() (no lock, no allocation, no I/O);
+    a writer thread polls the ring and writes it in chunks of about one
+    second as 16-bit WAV (or FLAC, with soundfile), starting a new file every
+    `max_seconds` or `max_bytes`. When the disk is too slow the ring fills
+    up and new blocks are dropped and counted: the callback never waits.
+    """
+    FORMATS = ("wav", "flac")
+
+    def __init__(self, directory="sessions", samplerate=48000, fmt="wav", ring_seconds=10.0,
+                 max_seconds=3600.0, max_bytes=1 << 30, chunk_seconds=1.0, poll=0.05):
+        if fmt not in self.FORMATS:
+            raise ValueError(f"Unknown session format '{fmt}' (use one of {', '.join(self.FORMATS)})")
+        self.directory = str(directory)
+        self.sr = int(samplerate)
+        self.format = fmt
+        self.max_seconds = float(max_seconds)
+        self.max_bytes = int(max_bytes)
+        self.chunk = max(1, int(chunk_seconds * self.sr))
+        self.poll = poll
+
+        self.capacity = max(self.chunk, int(ring_seconds * self.sr))
+        self.ring = np.zeros((self.capacity, 2), dtype=np.float32)
+        self.head = 0  # frames pushed by the audio thread (total)
+        self.tail = 0  # frames written out by the writer thread (total)
+        self.active = False
+
+        self.dropped_frames = 0
+        self.dropped_blocks = 0
+        self.frames_written = 0
+        self.files = []
+        self.write_time = RollingStats(capacity=256)  # seconds per chunk
+        self.session = None
+        self.started_at = None
+        self._file = None
+        self._file_frames = 0
+        self._thread = None
+        self._stop = threading.Event()
+
+    def push(self, left, right):
+        """Audio thread: copies one block into the ring, or drops it if full."""
+        if not self.active:
+            return
+        n = left.shape[0]
+        head = self.head
+        if n > self.capacity - (head - self.tail):
+            self.dropped_frames += n
+            self.dropped_blocks += 1
+            return
+        i = head % self.capacity
+        k = min(n, self.capacity - i)
+        ring = self.ring
+        ring[i:i + k, 0] = left[:k]
+        ring[i:i + k, 1] = right[:k]
+        if k < n:
+            ring[:n - k, 0] = left[k:]
+            ring[:n - k, 1] = right[k:]
+        self.head = head + n
+
+    def start(self, fmt=None):
+        """Starts a new session (False if one is running)."""
+        if self.active:
+            return False
+        fmt = fmt or self.format
+        if fmt not in self.FORMATS:
+            raise ValueError(f"Unknown session format '{fmt}' (use one of {', '.join(self.FORMATS)})")
+        if fmt == "flac" and sf is None:
+            raise ValueError("FLAC sessions need the soundfile package")
+        os.makedirs(self.directory, exist_ok=True)
+        self.format = fmt
+        self.session = time.strftime("%Y%m%d-%H%M%S")
+        self.files = []
+        self.frames_written = 0
+        self.dropped_frames = 0
+        self.dropped_blocks = 0
+        self.write_time.reset()
+        self.started_at = time.time()
+        self.tail = self.head
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self.active = True
+        return True
+
+    def stop(self):
+        """Stops the session; blocks until what is in the ring is on disk."""
+        if not self.active:
+            return False
+        self.active = False
+        self._stop.set()
+        self._thread.join(timeout=30.0)
+        self._thread = None
+        return True
+
+    def _run(self):
+        try:
+            while True:
+                stopping = self._stop.wait(self.poll)
+                while self.head - self.tail >= self.chunk:
+                    self._write(self.chunk)
+                if stopping:
+                    if self.head > self.tail:
+                        self._write(self.head - self.tail)
+                    break
+        finally:
+            self._close_file()
+
+    def _write(self, n):
+        """Writes the oldest `n` frames of the ring, then frees them."""
+        t0 = time.perf_counter()
+        i = self.tail % self.capacity
+        k = min(n, self.capacity - i)
+        self._write_frames(self.ring[i:i + k])
+        if k < n:
+            self._write_frames(self.ring[:n - k])
+        self.tail += n
+        self.write_time.add(time.perf_counter() - t0)
+
+    def _write_frames(self, frames):
+        if (self._file is None or self._file_frames >= self.max_seconds * self.sr
+                or self._file_frames * 4 >= self.max_bytes):
+            self._close_file()
+            self._open_file()
+        if self.format == "wav":
+            pcm = (np.clip(frames, -1.0, 1.0) * 32767.0).astype("<i2")
+            self._file.writeframes(pcm.tobytes())
+        else:
+            self._file.write(frames)
+        self._file_frames += frames.shape[0]
+        self.frames_written += frames.shape[0]
+
+    def _open_file(self):
+        path = os.path.join(self.directory, f"session-{self.session}-{len(self.files) + 1:03d}.{self.format}")
+        if self.format == "wav":
+            f = wave.open(path, "wb")
+            f.setnchannels(2)
+            f.setsampwidth(2)
+            f.setframerate(self.sr)
+        else:
+            f = sf.SoundFile(path, "w", samplerate=self.sr, channels=2, format="FLAC", subtype="PCM_16")
+        self._file = f
+        self._file_frames = 0
+        self.files.append(path)
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def stats(self):
+        """Recorder state (strict JSON: write times are None until a chunk is written)."""
+        p50, p99 = self.write_time.quantiles((0.5, 0.99)) if self.write_time.count else (None, None)
+        return {
+            "active": self.active,
+            "format": self.format,
+            "files": list(self.files),
+            "seconds_written": self.frames_written / self.sr,
+            "bytes_written": sum(os.path.getsize(p) for p in self.files if os.path.exists(p)),
+            "ring_fill": (self.head - self.tail) / self.capacity,
+            "ring_seconds": self.capacity / self.sr,
+            "dropped_frames": self.dropped_frames,
+            "dropped_blocks": self.dropped_blocks,
+            "chunk_write_p50_ms": p50 * 1e3 if p50 is not None else None,
+            "chunk_write_p99_ms": p99 * 1e3 if p99 is not None else None,
+        }
 
 
 # -----------------------------
@@ -228,56 +1034,329 @@ class CombinedSynth:
     Audio always outputs through the PC speakers.  
     Sends decimated data for visualization via queue.
     """
-    def __init__(self, samplerate=48000, blocksize=2048, max_ambient_voices=24, max_pulse_voices=24):
+    # Voices rendered per batch: keeps the (voices x frames) temporaries cache-sized
+    VOICE_CHUNK = 32
+    # Pending commands per producer thread before new ones are dropped
+    COMMAND_RING_SIZE = 1024
+    # Sensor stamps waiting for their first rendered block
+    MAX_STAMPS_PER_BLOCK = 64
+    # Low-latency mode: blocksizes the governor moves between, and how many
+    # blocks it measures at a size before deciding again
+    ADAPTIVE_BLOCKSIZES = (128, 256, 512, 1024, 2048, 4096)
+    ADAPT_MIN_BLOCKS = 64
+    # WebSocket frames per second and audio frames shown per frame, whatever the blocksize
+    VIZ_RATE_HZ = 6.0
+    VIZ_WINDOW = 2048
+    # Polyphony governor: fade-out of a stolen voice, and the voices it always leaves
+    STEAL_FADE_SEC = 0.01
+    MIN_VOICES = 4
+
+    def __init__(self, samplerate=48000, blocksize=2048, max_ambient_voices=24, max_pulse_voices=24,
+                 oscillator="sine", realtime=True, workers=False, worker_depth=2,
+                 low_latency=False, min_blocksize=128, max_blocksize=2048, headroom=0.5,
+                 polyphony_governor=False, steal_load=0.8, lift_load=0.5):
         self.sr = samplerate
+
+        # low_latency=True: the blocksize follows the measured render cost
+        # (adapt_blocksize), starting from the largest allowed size
+        self.low_latency = low_latency
+        self.headroom = headroom
+        self.blocksizes = tuple(b for b in self.ADAPTIVE_BLOCKSIZES if min_blocksize <= b <= max_blocksize)
+        if low_latency:
+            if workers:
+                raise ValueError("low_latency needs in-callback rendering (workers render fixed blocks)")
+            if not self.blocksizes:
+                raise ValueError(f"no blocksize of {self.ADAPTIVE_BLOCKSIZES} in [{min_blocksize}, {max_blocksize}]")
+            blocksize = self.blocksizes[-1]
         self.blocksize = blocksize
+        self.blocksize_changes = 0
+
+        # Work buffers of the render path, allocated once per blocksize
+        self.scratch = ScratchPool()
+        # sized by the pulse batch, not the blocksize: allocated full size now
+        self.scratch.get("v.pending", (self.VOICE_CHUNK,), dtype=np.bool_)
+
+        # Oscillator of the partials: "sine" (np.sin per partial) or
+        # "wavetable" (one table lookup per sample); the LFOs always use np.sin
+        if oscillator == "sine":
+            self._amb_table = None
+            self._pul_table = None
+        elif oscillator == "wavetable":
+            self._amb_table = Wavetable(AMBIENT_HARMONICS, pool=self.scratch)
+            self._pul_table = Wavetable(PULSE_HARMONICS, pool=self.scratch)
+        else:
+            raise ValueError(f"Unknown oscillator '{oscillator}' (use 'sine' or 'wavetable')")
+        self.oscillator = oscillator
 
         self.max_ambient = max_ambient_voices
         self.max_pulse = max_pulse_voices
 
-        self.ambient_voices = []
-        self.pulse_voices = []
-        self.lock = threading.Lock()
+        self.ambient_voices = VoiceBank(self.max_ambient, AMBIENT_FIELDS)
+        self.pulse_voices = VoiceBank(self.max_pulse, PULSE_FIELDS)
+
+        # polyphony_governor=True: the render time of each block against its
+        # deadline caps the voices rendered (voice_cap, both banks); the
+        # quietest voices over the cap fade out (govern_polyphony)
+        if polyphony_governor and workers:
+            raise ValueError("polyphony_governor needs in-callback rendering (workers render their bus ahead)")
+        self.polyphony_governor = polyphony_governor
+        self.steal_load = steal_load
+        self.lift_load = lift_load
+        self.voice_cap = self.max_ambient + self.max_pulse
+        self.render_load = 0.0  # smoothed render time / block deadline
+        self.voices_stolen = {"ambient": 0, "pulse": 0}
+        self._faded = False     # a steal fade ended in this block
+        self._fades_rendered = False
+        if polyphony_governor:
+            self._steal_buffers()  # allocated now, not on the audio thread at the first overload
+
+        # Voice adds / clears / parameter changes are posted as commands: each
+        # producer thread gets its own SPSC ring, drained by render() at block start
+        self._rings = []
+        self._producer = threading.local()
+        self.commands_applied = 0
+        self.max_commands_per_block = 0
+
+        # Audio timeline: frames rendered so far, loops scheduled against it.
+        # Every playing loop has one entry (next event frame, gen, key) in a
+        # min-heap; an entry whose gen no longer matches its loop is stale
+        self.frame_clock = 0
+        self._loops = {}
+        self._loop_heap = []
+        self._loop_keys = {}              # caller side: group -> loops already posted
+        self._loop_gen = itertools.count()
+
+        # Latency instrumentation: voices coming from a sensor reading carry
+        # its wall-clock stamp; the callback matches the stamps applied in its
+        # block with the block's DAC time
+        self._stamp_t = np.zeros(self.MAX_STAMPS_PER_BLOCK, dtype=np.float64)
+        self._stamp_bus = np.zeros(self.MAX_STAMPS_PER_BLOCK, dtype=np.int8)
+        self._n_stamps = 0
+        self.latency = {bus: RollingStats() for bus in LATENCY_BUSES}
+        self.callback_time = RollingStats()
+        self.callbacks = 0
+        # Governor input since the last blocksize change: callback time / block
+        # deadline, per (VOICE_CHUNK batches rendered + 1)
+        self.block_load = RollingStats(capacity=1024)
+        self.status_counts = dict.fromkeys(AUDIO_STATUS_FLAGS, 0)
 
         self.master_gain = 0.30
 
         # Reverb for PULSE
-        self.pulse_reverb = SchroederReverb(self.sr)
-
-        # Queue for visualization (non-blocking)
-        self.viz_queue = queue.Queue(maxsize=50)
-
-        # Decimation for viz: send 1 chunk every N
-        self.viz_decimation = 4
+        self.pulse_reverb = SchroederReverb(self.sr, pool=self.scratch)
+        self.reverb_enabled = True
+        self._t_block = np.zeros(0, dtype=np.float32)
+        self._audio_thread = threading.local()
+
+        # Visualization frames for viz_broadcaster (written without allocating)
+        # (with the ambient L/R and pulse L/R buses next to the mix)
+        self.viz_ring = VizRing(window=max(self.VIZ_WINDOW, self.blocksize, *self.blocksizes), buses=4)
+        # (ambL, ambR, pulL, pulR) of the last block rendered, before mixing
+        self.buses = ()
+
+        # Decimation for viz: send 1 frame every N blocks (VIZ_RATE_HZ)
+        self.viz_decimation = self._viz_decimation()
         self.viz_counter = 0
 
-        # sounddevice stream
-        self.stream = sd.OutputStream(
+        # Optional SessionRecorder fed with the master mix of every played block
+        self.recorder = None
+
+        # workers=True: ambient and pulse(+reverb) buses are rendered one block
+        # ahead in two processes; render() then only mixes and limits
+        self.workers = {}
+        self.worker_depth = worker_depth
+        self._workers_stale = False  # set while paused, see render()
+        if workers:
+            kwargs = dict(samplerate=samplerate, blocksize=blocksize, max_ambient_voices=max_ambient_voices,
+                          max_pulse_voices=max_pulse_voices, oscillator=oscillator)
+            for bus in ("ambient", "pulse"):
+                self.workers[bus] = BusWorker(bus, kwargs, blocksize, depth=worker_depth)
+
+        # sounddevice stream (realtime=False: blocks are pulled with render())
+        self.stream = None
+        if realtime:
+            if sd is None:
+                raise RuntimeError("sounddevice/PortAudio not available: use realtime=False for offline rendering")
+            self.stream = self._open_stream()
+
+    def _open_stream(self):
+        return sd.OutputStream(
             samplerate=self.sr,
             channels=2,
             blocksize=self.blocksize,
             dtype="float32",
+            latency="low" if self.low_latency else "high",
             callback=self._callback
         )
 
+    def _viz_decimation(self):
+        return max(1, int(round(self.sr / (self.blocksize * self.VIZ_RATE_HZ))))
+
+    def set_blocksize(self, frames):
+        """
+        Switches to blocks of `frames` (control thread). The output stream is
+        reopened: PortAudio fixes the blocksize when a stream is opened.
+        """
+        if self.workers:
+            raise ValueError(f"worker mode renders fixed blocks of {self.blocksize} frames")
+        active = self.stream is not None and self.stream.active
+        if self.stream is not None:
+            self.stream.stop()  # returns once the last callback is done
+            self.stream.close()
+        self.blocksize = int(frames)
+        self.blocksize_changes += 1
+        self.viz_decimation = self._viz_decimation()
+        self.viz_counter = 0
+        self.block_load.reset()
+        if self.stream is not None:
+            self.stream = self._open_stream()
+            if active:
+                self.stream.start()
+
+    def adapt_blocksize(self):
+        """
+        Low-latency governor, called periodically off the audio thread. Moves
+        one step along `blocksizes` from the p95 block load (callback time /
+        deadline) measured at the current size:
+        - up when the load exceeds `headroom`;
+        - down when even a block that costs as much as now in half the
+          deadline would stay under 80% of the headroom.
+        Render cost is about linear in the VOICE_CHUNK batches per block, so
+        the load is measured per batch and scaled to the voices active now:
+        a voice spike moves up before it xruns.
+        Returns the new blocksize, or None when it stays.
+        """
+        if not self.low_latency or self.block_load.count < self.ADAPT_MIN_BLOCKS:
+            return None
+        load = self.block_load.quantiles((0.95,))[0] * (self._render_batches() + 1)
+
+        i = self.blocksizes.index(self.blocksize) if self.blocksize in self.blocksizes else len(self.blocksizes) - 1
+        if load > self.headroom and i + 1 < len(self.blocksizes):
+            new = self.blocksizes[i + 1]
+        elif i > 0 and load * self.blocksize / self.blocksizes[i - 1] < 0.8 * self.headroom:
+            new = self.blocksizes[i - 1]
+        else:
+            return None
+        self.set_blocksize(new)
+        return new
+
     def start(self):
-        self.stream.start()
+        if self.stream is not None:
+            self.stream.start()
 
     def stop(self):
-        self.stream.stop()
-        self.stream.close()
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.close()
+        for w in self.workers.values():
+            w.close()
+        self.workers = {}
+
+    def _post(self, cmd):
+        if self.workers:
+            for bus in BUS_OF_COMMAND[cmd[0]]:
+                self.workers[bus].commands.put(cmd)
+            if cmd[0] in LATENCY_BUSES and cmd[2] is not None:
+                # the voice renders in a worker, its latency is measured here
+                cmd = ("stamp", cmd[0], cmd[2])
+            elif cmd[0] != "set":  # parameters also apply to the mixing side
+                return True
+        ring = getattr(self._producer, "ring", None)
+        if ring is None:
+            ring = CommandRing(self.COMMAND_RING_SIZE)
+            self._producer.ring = ring
+            self._rings.append(ring)
+        return ring.push(cmd)
+
+    def _apply_command(self, cmd):
+        kind = cmd[0]
+        if kind == "pulse":
+            self._make_room()
+            self.pulse_voices.add(**cmd[1])
+            self._stamp(kind, cmd[2])
+        elif kind == "ambient":
+            # When the bank is full the oldest voice slot is reused
+            self._make_room()
+            self.ambient_voices.add(**cmd[1])
+            self._stamp(kind, cmd[2])
+        elif kind == "stamp":
+            self._stamp(cmd[1], cmd[2])
+        elif kind == "clear_ambient":
+            self._clear_group(self.ambient_voices, cmd[1])
+        elif kind == "clear_pulse":
+            self._clear_group(self.pulse_voices, cmd[1])
+        elif kind == "loop_add":
+            # starts at the next block; the other loops keep their phase
+            st = dict(cmd[2], i=0, t0=self.frame_clock, gen=next(self._loop_gen))
+            self._loops[cmd[1]] = st
+            heapq.heappush(self._loop_heap, (st["t0"] + st["frames"][0], st["gen"], cmd[1]))
+        elif kind == "loop_remove":
+            self._loops.pop(cmd[1], None)
+            if len(self._loop_heap) > 2 * len(self._loops) + 16:
+                self._loop_heap = [e for e in self._loop_heap
+                                   if e[2] in self._loops and self._loops[e[2]]["gen"] == e[1]]
+                heapq.heapify(self._loop_heap)
+        elif kind == "set":
+            setattr(self, cmd[1], cmd[2])
+
+    @staticmethod
+    def _clear_group(bank, group):
+        """Drops every voice of a bank, or only the voices of one plant."""
+        if group is None:
+            bank.clear()
+        else:
+            # the render-side flags are rewritten every block: borrow them
+            # as the mask instead of allocating one on the audio thread
+            keep = bank.flags[:bank.n]
+            np.not_equal(bank["group"], group, out=keep)
+            bank.keep(keep)
+
+    def _stamp(self, bus, t_in):
+        """Remembers the sensor time of a voice that starts sounding in this block."""
+        n = self._n_stamps
+        if t_in is None or n >= self.MAX_STAMPS_PER_BLOCK:
+            return
+        self._stamp_t[n] = t_in
+        self._stamp_bus[n] = 1 if bus == "pulse" else 0
+        self._n_stamps = n + 1
+
+    def _drain_commands(self):
+        n = 0
+        for ring in self._rings:
+            n += ring.drain(self._apply_command)
+        self.commands_applied += n
+        if n > self.max_commands_per_block:
+            self.max_commands_per_block = n
+
+    def command_stats(self):
+        """Counters of the control → audio command path."""
+        return {
+            "producers": len(self._rings),
+            "pushed": sum(r.pushed for r in self._rings),
+            "dropped": sum(r.dropped for r in self._rings),
+            "pending": sum(len(r) for r in self._rings),
+            "applied": self.commands_applied,
+            "max_per_block": self.max_commands_per_block,
+        }
 
-    def clear_ambient(self):
-        with self.lock:
-            self.ambient_voices.clear()
+    def set_param(self, name, value):
+        """Changes a synth attribute (e.g. master_gain) at the next block boundary."""
+        self._post(("set", name, value))
 
-    def clear_pulse(self):
-        with self.lock:
-            self.pulse_voices.clear()
+    def clear_ambient(self, group=None):
+        """Clears the ambient voices (of one plant's `group` only, if given)."""
+        self._post(("clear_ambient", group))
+
+    def clear_pulse(self, group=None):
+        self._post(("clear_pulse", group))
 
     def add_ambient_voice(self, midi_note: int, volume=0.12, pan=0.5,
                           vibrato_hz=5.0, vibrato_cents=10.0,
-                          tremolo_hz=0.20, tremolo_depth=0.10):
+                          tremolo_hz=0.20, tremolo_depth=0.10, stamp=None, group=0):
+        """
+        `stamp`: time.time() of the sensor reading behind the voice (latency metrics).
+        `group`: voice group of the plant playing it (multi-plant mode).
+        """
         v = {
             "freq_base": float(midi_to_freq(midi_note)),
             "phase": 0.0,
@@ -285,20 +1364,33 @@ class CombinedSynth:
             "pan": float(pan),
             "t": 0.0,
             "attack": 1.5,
-            "h1": 1.0, "h2": 0.20, "h3": 0.06,
+            "h1": AMBIENT_HARMONICS[0], "h2": AMBIENT_HARMONICS[1], "h3": AMBIENT_HARMONICS[2],
             "vib_rate_hz": float(vibrato_hz),
             "vib_depth_hz": 0.08,
             "vib_depth_min": 0.5,
             "vib_depth_max": float(vibrato_cents),
             "trem_hz": float(tremolo_hz),
             "trem_depth": float(tremolo_depth),
+            "group": float(group),
         }
-        with self.lock:
-            self.ambient_voices.append(v)
-            if len(self.ambient_voices) > self.max_ambient:
-                self.ambient_voices = self.ambient_voices[-self.max_ambient:]
-
-    def add_ambient_voice_moving(self, midi_note: int, volume=0.12, pan=0.5):
+        v.update({
+            "w_step": 2.0 * math.pi * v["freq_base"] / self.sr,
+            "w_vib": 2.0 * math.pi * v["vib_rate_hz"],
+            "w_depth": 2.0 * math.pi * v["vib_depth_hz"],
+            "w_trem": 2.0 * math.pi * v["trem_hz"],
+            "inv_attack": 1.0 / max(1e-6, v["attack"]),
+            # vibrato depth in octaves: mid +/- half, swept by the depth LFO
+            "oct_mid": (v["vib_depth_min"] + v["vib_depth_max"]) / 2400.0,
+            "oct_half": (v["vib_depth_max"] - v["vib_depth_min"]) / 2400.0,
+            # volume * tremolo gain = amp_mid + amp_half * trem
+            "amp_mid": v["volume"] * (1.0 - 0.5 * v["trem_depth"]),
+            "amp_half": v["volume"] * 0.5 * v["trem_depth"],
+            "gain_l": math.cos(v["pan"] * math.pi * 0.5),
+            "gain_r": math.sin(v["pan"] * math.pi * 0.5),
+        })
+        self._post(("ambient", v, stamp))
+
+    def add_ambient_voice_moving(self, midi_note: int, volume=0.12, pan=0.5, stamp=None, group=0):
         vib_rate = 4.8 + np.random.rand() * 0.8
         vib_max_cents = 8.0 + np.random.rand() * 6.0
         trem_hz = 0.10 + np.random.rand() * 0.20
@@ -310,131 +1402,303 @@ class CombinedSynth:
             vibrato_hz=vib_rate,
             vibrato_cents=vib_max_cents,
             tremolo_hz=trem_hz,
-            tremolo_depth=trem_depth
+            tremolo_depth=trem_depth,
+            stamp=stamp,
+            group=group
         )
 
-    def add_pulse_voice(self, midi_note: int, volume=0.58, duration=0.35, pan=0.5):
+    def add_pulse_voice(self, midi_note: int, volume=0.58, duration=0.35, pan=0.5, stamp=None, group=0):
         """Adds a PULSE note with envelope and reverb - ANTI-CLICK VERSION"""
+        self._post(("pulse", self._pulse_params(midi_note, volume, duration, pan, group), stamp))
+
+    def _pulse_params(self, midi_note, volume=0.58, duration=0.35, pan=0.5, group=0):
+        """VoiceBank values of one pulse note (shared by live notes and loops)."""
         v = {
             "freq_base": float(midi_to_freq(midi_note)),
             "phase": 0.0,
             "t": 0.0,
             "duration": float(duration),
-            "h1": 1.0,
-            "h2": 0.16,
-            "h3": 0.045,
+            "h1": PULSE_HARMONICS[0],
+            "h2": PULSE_HARMONICS[1],
+            "h3": PULSE_HARMONICS[2],
             "vib_rate_hz": 5.2,
             "vib_cents": 7.0,
             "trem_hz": 0.35,
             "trem_depth": 0.12,
-            "volume": float(volume)
+            "volume": float(volume),
+            "pan": float(pan),
+            "group": float(group),
         }
-        with self.lock:
-            if len(self.pulse_voices) >= self.max_pulse:
-                self.pulse_voices.pop(0)
-            self.pulse_voices.append(v)
-
-    def _callback(self, outdata, frames, time_info, status):
-        """Callback sounddevice - generates high quality audio"""
-        if status:
-            print(f"[AUDIO] Status: {status}")
-
-        # If audio is not active, generate silence.
-        with audio_state_lock:
-            if not is_audio_playing:
-                outdata[:, 0] = np.zeros(frames, dtype=np.float32)
-                outdata[:, 1] = np.zeros(frames, dtype=np.float32)
-                return
-
-        ambL = np.zeros(frames, dtype=np.float32)
-        ambR = np.zeros(frames, dtype=np.float32)
-        pulL = np.zeros(frames, dtype=np.float32)
-        pulR = np.zeros(frames, dtype=np.float32)
-
-        dt = 1.0 / self.sr
-        t_block = np.arange(frames, dtype=np.float32) * dt
-
-        with self.lock:
-            # ---- AMBIENCE render (infinite) ----
-            for v in self.ambient_voices:
-                t_abs = v["t"] + t_block
-                env = np.clip(t_abs / max(1e-6, v["attack"]), 0.0, 1.0).astype(np.float32)
-
-                depth_lfo = (0.5 * (1.0 + np.sin(2.0 * np.pi * v["vib_depth_hz"] * t_abs))).astype(np.float32)
-                vib_cents_inst = (v["vib_depth_min"] + (v["vib_depth_max"] - v["vib_depth_min"]) * depth_lfo).astype(np.float32)
-
-                vib = np.sin(2.0 * np.pi * v["vib_rate_hz"] * t_abs).astype(np.float32)
-                freq_mul = (2.0 ** ((vib_cents_inst * vib) / 1200.0)).astype(np.float32)
-                freq_inst = (v["freq_base"] * freq_mul).astype(np.float32)
-
-                phase = v["phase"] + np.cumsum((2.0 * np.pi * freq_inst) * dt).astype(np.float32)
-
-                s = (
-                    v["h1"] * np.sin(phase) +
-                    v["h2"] * np.sin(2.0 * phase) +
-                    v["h3"] * np.sin(3.0 * phase)
-                ).astype(np.float32)
-
-                trem = np.sin(2.0 * np.pi * v["trem_hz"] * t_abs).astype(np.float32)
-                amp = (1.0 - v["trem_depth"]) + v["trem_depth"] * (0.5 * (trem + 1.0))
-                wave = s * env * amp * v["volume"]
-
-                lg = math.cos(v["pan"] * math.pi * 0.5)
-                rg = math.sin(v["pan"] * math.pi * 0.5)
-
-                ambL += wave * lg
-                ambR += wave * rg
-
-                v["phase"] = float(phase[-1] % (2.0 * math.pi))
-                v["t"] = float(t_abs[-1])
-
-            # ---- PULSE render ----
-            new_pulse = []
-            for v in self.pulse_voices:
-                t_abs = v["t"] + t_block
-                dur = float(v["duration"])
-
-                env = hann_env(t_abs, dur)
-
-                vib = np.sin(2.0 * np.pi * v["vib_rate_hz"] * t_abs).astype(np.float32)
-                freq_mul = (2.0 ** ((v["vib_cents"] * vib) / 1200.0)).astype(np.float32)
-                freq_inst = (v["freq_base"] * freq_mul).astype(np.float32)
-
-                phase = v["phase"] + np.cumsum((2.0 * np.pi * freq_inst) * dt).astype(np.float32)
-
-                s = (
-                    v["h1"] * np.sin(phase) +
-                    v["h2"] * np.sin(2.0 * phase) +
-                    v["h3"] * np.sin(3.0 * phase)
-                ).astype(np.float32)
-
-                trem = np.sin(2.0 * np.pi * v["trem_hz"] * t_abs).astype(np.float32)
-                amp = (1.0 - v["trem_depth"]) + v["trem_depth"] * (0.5 * (trem + 1.0))
-
-                wave = s * env * amp * v["volume"]
-
-                # Anti-click: micro-fade on first 5ms
-                micro_fade_samples = min(int(0.005 * self.sr), len(wave))
-                if v["t"] < 0.005 and micro_fade_samples > 0:
-                    for i in range(micro_fade_samples):
-                        t_sample = v["t"] + (i * dt)
-                        if t_sample < 0.005:
-                            fade_mult = (t_sample / 0.005) ** 1.5
-                            if i < len(wave):
-                                wave[i] *= fade_mult
-
-                wave = softclip(wave, drive=1.05)
-
-                pulL += wave
-                pulR += 0.995 * wave
-
-                v["phase"] = float(phase[-1] % (2.0 * math.pi))
-                v["t"] = float(t_abs[-1])
+        v.update({
+            "w_step": 2.0 * math.pi * v["freq_base"] / self.sr,
+            "w_vib": 2.0 * math.pi * v["vib_rate_hz"],
+            "w_trem": 2.0 * math.pi * v["trem_hz"],
+            "vib_oct": v["vib_cents"] / 1200.0,
+            "amp_mid": v["volume"] * (1.0 - 0.5 * v["trem_depth"]),
+            "amp_half": v["volume"] * 0.5 * v["trem_depth"],
+            # still in the attack/plateau: keep alive even if env is ~0 (late starts)
+            "t_half": 0.5 * v["duration"],
+            # balance (centre = full level on both sides, R slightly lower)
+            "gain_l": min(1.0, 2.0 * (1.0 - v["pan"])),
+            "gain_r": 0.995 * min(1.0, 2.0 * v["pan"]),
+        })
+        return v
+
+    def set_loops(self, loops, group=0, pan=0.5):
+        """
+        Sets the looping patterns ({"id", "events": LOOP_EVENT_DTYPE array or
+        [(t_sec, midi)], "dur": sec}) of one plant's voice `group`. Only the
+        difference with the previous call is posted: loops whose id is new
+        start at the next block, removed ones stop, and the others keep their
+        phase (loops without an id are restarted at every call). Event times
+        are converted to frames here, on the caller's thread; the audio thread
+        triggers each note at its exact frame inside the block.
+        """
+        keys = set()
+        posted = self._loop_keys.get(group, set())
+        for lp in loops:
+            key = (group, lp.get("id"))
+            if key[1] is None:
+                key = (group, "anonymous", next(self._loop_gen))
+            keys.add(key)
+            if key in posted:
+                continue
+            events = loop_events(lp["events"])
+            dur = int(round(lp["dur"] * self.sr))
+            if not len(events) or dur <= 0:
+                continue
+            offs = np.clip(np.rint(events["offset"] * self.sr), 0, dur - 1).astype(np.int64).tolist()
+            voices = [self._pulse_params(note, volume=vel / 127.0, duration=d, pan=pan, group=group)
+                      for note, vel, d in zip(events["note"].tolist(), events["velocity"].tolist(),
+                                              events["duration"].tolist())]
+            self._post(("loop_add", key, {"frames": offs, "voices": voices, "dur": dur}))
+        for key in posted - keys:
+            self._post(("loop_remove", key))
+        self._loop_keys[group] = keys
+
+    @staticmethod
+    def _partials(c, phase, table, out=None, tmp=None):
+        """h1/h2/h3 additive partials, from the recipe wavetable when one is active."""
+        if table is not None:
+            return table(phase, out=out)
+        out = np.empty_like(phase) if out is None else out
+        tmp = np.empty_like(phase) if tmp is None else tmp
+        np.sin(phase, out=out)
+        out *= c["h1"]
+        for k, h in ((2.0, c["h2"]), (3.0, c["h3"])):
+            np.multiply(phase, k, out=tmp)
+            np.sin(tmp, out=tmp)
+            tmp *= h
+            out += tmp
+        return out
+
+    def _work(self, frames):
+        """(VOICE_CHUNK x frames) scratch planes shared by both render functions."""
+        shape = (self.VOICE_CHUNK, frames)
+        return [self.scratch.get(name, shape) for name in ("v.t", "v.env", "v.a", "v.b", "v.phase", "v.s")]
+
+    def _render_ambient(self, sl, t_block, outL, outR):
+        """Renders ambient voices `sl` as one (voices x frames) batch, mixing into outL/outR."""
+        cols = self.ambient_voices.cols
+        c = {f: col[sl, None] for f, col in cols.items()}
+        nv = sl.stop - sl.start
+        frames = t_block.shape[0]
+        t_abs, env, a, b, phase, s = (w[:nv] for w in self._work(frames))
+
+        np.add(c["t"], t_block, out=t_abs)
+        np.multiply(t_abs, c["inv_attack"], out=env)
+        np.clip(env, 0.0, 1.0, out=env)
+
+        # vibrato depth (octaves) swept by the slow depth LFO
+        np.multiply(t_abs, c["w_depth"], out=a)
+        np.sin(a, out=a)
+        a *= c["oct_half"]
+        a += c["oct_mid"]
+
+        np.multiply(t_abs, c["w_vib"], out=b)
+        np.sin(b, out=b)
+        a *= b
+        np.exp2(a, out=a)
+
+        # phase increment per sample = 2*pi*f_inst/sr
+        a *= c["w_step"]
+        np.cumsum(a, axis=1, out=phase)
+        phase += c["phase"]
+
+        self._partials(c, phase, self._amb_table, out=s, tmp=b)
+
+        np.multiply(t_abs, c["w_trem"], out=a)
+        np.sin(a, out=a)
+        a *= c["amp_half"]
+        a += c["amp_mid"]
+        s *= env
+        s *= a
+        self._fade_stolen(self.ambient_voices, sl, t_block, s, a)
+
+        mix = self.scratch.get("v.mix", (frames,))
+        np.matmul(cols["gain_l"][sl], s, out=mix)
+        outL += mix
+        np.matmul(cols["gain_r"][sl], s, out=mix)
+        outR += mix
+
+        np.remainder(phase[:, -1], np.float32(2.0 * math.pi), out=cols["phase"][sl])
+        cols["t"][sl] = t_abs[:, -1]
+
+    def _render_pulse(self, sl, t_block, outL, outR):
+        """Renders pulse voices `sl` as one batch; flags the voices still sounding."""
+        bank = self.pulse_voices
+        cols = bank.cols
+        c = {f: col[sl, None] for f, col in cols.items()}
+        nv = sl.stop - sl.start
+        frames = t_block.shape[0]
+        t_abs, env, a, b, phase, s = (w[:nv] for w in self._work(frames))
+
+        np.add(c["t"], t_block, out=t_abs)
+        hann_env(t_abs, c["duration"], out=env, tmp=a)
+
+        np.multiply(t_abs, c["w_vib"], out=a)
+        np.sin(a, out=a)
+        a *= c["vib_oct"]
+        np.exp2(a, out=a)
+        a *= c["w_step"]
+        np.cumsum(a, axis=1, out=phase)
+        phase += c["phase"]
+
+        self._partials(c, phase, self._pul_table, out=s, tmp=b)
+
+        np.multiply(t_abs, c["w_trem"], out=a)
+        np.sin(a, out=a)
+        a *= c["amp_half"]
+        a += c["amp_mid"]
+        s *= env
+        s *= a
+
+        # Anti-click: micro-fade on the first 5 ms of each voice, wherever
+        # its onset falls in the block (loop notes start mid-block)
+        t0 = cols["t"]
+        for k in range(nv):
+            age = float(t0[sl.start + k])
+            if age < 0.005:
+                lo = min(frames, max(0, math.ceil(-age * self.sr)))
+                hi = min(frames, max(0, math.ceil((0.005 - age) * self.sr)))
+                if lo < hi:
+                    fade = a[k, lo:hi]
+                    np.maximum(t_abs[k, lo:hi], 0.0, out=fade)
+                    fade *= 1.0 / 0.005
+                    np.minimum(fade, 1.0, out=fade)
+                    np.power(fade, 1.5, out=fade)
+                    s[k, lo:hi] *= fade
+
+        softclip(s, drive=1.05, out=s)
+        self._fade_stolen(bank, sl, t_block, s, a)
+
+        mix = self.scratch.get("v.mix", (frames,))
+        np.dot(cols["gain_l"][sl], s, out=mix)
+        outL += mix
+        np.dot(cols["gain_r"][sl], s, out=mix)
+        outR += mix
+
+        np.remainder(phase[:, -1], np.float32(2.0 * math.pi), out=cols["phase"][sl])
+        cols["t"][sl] = t_abs[:, -1]
+        alive = bank.flags[sl]
+        np.greater(env[:, -1], 1e-4, out=alive)
+        pending = self.scratch.get("v.pending", (self.VOICE_CHUNK,), dtype=np.bool_)[:nv]
+        np.less(t_abs[:, -1], cols["t_half"][sl], out=pending)
+        alive |= pending
+
+    def render(self, frames):
+        """
+        Renders the next `frames` samples of the full pipeline (voices, pulse
+        reverb, limiter). Returns (L, R) float32 views of scratch buffers that
+        are overwritten by the next call.
+        """
+        if self.workers:
+            if frames != self.blocksize:
+                raise ValueError(f"worker mode renders fixed blocks of {self.blocksize} frames (got {frames})")
+            pool = self.scratch
+            ambL = pool.get("mix.ambL", (frames,))
+            ambR = pool.get("mix.ambR", (frames,))
+            pulL = pool.get("mix.pulL", (frames,))
+            pulR = pool.get("mix.pulR", (frames,))
+            self._drain_commands()
+            if self._workers_stale:
+                # First block after a pause: the rings still hold the blocks
+                # rendered before it. This block stays silent while the
+                # workers render from the current state.
+                self._workers_stale = False
+                for w in self.workers.values():
+                    w.flush()
+                for buf in (ambL, ambR, pulL, pulR):
+                    buf.fill(0.0)
+            else:
+                self.workers["ambient"].read(ambL, ambR)
+                self.workers["pulse"].read(pulL, pulR)
+            self.frame_clock += frames
+            self.buses = (ambL, ambR, pulL, pulR)
+        else:
+            self.buses = self.render_buses(frames)
+            ambL, ambR, pulL, pulR = self.buses
 
-                if env[-1] > 1e-4:
-                    new_pulse.append(v)
+        # Mixed into their own buffers: `buses` stays readable until the
+        # next block (the callback copies it into the viz frame)
+        bufL = np.add(ambL, pulL, out=self.scratch.get("mix.L", (frames,)))
+        bufR = np.add(ambR, pulR, out=self.scratch.get("mix.R", (frames,)))
 
-            self.pulse_voices = new_pulse[-self.max_pulse:]
+        # limiter
+        peak = max(float(bufL.max()), -float(bufL.min()), float(bufR.max()), -float(bufR.min()))
+        if peak > 1.0:
+            bufL *= 1.0 / peak
+            bufR *= 1.0 / peak
+
+        np.clip(bufL, -1.0, 1.0, out=bufL)
+        np.clip(bufR, -1.0, 1.0, out=bufR)
+        return bufL, bufR
+
+    def render_buses(self, frames):
+        """
+        Renders the voices of the next block: returns (ambL, ambR, pulL, pulR)
+        after master gain, with the reverb applied to the pulse bus.
+        """
+        # Ufuncs broadcasting per-voice columns over (voices x frames) planes
+        # allocate a NumPy iterator buffer of `bufsize` elements per call unless
+        # the buffer fits in one row: size it to the block (per thread setting).
+        if getattr(self._audio_thread, "bufsize_frames", None) != frames:
+            np.setbufsize(max(16, frames - frames % 16))
+            self._audio_thread.bufsize_frames = frames
+
+        pool = self.scratch
+        ambL = pool.get("mix.ambL", (frames,))
+        ambR = pool.get("mix.ambR", (frames,))
+        pulL = pool.get("mix.pulL", (frames,))
+        pulR = pool.get("mix.pulR", (frames,))
+        for buf in (ambL, ambR, pulL, pulR):
+            buf.fill(0.0)
+
+        if self._t_block.shape[0] != frames:
+            self._t_block = np.arange(frames, dtype=np.float32) * np.float32(1.0 / self.sr)
+            pool.allocations += 1
+        t_block = self._t_block
+
+        t_render = time.perf_counter()
+        self._drain_commands()
+        self._schedule_loops(frames)
+
+        # ---- AMBIENCE render (infinite) ----
+        bank = self.ambient_voices
+        for lo in range(0, bank.n, self.VOICE_CHUNK):
+            self._render_ambient(slice(lo, min(bank.n, lo + self.VOICE_CHUNK)), t_block, ambL, ambR)
+
+        # ---- PULSE render ----
+        bank = self.pulse_voices
+        for lo in range(0, bank.n, self.VOICE_CHUNK):
+            self._render_pulse(slice(lo, min(bank.n, lo + self.VOICE_CHUNK)), t_block, pulL, pulR)
+        bank.keep(bank.flags)
+        if self._faded:
+            self._faded = False
+            for bank in (self.ambient_voices, self.pulse_voices):
+                keep = bank.flags[:bank.n]
+                np.greater_equal(bank["fade"], 0.0, out=keep)
+                bank.keep(keep)
 
         # Separated master gain control
         ambL *= self.master_gain
@@ -443,137 +1707,779 @@ class CombinedSynth:
         pulR *= self.master_gain
 
         # Reverb ONLY on pulses
-        pulL, pulR = self.pulse_reverb.process(pulL, pulR)
-
-        bufL = ambL + pulL
-        bufR = ambR + pulR
-
-        # limiter
-        peak = max(float(np.max(np.abs(bufL))), float(np.max(np.abs(bufR))))
-        if peak > 1.0:
-            bufL /= peak
-            bufR /= peak
+        if self.reverb_enabled:
+            pulL, pulR = self.pulse_reverb.process(pulL, pulR)
+
+        if self.polyphony_governor:
+            self.govern_polyphony((time.perf_counter() - t_render) * self.sr / frames)
+
+        self.frame_clock += frames
+        return ambL, ambR, pulL, pulR
+
+    def govern_polyphony(self, load):
+        """
+        Polyphony governor, run by the audio thread after each block with its
+        render time / deadline. When the smoothed load exceeds `steal_load`
+        the voice cap drops in proportion (render cost is about linear in the
+        voices) to land between lift_load and steal_load, and the voices over
+        it are stolen (not again from a block that rendered fades: the load
+        of the stolen voices is still in it); while the load stays under
+        `lift_load` the cap grows back by one voice per block, up to the bank
+        capacities.
+        """
+        self.render_load += 0.3 * (load - self.render_load)
+        live = self._live_voices()
+        faded, self._fades_rendered = self._fades_rendered, False
+        if self.render_load > self.steal_load and live > self.MIN_VOICES and not faded:
+            target = 0.5 * (self.steal_load + self.lift_load)
+            self.voice_cap = min(self.voice_cap, max(self.MIN_VOICES, int(live * target / self.render_load)))
+            self.render_load = target  # expected once the stolen voices are gone
+        elif self.render_load < self.lift_load and self.voice_cap < self.max_ambient + self.max_pulse:
+            self.voice_cap += 1
+        if live > self.voice_cap:
+            self._steal(live - self.voice_cap)
+
+    def _live_voices(self):
+        """Voices of both banks not fading out (what voice_cap counts)."""
+        return sum(bank.n - int(np.count_nonzero(bank["fade"])) for bank in (self.ambient_voices, self.pulse_voices))
+
+    def _make_room(self):
+        """With the governor at its cap, a new voice replaces the quietest one."""
+        if self.polyphony_governor and self._live_voices() >= self.voice_cap:
+            self._steal(1)
+
+    def _steal(self, count):
+        """
+        Starts the fade-out of the `count` quietest voices of both banks:
+        ambient voices by volume, pulses by volume x envelope once past their
+        peak (a rising pulse counts at full volume); the oldest first on ties.
+        """
+        amb, pul = self.ambient_voices, self.pulse_voices
+        na, n = amb.n, amb.n + pul.n
+        if not n:
+            return
+        # Both banks side by side in preallocated buffers (ambient slots first)
+        level, serial, tie, rank, tmp, rising = self._steal_buffers()
+        level, serial, tie, rank = level[:n], serial[:n], tie[:n], rank[:n]
+        level[:na] = amb["volume"]
+        serial[:na] = amb.serial[:na]
+        serial[na:] = pul.serial[:pul.n]
+        if pul.n:
+            env = level[na:]
+            tmp, rising = tmp[:pul.n], rising[:pul.n]
+            hann_env(pul["t"], pul["duration"], out=env, tmp=tmp)
+            np.less_equal(pul["t"], pul["t_half"], out=rising)
+            np.putmask(env, rising, 1.0)
+            env *= pul["volume"]
+        np.not_equal(amb["fade"], 0.0, out=tie[:na])
+        np.not_equal(pul["fade"], 0.0, out=tie[na:])
+        np.putmask(level, tie, np.inf)  # already fading
+
+        # `count` picks, each the quietest left (the oldest on ties): count is
+        # small, and argmin over the buffers allocates nothing
+        big = np.iinfo(np.int64).max
+        for _ in range(count):
+            m = level[level.argmin()]
+            if m == np.inf:
+                break
+            np.not_equal(level, m, out=tie)
+            np.copyto(rank, serial)
+            np.putmask(rank, tie, big)
+            i = int(rank.argmin())
+            level[i] = np.inf
+            bus, bank, slot = ("ambient", amb, i) if i < na else ("pulse", pul, i - na)
+            bank.cols["fade"][slot] = self.STEAL_FADE_SEC
+            self.voices_stolen[bus] += 1
+
+    def _steal_buffers(self):
+        """Work buffers of _steal, sized for both banks full."""
+        cap = self.ambient_voices.capacity + self.pulse_voices.capacity
+        pool = self.scratch
+        return (pool.get("steal.level", (cap,)), pool.get("steal.serial", (cap,), dtype=np.int64),
+                pool.get("steal.tie", (cap,), dtype=np.bool_), pool.get("steal.rank", (cap,), dtype=np.int64),
+                pool.get("steal.tmp", (self.pulse_voices.capacity,)),
+                pool.get("steal.rising", (self.pulse_voices.capacity,), dtype=np.bool_))
+
+    def _fade_stolen(self, bank, sl, t_block, s, tmp):
+        """Fades the stolen voices of batch `sl` (rows of `s`) out over STEAL_FADE_SEC."""
+        fade = bank.cols["fade"]
+        if not fade[sl].any():
+            return
+        self._fades_rendered = True
+        step = t_block.shape[0] / self.sr
+        for k in range(sl.stop - sl.start):
+            left = float(fade[sl.start + k])
+            if left <= 0.0:
+                continue
+            g = tmp[k]
+            np.subtract(np.float32(left), t_block, out=g)
+            g *= np.float32(1.0 / self.STEAL_FADE_SEC)
+            np.clip(g, 0.0, 1.0, out=g)
+            s[k] *= g
+            left -= step
+            if left <= 0.0:
+                left = -1.0  # silent now: dropped after the render
+                self._faded = True
+            fade[sl.start + k] = left
+
+    def _schedule_loops(self, frames):
+        """
+        Starts the loop notes falling in this block at their frame offset:
+        pops the merged timeline while its earliest event is inside the block
+        (O(log loops) per note, nothing for loops without a note here).
+        """
+        start = self.frame_clock
+        end = start + frames
+        bank = self.pulse_voices
+        heap = self._loop_heap
+        while heap and heap[0][0] < end:
+            at, gen, key = heapq.heappop(heap)
+            st = self._loops.get(key)
+            if st is None or st["gen"] != gen:
+                continue  # removed (or re-added) since this entry was pushed
+            i = st["i"]
+            self._make_room()
+            slot = bank.add(**st["voices"][i])
+            if slot >= 0:
+                # negative age: silent (env = 0) until the note's frame
+                bank.cols["t"][slot] = -max(0, at - start) / self.sr
+            i += 1
+            if i >= len(st["frames"]):
+                i = 0
+                st["t0"] += st["dur"]
+            st["i"] = i
+            heapq.heappush(heap, (st["t0"] + st["frames"][i], gen, key))
 
-        outdata[:, 0] = np.clip(bufL, -1.0, 1.0)
-        outdata[:, 1] = np.clip(bufR, -1.0, 1.0)
+    def _callback(self, outdata, frames, time_info, status):
+        """Callback sounddevice - generates high quality audio"""
+        t0 = time.perf_counter()
+        self.callbacks += 1
+        if status:
+            for flag in AUDIO_STATUS_FLAGS:
+                if getattr(status, flag, False):
+                    self.status_counts[flag] += 1
+            print(f"[AUDIO] Status: {status}")
 
-        # Send decimated data for visualization (only channel L, 1 every 8 samples)
+        # If audio is not active, generate silence (commands still applied).
+        # A plain bool read: the audio thread takes no locks.
+        if not is_audio_playing:
+            self._drain_commands()
+            self._n_stamps = 0  # nothing sounds: no latency to measure
+            self._workers_stale = bool(self.workers)
+            outdata.fill(0.0)
+            self.callback_time.add(time.perf_counter() - t0)
+            return
+
+        bufL, bufR = self.render(frames)
+        outdata[:, 0] = bufL
+        outdata[:, 1] = bufR
+
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.push(bufL, bufR)
+
+        # Visualization: one frame every viz_decimation blocks, made of the
+        # last blocks that fit VIZ_WINDOW (small blocks are joined so the
+        # canvas shows the same span at any blocksize), written in place into
+        # the viz ring. Each client's resolution and sample format are applied
+        # by viz_broadcaster
+        dec = self.viz_decimation
+        ring = self.viz_ring
+        n = min(frames, ring.window)
+        keep = max(1, min(dec, self.VIZ_WINDOW // frames))
         self.viz_counter += 1
-        if self.viz_counter >= self.viz_decimation:
+        k = self.viz_counter - (dec - keep)
+        if k > 0:
+            slot = ring.slot()
+            slot[0, (k - 1) * n:k * n] = bufL[:n]
+            slot[1, (k - 1) * n:k * n] = bufR[:n]
+            # unmixed buses: their levels are measured by the broadcaster
+            for row, bus in enumerate(self.buses, 2):
+                slot[row, (k - 1) * n:k * n] = bus[:n]
+        if self.viz_counter >= dec:
             self.viz_counter = 0
-            viz_data = bufL[::8].astype(np.float32)  # Decimation 8x (~256 samples from 2048)
-            try:
-                self.viz_queue.put_nowait(viz_data.tobytes())
-            except queue.Full:
-                pass  # Skip if queue is full
+            ring.publish(self.frame_clock - keep * frames, keep * n)
+
+        self._record_latency(time_info)
+        dt = time.perf_counter() - t0
+        self.callback_time.add(dt)
+        self.block_load.add(dt * self.sr / frames / (self._render_batches() + 1))
+
+    def _render_batches(self):
+        """Voice batches of the next block (render cost is about linear in them)."""
+        c = self.VOICE_CHUNK
+        return -(-self.ambient_voices.n // c) - (-self.pulse_voices.n // c)
+
+    def _record_latency(self, time_info):
+        """
+        Sensor → speaker latency of the voices started in this block: the
+        block reaches the DAC outputBufferDacTime - currentTime from now
+        (stream clock), converted to the wall clock of the sensor stamps.
+        """
+        n = self._n_stamps
+        if n == 0:
+            return
+        self._n_stamps = 0
+        if time_info is None:  # driven without a stream (benchmarks)
+            return
+        dac = time.time() + max(0.0, time_info.outputBufferDacTime - time_info.currentTime)
+        if self.workers:
+            # bus workers render `worker_depth` blocks ahead of the mix
+            dac += self.worker_depth * self.blocksize / self.sr
+        for k in range(n):
+            self.latency[LATENCY_BUSES[self._stamp_bus[k]]].add(dac - self._stamp_t[k])
 
 
 # -----------------------------
-# LOOP PLAYER
+# VIZ PROTOCOL
 # -----------------------------
-def loop_player_thread(synth):
-    """Thread that plays recorded loops"""
-    runtime = []
+# Binary frame, little endian:
+#   magic "LP" | version u8 | format u8 | seq u32 | timestamp u64 (audio frame
+#   of the first sample) | samplerate u32 | channels u16 | points u16
+# followed by `channels` planes of `points` samples (float32, int16 or int8,
+# integers scaled to full range). The 24-byte header keeps samples aligned.
+VIZ_VERSION = 1
+VIZ_HEADER = struct.Struct("<2sBBIQIHH")
+VIZ_FORMATS = {"float32": (0, np.float32, 1.0), "int16": (1, np.int16, 32767.0), "int8": (2, np.int8, 127.0)}
+VIZ_DEFAULTS = {"points": 256, "format": "float32", "channels": 1, "bands": 0, "waveform": True}
+VIZ_MAX_POINTS = 4096
+
+# Features frame (clients asking for "bands" in their hello), same header
+# layout with magic "LF": format = 0, channels = number of levels,
+# points = number of bands. Followed by the levels as float32 (RMS L, RMS R,
+# peak L, peak R, ambient bus RMS, pulse bus RMS, linear full scale = 1) and
+# the spectrum bands as uint8 (0 = -96 dBFS … 255 = 0 dBFS, log-spaced
+# from VIZ_BANDS_FMIN to Nyquist).
+VIZ_LEVELS = ("rms_l", "rms_r", "peak_l", "peak_r", "ambient_rms", "pulse_rms")
+VIZ_MIN_BANDS = 8
+VIZ_MAX_BANDS = 128
+VIZ_BANDS_FMIN = 30.0
+VIZ_DB_FLOOR = -96.0
+
+def viz_frame_size(points, fmt, channels):
+    return VIZ_HEADER.size + channels * points * np.dtype(VIZ_FORMATS[fmt][1]).itemsize
+
+def encode_viz_frame(seq, timestamp, samplerate, block, points, fmt, channels, out=None):
+    """
+    Resamples `block` (2 x frames) to `points` per channel and packs one frame.
+    With `out` (a bytearray of viz_frame_size()) the frame is written in place
+    and a memoryview of it is returned, otherwise new bytes.
+    """
+    code, dtype, scale = VIZ_FORMATS[fmt]
+    buf = bytearray(viz_frame_size(points, fmt, channels)) if out is None else out
+    VIZ_HEADER.pack_into(buf, 0, b"LP", VIZ_VERSION, code, seq & 0xFFFFFFFF, timestamp, samplerate, channels, points)
+    data = np.frombuffer(buf, dtype=dtype, count=channels * points, offset=VIZ_HEADER.size).reshape(channels, points)
+    src = block[:channels]
+    idx = (np.arange(points) * src.shape[1]) // points
+    if scale != 1.0:
+        np.rint(src[:, idx] * scale, out=data, casting="unsafe")
+    else:
+        np.take(src, idx, axis=1, out=data)
+    return bytes(buf) if out is None else memoryview(buf)
 
-    while True:
-        now = time.time()
-        with loops_lock:
-            current_loops = list(loops)
 
-        if len(runtime) != len(current_loops) or any(runtime[k]["loop_ref"] is not current_loops[k] for k in range(min(len(runtime), len(current_loops)))):
-            runtime = []
-            for lp in current_loops:
-                if not lp["events"]:
-                    continue
-                runtime.append({
-                    "loop_ref": lp,
-                    "i": 0,
-                    "t0": now,
-                    "t_next": now + lp["events"][0][0]
-                })
-
-        soonest = None
-        for st in runtime:
-            lp = st["loop_ref"]
-            if not lp["events"]:
-                continue
+def encode_viz_features(seq, timestamp, samplerate, levels, bands):
+    """Packs one features frame (levels: float32 array, bands: uint8 array)."""
+    header = VIZ_HEADER.pack(b"LF", VIZ_VERSION, 0, seq & 0xFFFFFFFF, timestamp, samplerate, len(levels), len(bands))
+    return b"".join((header, levels.astype("<f4").tobytes(), bands.tobytes()))
 
-            while now >= st["t_next"]:
-                _, midi_note = lp["events"][st["i"]]
-                synth.add_pulse_voice(midi_note)
 
-                st["i"] += 1
-                if st["i"] >= len(lp["events"]):
-                    st["i"] = 0
-                    st["t0"] += lp["dur"]
+class VizAnalyzer:
+    """
+    Features of one visualization frame, computed by the broadcaster on the
+    full-rate mix (never on the audio thread): Hann-windowed FFT of the last
+    `size` samples grouped in log-spaced bands, RMS / peak levels, and the
+    RMS of the ambient and pulse buses over the same frame.
+    """
+    def __init__(self, samplerate, size=2048):
+        self.sr = samplerate
+        self.size = size
+        self.window = np.hanning(size).astype(np.float32)
+        # power scale: the bins of a full-scale sine sum to 1 (0 dBFS)
+        self.power_scale = 4.0 / (size * float(np.sum(self.window.astype(np.float64) ** 2)))
+        self.freqs = np.fft.rfftfreq(size, 1.0 / samplerate)
+        self._band_starts = {}
+
+    def levels(self, block, buses):
+        ms = np.einsum("ij,ij->i", block, block) / max(1, block.shape[1])
+        peak = np.abs(block).max(axis=1)
+        # buses: ambient L/R, pulse L/R rows -> one RMS per bus
+        bus_ms = np.einsum("ij,ij->i", buses, buses).reshape(2, 2).mean(axis=1) / max(1, buses.shape[1])
+        return np.concatenate((np.sqrt(ms[:2]), peak[:2], np.sqrt(bus_ms))).astype(np.float32)
+
+    def power(self, block):
+        """One-sided power spectrum of the mono mix (a full-scale sine sums to 1)."""
+        x = block[:, -self.size:].mean(axis=0)
+        n = x.shape[0]
+        # short frames are zero-padded at the front (window kept on the newest samples)
+        buf = np.zeros(self.size, dtype=np.float32)
+        buf[self.size - n:] = x
+        buf *= self.window
+        spec = np.fft.rfft(buf)
+        return (spec.real * spec.real + spec.imag * spec.imag) * self.power_scale
+
+    def bands(self, power, n):
+        """Power of `n` log-spaced bands, as uint8 dBFS (VIZ_DB_FLOOR … 0)."""
+        lo = self._band_starts.get(n)
+        if lo is None:
+            edges = np.geomspace(VIZ_BANDS_FMIN, self.sr / 2.0, n + 1)[:-1]
+            lo = self._band_starts[n] = np.minimum(np.searchsorted(self.freqs, edges), len(self.freqs) - 1)
+        # band k = bins [lo[k], lo[k + 1]); a band narrower than one bin
+        # (empty range) gets the bin it falls in, as reduceat returns power[lo]
+        db = 10.0 * np.log10(np.maximum(np.add.reduceat(power, lo), 1e-12))
+        return np.clip(np.rint((db - VIZ_DB_FLOOR) * (255.0 / -VIZ_DB_FLOOR)), 0, 255).astype(np.uint8)
+
+
+class VizClient:
+    """
+    One WebSocket viewer: negotiated frame settings, bandwidth counters and
+    its own sender task. The broadcaster hands frames over with offer(); a
+    client still sending the previous frame only keeps the newest one, so a
+    slow browser drops frames instead of delaying the others.
+    """
+    # Frames replaced unsent in a row before the client is disconnected (~5 s)
+    EVICT_AFTER = 30
+
+    def __init__(self, websocket, plant=None):
+        self.websocket = websocket
+        self.plant = plant  # name, for clients of ws://.../plants/{name}
+        self.points = VIZ_DEFAULTS["points"]
+        self.format = VIZ_DEFAULTS["format"]
+        self.channels = VIZ_DEFAULTS["channels"]
+        self.bands = VIZ_DEFAULTS["bands"]
+        self.waveform = VIZ_DEFAULTS["waveform"]
+        self.connected_at = time.time()
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.frames_dropped = 0
+        self.lag_streak = 0
+        self.evicted = False
+        self._pending = None
+        self._ready = asyncio.Event()
+        self._task = None
 
-                st["t_next"] = st["t0"] + lp["events"][st["i"]][0]
+    def start(self):
+        self._task = asyncio.create_task(self._sender())
 
-            if soonest is None or st["t_next"] < soonest:
-                soonest = st["t_next"]
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def offer(self, messages) -> bool:
+        """
+        Queues the messages of the newest frame (replacing an unsent frame).
+        False: persistently slow.
+        """
+        if self._pending is not None:
+            self.frames_dropped += 1
+            self.lag_streak += 1
+        self._pending = messages
+        self._ready.set()
+        return self.lag_streak < self.EVICT_AFTER
+
+    def evict(self):
+        """Disconnects a client that stopped keeping up."""
+        self.evicted = True
+        self.stop()
+        asyncio.create_task(self.websocket.close(1013, "too slow for the visualization stream"))
+
+    async def _sender(self):
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                messages, self._pending = self._pending, None
+                if not messages:
+                    continue
+                # waits while the connection's write buffer is full (backpressure)
+                for payload in messages:
+                    await self.websocket.send(payload)
+                    self.bytes_sent += len(payload)
+                self.frames_sent += 1
+                self.lag_streak = 0
+        except websockets.exceptions.ConnectionClosed:
+            pass
 
-        if soonest is None:
-            time.sleep(0.01)
-        else:
-            time.sleep(max(0.001, min(0.02, soonest - time.time())))
+    def negotiate(self, msg):
+        """Applies a hello message, clamping to what the server can send."""
+        self.points = int(min(max(int(msg.get("points", self.points)), 16), VIZ_MAX_POINTS))
+        fmt = msg.get("format", self.format)
+        self.format = fmt if fmt in VIZ_FORMATS else VIZ_DEFAULTS["format"]
+        self.channels = 2 if int(msg.get("channels", self.channels)) >= 2 else 1
+        bands = int(msg.get("bands", self.bands))
+        self.bands = 0 if bands <= 0 else int(min(max(bands, VIZ_MIN_BANDS), VIZ_MAX_BANDS))
+        self.waveform = bool(msg.get("waveform", self.waveform))
+        return {"type": "welcome", "version": VIZ_VERSION, "points": self.points,
+                "format": self.format, "channels": self.channels,
+                "bands": self.bands, "waveform": self.waveform, "levels": list(VIZ_LEVELS)}
+
+    def stats(self):
+        elapsed = max(1e-9, time.time() - self.connected_at)
+        return {
+            "remote": str(getattr(self.websocket, "remote_address", "")),
+            "plant": self.plant,
+            "points": self.points, "format": self.format, "channels": self.channels,
+            "bands": self.bands, "waveform": self.waveform,
+            "frames_sent": self.frames_sent, "bytes_sent": self.bytes_sent,
+            "frames_dropped": self.frames_dropped,
+            "bytes_per_sec": self.bytes_sent / elapsed,
+        }
 
 
 # -----------------------------
 # WEBSOCKET BROADCASTER
 # -----------------------------
-websocket_clients = set()
+websocket_clients = {}
 ws_clients_lock = threading.Lock()
 
+def websocket_path(websocket):
+    """Request path of a connection (new and legacy websockets APIs)."""
+    request = getattr(websocket, "request", None)
+    return getattr(request, "path", None) or getattr(websocket, "path", None) or "/"
+
+
 async def websocket_handler(websocket):
-    """Handles WebSocket connections for visualization"""
+    """
+    Handles WebSocket connections for visualization. Clients of
+    ws://.../plants/{name} also get that plant's status with every frame.
+    """
+    plant = None
+    path = websocket_path(websocket).split("?")[0].rstrip("/")
+    if path.startswith("/plants/"):
+        plant = path[len("/plants/"):]
+        if plant not in plants:
+            await websocket.close(1008, f"unknown plant {plant}")
+            return
+
+    client = VizClient(websocket, plant)
+    client.start()
     with ws_clients_lock:
-        websocket_clients.add(websocket)
+        websocket_clients[websocket] = client
 
     print(f"[WS] Client connected. Total: {len(websocket_clients)}")
 
     try:
-        # Keep listening (even if no messages are expected)
+        # Text messages negotiate the frame settings (any time)
         async for message in websocket:
-            pass
+            if not isinstance(message, str):
+                continue
+            try:
+                msg = json.loads(message)
+            except ValueError:
+                continue
+            if not isinstance(msg, dict) or msg.get("type") != "hello":
+                continue
+            try:
+                welcome = client.negotiate(msg)
+            except (ValueError, TypeError):
+                continue
+            await websocket.send(json.dumps(welcome))
+            print(f"[WS] Client settings: {client.points} pts, {client.format}, {client.channels} ch")
     except websockets.exceptions.ConnectionClosed:
         pass
     finally:
+        client.stop()
         with ws_clients_lock:
-            websocket_clients.discard(websocket)
-        print(f"[WS] Client disconnected. Total: {len(websocket_clients)}")
+            websocket_clients.pop(websocket, None)
+        print(f"[WS] Client {'evicted (too slow)' if client.evicted else 'disconnected'}. Total: {len(websocket_clients)}")
 
 
 async def viz_broadcaster(synth):
-    """Sends visualization data to WebSocket clients"""
+    """
+    Fans visualization frames out to every WebSocket client at once: each
+    client's sender task gets the newest frame, and never holds up the others.
+    Spectrum / level features are computed here, only when a client asked;
+    plant status messages only for the plants someone is watching.
+    """
     chunks_sent = 0
+    ring = synth.viz_ring
+    ring.attach(asyncio.get_running_loop())
+    analyzer = VizAnalyzer(synth.sr, size=synth.VIZ_WINDOW)
 
     while True:
-        try:
-            # Read from queue (with timeout)
-            chunk = await asyncio.get_event_loop().run_in_executor(
-                None, synth.viz_queue.get, True, 0.5
-            )
-        except queue.Empty:
-            await asyncio.sleep(0.001)
-            continue
+        # Woken by the audio thread when a frame is published
+        timestamp, block, buses = await ring.next_frame()
 
         # Send to all connected clients
         with ws_clients_lock:
-            clients = list(websocket_clients)
-
-        if clients:
-            for client in clients:
-                try:
-                    await asyncio.wait_for(client.send(chunk), timeout=0.2)
-                except (asyncio.TimeoutError, Exception):
-                    pass  # Ignore send errors
+            clients = list(websocket_clients.values())
+
+        # Clients asking for the same settings share one encoded frame
+        # (a fresh buffer per frame: slow clients may still hold the last one),
+        # handed to every sender task without awaiting any of them
+        frames = {}
+        features = {}
+        statuses = {}
+        levels = power = None
+        for client in clients:
+            if client.evicted:
+                continue
+            messages = ()
+            if client.waveform:
+                key = (client.points, client.format, client.channels)
+                if key not in frames:
+                    buf = bytearray(viz_frame_size(*key))
+                    frames[key] = encode_viz_frame(chunks_sent, timestamp, synth.sr, block, *key, out=buf)
+                messages += (frames[key],)
+            if client.bands:
+                if client.bands not in features:
+                    if power is None:
+                        levels = analyzer.levels(block, buses)
+                        power = analyzer.power(block)
+                    features[client.bands] = encode_viz_features(
+                        chunks_sent, timestamp, synth.sr, levels, analyzer.bands(power, client.bands))
+                messages += (features[client.bands],)
+            if client.plant is not None and client.plant in plants:
+                if client.plant not in statuses:
+                    statuses[client.plant] = json.dumps(dict(plants[client.plant].status(), seq=chunks_sent))
+                messages += (statuses[client.plant],)
+            if not client.offer(messages):
+                client.evict()
 
         chunks_sent += 1
 
         # Report every 500 chunk
         if chunks_sent % 500 == 0:
-            queue_size = synth.viz_queue.qsize()
-            print(f"[VIZ] Sent {chunks_sent} chunks | Queue: {queue_size}/50")
+            kbps = sum(c.stats()["bytes_per_sec"] for c in clients) / 1024
+            print(f"[VIZ] Sent {chunks_sent} chunks | Ring: {len(ring)}/{ring.slots}, dropped {ring.dropped}"
+                  f" | {len(clients)} clients, {kbps:.1f} KB/s")
+
+
+# -----------------------------
+# LOOP LIBRARY (persistent, append-only file)
+# -----------------------------
+# One loop = structured array of its notes, 17 bytes per event
+LOOP_EVENT_DTYPE = np.dtype([
+    ("offset", "<f8"),    # seconds from the loop start
+    ("note", "<f4"),      # MIDI note, fractional under non-12-TET scales
+    ("velocity", "u1"),   # 0..127, pulse volume = velocity / 127
+    ("duration", "<f4"),  # pulse duration (s)
+])
+# Version 1 files stored integer notes; they are converted on open
+LOOP_EVENT_DTYPE_V1 = np.dtype([("offset", "<f8"), ("note", "u1"), ("velocity", "u1"), ("duration", "<f4")])
+LOOP_DEFAULT_VELOCITY = 74    # ≈ 0.58, the live pulse volume
+LOOP_DEFAULT_DURATION = 0.35
+# Accepted loop lengths (s): a shorter loop would start a note almost every
+# frame on the audio thread
+LOOP_MIN_DUR = 0.05
+LOOP_MAX_DUR = 3600.0
+
+# File: LOOP_FILE_HEADER, then records appended one after another, each a
+# 28-byte little-endian header followed by `n` LOOP_EVENT_DTYPE events:
+#   "LR" (2s) | kind u8 (0 = loop, 1 = deletion of id) | pad u8 | id u32
+#   | n u32 | dur f64 (s) | created f64 (unix time)
+# Ids are never reused: compaction keeps the tombstone of the highest id
+# handed out when that loop was deleted, so the next id survives restarts.
+LOOP_FILE_HEADER = b"LPLOOPS\x02"
+LOOP_FILE_HEADER_V1 = b"LPLOOPS\x01"
+LOOP_RECORD = struct.Struct("<2sBxIIdd")
+LOOP_RECORD_SAVE = 0
+LOOP_RECORD_DELETE = 1
+
+def loop_events(events, velocity=LOOP_DEFAULT_VELOCITY, duration=LOOP_DEFAULT_DURATION):
+    """
+    LOOP_EVENT_DTYPE array (sorted by offset) from rows of (t_sec, midi) or
+    (t_sec, midi, velocity, duration); structured arrays pass through.
+    ValueError on a non-finite offset or duration.
+    """
+    if isinstance(events, np.ndarray) and events.dtype == LOOP_EVENT_DTYPE:
+        return events
+    out = np.zeros(len(events), dtype=LOOP_EVENT_DTYPE)
+    for i, ev in enumerate(events):
+        t, note = float(ev[0]), float(ev[1])
+        d = float(ev[3]) if len(ev) > 3 else duration
+        if not (math.isfinite(t) and math.isfinite(note) and math.isfinite(d)):
+            raise ValueError(f"event {i}: offset, note and duration must be finite")
+        out[i] = (
+            max(0.0, t),
+            max(0.0, min(127.0, note)),
+            max(0, min(127, int(ev[2]))) if len(ev) > 2 else velocity,
+            d,
+        )
+    return np.sort(out, order="offset", kind="stable")
+
+
+def loop_duration(dur):
+    """A loop length in seconds, checked (ValueError outside LOOP_MIN_DUR..LOOP_MAX_DUR or not finite)."""
+    dur = float(dur)
+    if not LOOP_MIN_DUR <= dur <= LOOP_MAX_DUR:  # also False for NaN
+        raise ValueError(f"dur must be between {LOOP_MIN_DUR:g} and {LOOP_MAX_DUR:g} s (got {dur})")
+    return dur
+
+
+class LoopLibrary:
+    """
+    Recorded loops kept on disk in one append-only file (format above).
+    Opening only reads the record headers, seeking over the events, to index
+    id → (file offset, events, duration); a loop's events are read with one
+    np.fromfile on first use and cached. Deleting appends a tombstone and the
+    file is rewritten once dead records outweigh live ones. A truncated last
+    record (crash mid-write) is cut off on open; any other damaged record
+    raises ValueError and the file is left untouched. The methods are
+    thread-safe and block on disk: the HTTP handlers run them through io().
+    """
+    COMPACT_MIN_BYTES = 1 << 20
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.lock = threading.Lock()
+        self.index = {}    # id -> {"offset", "n", "dur", "created"}
+        self._events = {}  # id -> events array, filled on first use
+        self.next_id = 1
+        self.dead_bytes = 0
+        self._open()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, loop_id):
+        return loop_id in self.index
+
+    def _open(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            with open(self.path, "wb") as f:
+                f.write(LOOP_FILE_HEADER)
+            return
+
+        with open(self.path, "rb") as f:
+            header = f.read(len(LOOP_FILE_HEADER))
+            if header == LOOP_FILE_HEADER_V1:
+                dtype = LOOP_EVENT_DTYPE_V1
+            elif header == LOOP_FILE_HEADER:
+                dtype = LOOP_EVENT_DTYPE
+            else:
+                raise ValueError(f"{self.path}: not a loop library")
+            size = os.fstat(f.fileno()).st_size
+            pos = len(LOOP_FILE_HEADER)
+            while pos + LOOP_RECORD.size <= size:
+                f.seek(pos)
+                magic, kind, loop_id, n, dur, created = LOOP_RECORD.unpack(f.read(LOOP_RECORD.size))
+                if magic != b"LR":
+                    raise ValueError(f"{self.path}: damaged loop record at byte {pos}"
+                                     f" (file left as is, {size - pos} bytes from there)")
+                end = pos + LOOP_RECORD.size + n * dtype.itemsize
+                if end > size:
+                    break  # torn last record
+                if kind == LOOP_RECORD_DELETE:
+                    old = self.index.pop(loop_id, None)
+                    if old is not None:
+                        self.dead_bytes += LOOP_RECORD.size + old["n"] * dtype.itemsize
+                    self.dead_bytes += LOOP_RECORD.size
+                else:
+                    self.index[loop_id] = {"offset": pos, "n": n, "dur": dur, "created": created}
+                self.next_id = max(self.next_id, loop_id + 1)
+                pos = end
+
+        if pos < size:
+            print(f"[LOOPS] ⚠️  {self.path}: dropping {size - pos} bytes of a truncated record")
+            if dtype is LOOP_EVENT_DTYPE:
+                with open(self.path, "r+b") as f:
+                    f.truncate(pos)
+        if dtype is not LOOP_EVENT_DTYPE:
+            print(f"[LOOPS] {self.path}: converting {len(self.index)} loops to the current format")
+            self.compact(source_dtype=dtype)
+        else:
+            self._compact_if_wasteful(pos)
+
+    def _compact_if_wasteful(self, size):
+        """Compacts once dead records reach COMPACT_MIN_BYTES and outweigh the live ones."""
+        if self.dead_bytes >= self.COMPACT_MIN_BYTES and self.dead_bytes > size - self.dead_bytes:
+            self.compact()
+
+    @staticmethod
+    def _record_size(n):
+        return LOOP_RECORD.size + n * LOOP_EVENT_DTYPE.itemsize
+
+    def _append(self, f, kind, loop_id, events, dur, created):
+        f.seek(0, os.SEEK_END)
+        offset = f.tell()
+        f.write(LOOP_RECORD.pack(b"LR", kind, loop_id, len(events), dur, created))
+        f.write(events.tobytes())
+        return offset
+
+    def list(self):
+        """Metadata of every stored loop, oldest first."""
+        with self.lock:
+            return [{"id": loop_id, "dur": e["dur"], "events": e["n"], "created": e["created"]}
+                    for loop_id, e in sorted(self.index.items())]
+
+    def get(self, loop_id):
+        """Events of a stored loop (KeyError if unknown)."""
+        with self.lock:
+            events = self._events.get(loop_id)
+            if events is None:
+                e = self.index[loop_id]
+                events = np.fromfile(self.path, dtype=LOOP_EVENT_DTYPE, count=e["n"],
+                                     offset=e["offset"] + LOOP_RECORD.size)
+                self._events[loop_id] = events
+            return events
+
+    def loop(self, loop_id):
+        """Stored loop in the form CombinedSynth.set_loops() takes."""
+        events = self.get(loop_id)
+        return {"id": loop_id, "events": events, "dur": self.index[loop_id]["dur"]}
+
+    def save(self, events, dur, created=None):
+        """Appends a loop to the file (flushed to disk), returns its id."""
+        events = loop_events(events)
+        created = time.time() if created is None else float(created)
+        with self.lock:
+            loop_id = self.next_id
+            with open(self.path, "ab") as f:
+                offset = self._append(f, LOOP_RECORD_SAVE, loop_id, events, float(dur), created)
+                f.flush()
+                os.fsync(f.fileno())
+            self.index[loop_id] = {"offset": offset, "n": len(events), "dur": float(dur), "created": created}
+            self._events[loop_id] = events
+            self.next_id += 1
+        return loop_id
+
+    def delete(self, loop_id):
+        """Removes a loop (tombstone record, compacting when worth it); False if unknown."""
+        empty = np.zeros(0, dtype=LOOP_EVENT_DTYPE)
+        with self.lock:
+            e = self.index.pop(loop_id, None)
+            if e is None:
+                return False
+            self._events.pop(loop_id, None)
+            with open(self.path, "ab") as f:
+                self._append(f, LOOP_RECORD_DELETE, loop_id, empty, 0.0, time.time())
+                f.flush()
+                os.fsync(f.fileno())
+            self.dead_bytes += self._record_size(e["n"]) + LOOP_RECORD.size
+        self._compact_if_wasteful(os.path.getsize(self.path))
+        return True
+
+    def compact(self, source_dtype=LOOP_EVENT_DTYPE):
+        """
+        Rewrites the file with the live loops only (and their events in
+        LOOP_EVENT_DTYPE when the file holds `source_dtype` ones).
+        """
+        with self.lock:
+            tmp = self.path + ".tmp"
+            index = {}
+            with open(self.path, "rb") as src, open(tmp, "wb") as dst:
+                dst.write(LOOP_FILE_HEADER)
+                for loop_id, e in sorted(self.index.items()):
+                    src.seek(e["offset"])
+                    index[loop_id] = dict(e, offset=dst.tell())
+                    if source_dtype is LOOP_EVENT_DTYPE:
+                        dst.write(src.read(self._record_size(e["n"])))
+                    else:
+                        dst.write(src.read(LOOP_RECORD.size))
+                        events = np.fromfile(src, dtype=source_dtype, count=e["n"])
+                        dst.write(events.astype(LOOP_EVENT_DTYPE).tobytes())
+                last_id = self.next_id - 1
+                if last_id > 0 and last_id not in index:
+                    # high-water mark: the deleted highest id stays taken
+                    self._append(dst, LOOP_RECORD_DELETE, last_id, np.zeros(0, dtype=LOOP_EVENT_DTYPE),
+                                 0.0, time.time())
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.replace(tmp, self.path)
+            self.index = index
+            self.dead_bytes = 0
 
 
 # -----------------------------
@@ -622,93 +2528,630 @@ async def handle_stop(request):
     }, headers={'Access-Control-Allow-Origin': '*'})
 
 
-async def handle_start_rec(request):
-    """POST /start_rec - Start loop recording"""
-    global is_recording, rec_start_t, rec_events
+def io(fn, *args):
+    """
+    Runs a blocking file operation (loop library writes with fsync, file
+    rewrites) in the default executor, keeping the event loop, and so the
+    HTTP server and the viz broadcaster, free meanwhile.
+    """
+    return asyncio.get_running_loop().run_in_executor(None, fn, *args)
 
-    with recording_lock:
-        if not is_recording:
-            is_recording = True
-            rec_start_t = time.time()
-            rec_events = []
-            print("[HTTP] 🔴 Recording START")
+
+def plants_of(request):
+    """
+    Plants addressed by a request: the one named in /plants/{plant}/..., or
+    every plant for the unprefixed routes.
+    """
+    name = request.match_info.get('plant')
+    if name is None:
+        return list(request.app['plants'].values())
+    plant = request.app['plants'].get(name)
+    if plant is None:
+        raise web.HTTPNotFound(text=json.dumps({'status': 'error', 'message': f'Unknown plant {name}'}),
+                               content_type='application/json',
+                               headers={'Access-Control-Allow-Origin': '*'})
+    return [plant]
+
+
+async def handle_start_rec(request):
+    """POST /start_rec - Start loop recording (every plant, or /plants/{plant}/start_rec)"""
+    targets = plants_of(request)
+    for plant in targets:
+        if plant.start_recording():
+            print(f"[HTTP] 🔴 Recording START ({plant.name})")
 
     return web.json_response({
         'status': 'recording',
-        'recording': True
+        'recording': True,
+        'plants': [p.name for p in targets]
     }, headers={'Access-Control-Allow-Origin': '*'})
 
 
 async def handle_stop_rec(request):
-    """POST /stop_rec - Stop loop recording"""
-    global is_recording, rec_start_t, rec_events
+    """POST /stop_rec - Stop loop recording: each plant's take is stored and played"""
+    saved = {}
+    rejected = {}
+    for plant in plants_of(request):
+        take = plant.stop_recording()
+        if take is None:
+            continue
+        events, dur = take
+        try:
+            dur = loop_duration(dur)
+        except ValueError as e:
+            rejected[plant.name] = str(e)
+            print(f"[HTTP] ⚠️  Recording STOP ({plant.name}) → take not saved: {e}")
+            continue
+        loop_id = await io(request.app['loops'].save, events, dur)
+        plant.play_loop(request.app['synth'], {"id": loop_id, "events": events, "dur": dur})
+        saved[plant.name] = loop_id
+        print(f"[HTTP] ⏹️  Recording STOP ({plant.name}) → Loop {loop_id} saved (dur={dur:.2f}s, events={len(events)})")
+
+    return web.json_response({
+        'status': 'stopped',
+        'recording': False,
+        'loops': saved,
+        'rejected': rejected
+    }, headers={'Access-Control-Allow-Origin': '*'})
 
-    with recording_lock:
-        if is_recording:
-            is_recording = False
-            now = time.time()
-            dur = max(0.05, now - rec_start_t)
-            rec_events_sorted = sorted(rec_events, key=lambda x: x[0])
-            loop = {"events": rec_events_sorted, "dur": dur}
 
-            with loops_lock:
-                loops.append(loop)
-                if len(loops) > MAX_LOOPS:
-                    loops.pop(0)
+async def handle_clear_loops(request):
+    """POST /clear_loops - Stops the loops (they stay in the library)"""
+    for plant in plants_of(request):
+        plant.stop_loops(request.app['synth'])
+        print(f"[HTTP] 🗑️  Loops cleared ({plant.name})")
 
-            print(f"[HTTP] ⏹️  Recording STOP → Loop saved (dur={dur:.2f}s, events={len(rec_events_sorted)})")
+    return web.json_response({
+        'status': 'loops_cleared'
+    }, headers={'Access-Control-Allow-Origin': '*'})
 
+
+def loop_not_found(loop_id):
     return web.json_response({
-        'status': 'stopped',
-        'recording': False
+        'status': 'error',
+        'message': f'Unknown loop {loop_id}'
+    }, status=404, headers={'Access-Control-Allow-Origin': '*'})
+
+
+async def handle_list_loops(request):
+    """GET /loops - Stored loops (id, duration, events) and the plants playing them"""
+    targets = plants_of(request)
+    playing = {p.name: p.playing() for p in targets}
+    stored = request.app['loops'].list()
+    for lp in stored:
+        lp['playing'] = [name for name, ids in playing.items() if lp['id'] in ids]
+
+    return web.json_response({
+        'loops': stored,
+        'playing': playing,
+        'max_playing': MAX_LOOPS
     }, headers={'Access-Control-Allow-Origin': '*'})
 
 
-async def handle_clear_loops(request):
-    """POST /clear_loops - Clears all loops"""
-    with loops_lock:
-        loops.clear()
+async def handle_save_loop(request):
+    """POST /loops - Stores a loop {"events": [[t_sec, midi, velocity?, duration?], ...], "dur": sec}"""
+    try:
+        body = await request.json()
+        events = loop_events(body["events"])
+        dur = loop_duration(body["dur"])
+    except (ValueError, KeyError, TypeError, IndexError) as e:
+        return web.json_response({
+            'status': 'error',
+            'message': f'Invalid loop: {e}'
+        }, status=400, headers={'Access-Control-Allow-Origin': '*'})
+
+    loop_id = await io(request.app['loops'].save, events, dur)
+    print(f"[HTTP] 💾 Loop {loop_id} stored (dur={dur:.2f}s, events={len(events)})")
+
+    return web.json_response({
+        'status': 'saved',
+        'id': loop_id
+    }, headers={'Access-Control-Allow-Origin': '*'})
 
-    print("[HTTP] 🗑️  Loops cleared")
+
+async def handle_get_loop(request):
+    """GET /loops/{id} - Events of a stored loop"""
+    loop_id = int(request.match_info['id'])
+    try:
+        lp = await io(request.app['loops'].loop, loop_id)
+    except KeyError:  # unknown, or deleted meanwhile
+        return loop_not_found(loop_id)
 
     return web.json_response({
-        'status': 'loops_cleared'
+        'id': loop_id,
+        'dur': lp['dur'],
+        'events': [list(ev) for ev in lp['events'].tolist()]
+    }, headers={'Access-Control-Allow-Origin': '*'})
+
+
+async def handle_load_loop(request):
+    """POST /loops/{id}/load - Plays a stored loop (on the first plant, or /plants/{plant}/loops/{id}/load)"""
+    loop_id = int(request.match_info['id'])
+    plant = plants_of(request)[0]
+    try:
+        lp = await io(request.app['loops'].loop, loop_id)
+    except KeyError:  # unknown, or deleted meanwhile
+        return loop_not_found(loop_id)
+
+    plant.play_loop(request.app['synth'], lp)
+    print(f"[HTTP] 🔁 Loop {loop_id} loaded ({plant.name})")
+
+    return web.json_response({
+        'status': 'playing',
+        'id': loop_id,
+        'plant': plant.name
+    }, headers={'Access-Control-Allow-Origin': '*'})
+
+
+async def handle_delete_loop(request):
+    """DELETE /loops/{id} - Stops (on every plant) and deletes a stored loop"""
+    loop_id = int(request.match_info['id'])
+    if not await io(request.app['loops'].delete, loop_id):
+        return loop_not_found(loop_id)
+
+    for plant in request.app['plants'].values():
+        plant.stop_loops(request.app['synth'], loop_id)
+
+    print(f"[HTTP] 🗑️  Loop {loop_id} deleted")
+
+    return web.json_response({
+        'status': 'deleted',
+        'id': loop_id
     }, headers={'Access-Control-Allow-Origin': '*'})
 
 
 async def handle_clear_ambient(request):
-    """POST /clear_ambient - Clears ambient voices"""
+    """POST /clear_ambient - Clears ambient voices (every plant, or /plants/{plant}/clear_ambient)"""
     synth = request.app['synth']
-    synth.clear_ambient()
-
-    print("[HTTP] 🗑️  Ambient cleared")
+    if 'plant' in request.match_info:
+        plant = plants_of(request)[0]
+        synth.clear_ambient(plant.group)
+        print(f"[HTTP] 🗑️  Ambient cleared ({plant.name})")
+    else:
+        synth.clear_ambient()
+        print("[HTTP] 🗑️  Ambient cleared")
 
     return web.json_response({
         'status': 'ambient_cleared'
     }, headers={'Access-Control-Allow-Origin': '*'})
 
 
+async def handle_start_session(request):
+    """POST /start_session - Starts archiving the master mix to disk ({"format": "wav" | "flac"}, optional)"""
+    recorder = request.app['recorder']
+    fmt = None
+    if request.can_read_body:
+        try:
+            fmt = (await request.json()).get("format")
+        except (ValueError, AttributeError):
+            fmt = None
+    try:
+        started = recorder.start(fmt)
+    except ValueError as e:
+        return web.json_response({
+            'status': 'error',
+            'message': str(e)
+        }, status=400, headers={'Access-Control-Allow-Origin': '*'})
+
+    if started:
+        print(f"[HTTP] 🎙️  Session recording START ({recorder.format} → {recorder.directory})")
+
+    return web.json_response(dict(recorder.stats(), status='recording'),
+                             headers={'Access-Control-Allow-Origin': '*'})
+
+
+async def handle_stop_session(request):
+    """POST /stop_session - Stops the session recording (after the buffered audio is written)"""
+    recorder = request.app['recorder']
+    # the writer thread finishes the last chunk: off the event loop
+    if await asyncio.get_running_loop().run_in_executor(None, recorder.stop):
+        stats = recorder.stats()
+        print(f"[HTTP] ⏹️  Session recording STOP ({stats['seconds_written']:.1f} s in {len(stats['files'])} files,"
+              f" {stats['dropped_frames']} frames dropped)")
+
+    return web.json_response(dict(recorder.stats(), status='stopped'),
+                             headers={'Access-Control-Allow-Origin': '*'})
+
+
+async def handle_session_stats(request):
+    """GET /session_stats - Session recording: files, seconds written, ring fill, dropped frames"""
+    return web.json_response(request.app['recorder'].stats(), headers={'Access-Control-Allow-Origin': '*'})
+
+
+async def handle_plants(request):
+    """GET /plants - Every plant: voice group, stereo position, latest readings and notes, loops"""
+    return web.json_response({
+        'plants': [p.status() for p in request.app['plants'].values()]
+    }, headers={'Access-Control-Allow-Origin': '*'})
+
+
+async def handle_tuning(request):
+    """
+    GET /tuning - Scale and mapping tables of every plant (or /plants/{plant}/tuning)
+    POST /tuning - Sets the scale {"scale": "major" | "minor" | "pentatonic" | "chromatic" | [cents, ...]}
+    """
+    targets = plants_of(request)
+    if request.method == 'POST':
+        try:
+            body = await request.json()
+            scale = body["scale"]
+            for plant in targets:
+                plant.set_scale(scale)
+        except (ValueError, KeyError, TypeError) as e:
+            return web.json_response({
+                'status': 'error',
+                'message': f'Invalid scale: {e}'
+            }, status=400, headers={'Access-Control-Allow-Origin': '*'})
+        print(f"[HTTP] 🎼 Scale {scale} ({', '.join(p.name for p in targets)})")
+
+    return web.json_response({
+        'plants': [p.tuning() for p in targets]
+    }, headers={'Access-Control-Allow-Origin': '*'})
+
+
+async def handle_viz_stats(request):
+    """GET /viz_stats - Bandwidth and frame settings of each WebSocket client"""
+    with ws_clients_lock:
+        clients = [c.stats() for c in websocket_clients.values()]
+
+    ring = request.app['synth'].viz_ring
+    return web.json_response({
+        'clients': clients,
+        'total_bytes_per_sec': sum(c['bytes_per_sec'] for c in clients),
+        'frames_published': ring.head,
+        'frames_dropped': ring.dropped
+    }, headers={'Access-Control-Allow-Origin': '*'})
+
+
+async def handle_serial_stats(request):
+    """GET /serial_stats - Serial ingestion metrics (lines/s, parse failures, queue depth) of the first plant"""
+    plant = plants_of(request)[0]
+    return web.json_response(plant.source.stats(), headers={'Access-Control-Allow-Origin': '*'})
+
+
+def format_metrics(synth, source=None, plants=None):
+    """
+    Engine (and sensor) metrics in the Prometheus text exposition format.
+    `plants` (name -> Plant) labels the sensor metrics with the plant name.
+    """
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP liveplanting_{name} {help_text}")
+        lines.append(f"# TYPE liveplanting_{name} {kind}")
+        for suffix, labels, value in samples:
+            label_str = ",".join(f'{k}="{v}"' for k, v in labels.items())
+            value = "NaN" if value != value else f"{value:.9g}"
+            lines.append(f"liveplanting_{name}{suffix}{{{label_str}}} {value}" if label_str
+                         else f"liveplanting_{name}{suffix} {value}")
+
+    def summary(stats, labels=None):
+        labels = labels or {}
+        samples = [("", dict(labels, quantile=str(q)), v)
+                   for q, v in zip((0.5, 0.95, 0.99), stats.quantiles())]
+        samples += [("_sum", labels, stats.sum), ("_count", labels, stats.count)]
+        return samples
+
+    metric("sensor_to_dac_seconds", "summary",
+           "Sensor reading to first DAC output of the voice it started (recent window).",
+           [sample for bus in LATENCY_BUSES for sample in summary(synth.latency[bus], {"bus": bus})])
+    metric("callback_seconds", "summary", "Audio callback duration (recent window).",
+           summary(synth.callback_time))
+    metric("callback_deadline_seconds", "gauge", "Duration of one audio block.",
+           [("", {}, synth.blocksize / synth.sr)])
+    metric("callbacks_total", "counter", "Audio callbacks run.", [("", {}, synth.callbacks)])
+    metric("blocksize_frames", "gauge", "Current audio blocksize.", [("", {}, synth.blocksize)])
+    metric("blocksize_changes_total", "counter", "Blocksize switches of the low-latency governor.",
+           [("", {}, synth.blocksize_changes)])
+    metric("audio_status_total", "counter", "Audio callbacks reporting a stream status flag.",
+           [("", {"flag": f}, n) for f, n in synth.status_counts.items()])
+    metric("voices", "gauge", "Active voices.",
+           [("", {"bus": "ambient"}, len(synth.ambient_voices)), ("", {"bus": "pulse"}, len(synth.pulse_voices))])
+    metric("voices_max", "gauge", "Voice capacity.",
+           [("", {"bus": "ambient"}, synth.max_ambient), ("", {"bus": "pulse"}, synth.max_pulse)])
+    if synth.polyphony_governor:
+        metric("voice_cap", "gauge", "Effective polyphony: voices the governor lets render (both buses).",
+               [("", {}, synth.voice_cap)])
+        metric("render_load_ratio", "gauge", "Smoothed render time / block deadline seen by the governor.",
+               [("", {}, synth.render_load)])
+        metric("voices_stolen_total", "counter", "Voices faded out by the polyphony governor.",
+               [("", {"bus": bus}, n) for bus, n in synth.voices_stolen.items()])
+    metric("viz_frames_total", "counter", "Visualization frames published by the audio thread.",
+           [("", {}, synth.viz_ring.head)])
+    metric("viz_frames_dropped_total", "counter", "Visualization frames skipped by a lagging broadcaster.",
+           [("", {}, synth.viz_ring.dropped)])
+    commands = synth.command_stats()
+    metric("commands_dropped_total", "counter", "Voice commands dropped (command ring full).",
+           [("", {}, commands["dropped"])])
+    if synth.recorder is not None:
+        recorder = synth.recorder
+        metric("session_recording", "gauge", "1 while the master mix is being archived.",
+               [("", {}, int(recorder.active))])
+        metric("session_frames_written_total", "counter", "Frames written by the session recorder.",
+               [("", {}, recorder.frames_written)])
+        metric("session_frames_dropped_total", "counter", "Frames dropped by the session recorder (ring full).",
+               [("", {}, recorder.dropped_frames)])
+    if synth.workers:
+        metric("worker_underruns_total", "counter", "Blocks a bus worker did not deliver in time.",
+               [("", {"bus": bus}, w.underruns) for bus, w in synth.workers.items()])
+    sources = [({}, source)] if source is not None else []
+    if plants:
+        sources = [({"plant": name}, p.source) for name, p in plants.items()]
+        groups = {name: p.group for name, p in plants.items()}
+        metric("plant_voices", "gauge", "Active voices per plant.",
+               [("", {"plant": name, "bus": bus}, int(np.count_nonzero(bank["group"] == g)))
+                for name, g in groups.items()
+                for bus, bank in (("ambient", synth.ambient_voices), ("pulse", synth.pulse_voices))])
+    if sources:
+        metric("sensor_readings_total", "counter", "Sensor lines/frames received.",
+               [("", labels, src.lines) for labels, src in sources])
+        metric("sensor_parse_failures_total", "counter", "Unparseable sensor lines.",
+               [("", labels, src.parse_failures) for labels, src in sources])
+        metric("sensor_lost_frames_total", "counter", "Binary frames missing from the sequence.",
+               [("", labels, src.lost_frames) for labels, src in sources])
+        metric("sensor_dropped_total", "counter", "Readings dropped (sample ring full).",
+               [("", labels, src.samples.dropped) for labels, src in sources])
+        metric("sensor_queue_depth", "gauge", "Readings waiting to be mapped.",
+               [("", labels, len(src.samples)) for labels, src in sources])
+    return "\n".join(lines) + "\n"
+
+
+async def handle_metrics(request):
+    """GET /metrics - Latency, callback, voice and underrun metrics (Prometheus text format)"""
+    text = format_metrics(request.app['synth'], plants=request.app.get('plants'))
+    return web.Response(body=text.encode("utf-8"), headers={
+        'Content-Type': 'text/plain; version=0.0.4; charset=utf-8',
+        'Access-Control-Allow-Origin': '*'
+    })
+
+
 async def handle_options(request):
     """OPTIONS - CORS preflight"""
     return web.Response(
         headers={
             'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Methods': 'POST, OPTIONS',
+            'Access-Control-Allow-Methods': 'GET, POST, DELETE, OPTIONS',
             'Access-Control-Allow-Headers': 'Content-Type'
         }
     )
 
 
 # -----------------------------
-# SERIAL READER (Arduino)
+# SENSOR CONDITIONING (streaming filters, constant memory per channel)
 # -----------------------------
-async def serial_reader(synth):
-    """Reads data from Arduino and generates audio"""
-    global is_recording, rec_start_t, rec_events
+class MedianFilter:
+    """
+    Running median of the last `k` readings (odd k, 1 passes through),
+    computed for a whole batch at once. Only the last `k_max` - 1 readings
+    are kept between batches, whatever the reading rate.
+    """
+    def __init__(self, k_max=31):
+        self.k_max = k_max
+        self.tail = np.zeros(0, dtype=np.float64)
+        self.pushed = []  # readings passed through push() since, newest last
+
+    def process(self, x, k):
+        x = np.asarray(x, dtype=np.float64)
+        k = max(1, min(self.k_max, int(k) | 1))
+        if self.pushed:
+            self.tail = np.concatenate((self.tail, self.pushed))
+            self.pushed.clear()
+        hist = np.concatenate((self.tail, x))
+        self.tail = hist[-(self.k_max - 1):] if self.k_max > 1 else self.tail
+        if k == 1 or not len(x):
+            return x
+        need = len(x) + k - 1
+        if len(hist) < need:  # stream start: repeat the first reading
+            hist = np.concatenate((np.full(need - len(hist), hist[0]), hist))
+        win = np.lib.stride_tricks.sliding_window_view(hist[-need:], k)
+        return np.partition(win, k // 2, axis=1)[:, k // 2]
+
+    def push(self, x, k):
+        """One reading (same result as process([x], k)[0]); k = 1 costs a list append."""
+        if int(k) > 1:
+            return float(self.process([x], k)[0])
+        pushed = self.pushed
+        pushed.append(float(x))
+        if len(pushed) >= 2 * self.k_max:  # the older tail is out of every window
+            del pushed[:-(self.k_max - 1) or None]
+            self.tail = self.tail[:0]
+        return float(x)
+
+
+class EmaFilter:
+    """
+    One-pole low-pass (exponential moving average) with time constant `tau`
+    seconds; tau = 0 passes through. The coefficient follows the reading
+    interval `dt` of each batch, so the smoothing is the same at 20 Hz and
+    at 10 kHz. State: the last output.
+    """
+    def __init__(self, tau):
+        self.tau = tau
+        self.y = None
+
+    def process(self, x, dt):
+        x = np.asarray(x, dtype=np.float64)
+        if not len(x):
+            return x
+        if self.tau <= 0 or dt / self.tau > 20.0:  # previous output weighs < 1e-8
+            self.y = float(x[-1])
+            return x
+        b = math.exp(-dt / self.tau)
+        y0 = float(x[0]) if self.y is None else self.y
+        # y[k] = b^(k+1) * (y0 + (1 - b) * sum_{j<=k} x[j] / b^(j+1)),
+        # in chunks short enough for b^-(j+1) to stay finite
+        out = np.empty_like(x)
+        L = max(1, int(300.0 * self.tau / dt))
+        for lo in range(0, len(x), L):
+            seg = x[lo:lo + L]
+            p = b ** np.arange(1, len(seg) + 1, dtype=np.float64)
+            out[lo:lo + len(seg)] = p * (y0 + (1.0 - b) * np.cumsum(seg / p))
+            y0 = float(out[lo + len(seg) - 1])
+        self.y = y0
+        return out
+
+    def push(self, x, dt):
+        """One reading (same arithmetic as process([x], dt)[0])."""
+        if self.tau <= 0 or dt / self.tau > 20.0:
+            self.y = x
+            return x
+        b = math.exp(-dt / self.tau)
+        y0 = x if self.y is None else self.y
+        self.y = b * (y0 + (1.0 - b) * (x / b))
+        return self.y
+
+
+class OnsetDetector:
+    """
+    Hysteresis onsets on a batch of levels: fires when the level reaches
+    `on`, re-arms only once it drops below `off` (< on), so noise around
+    the threshold cannot retrigger. Onsets closer than `cooldown` seconds
+    to the previous one are dropped. Only the candidate onsets are looped
+    over; the hysteresis state is computed for the whole batch at once.
+    """
+    def __init__(self, on, off, cooldown):
+        self.on = on
+        self.off = off
+        self.cooldown = cooldown
+        self.high = False
+        self.last = float("-inf")
+
+    def process(self, t, level):
+        """Indices of the readings that fire."""
+        n = len(level)
+        if not n:
+            return []
+        above = level >= self.on
+        if not above.any():  # common case: nothing to fire, may only re-arm
+            self.high = self.high and not (level < self.off).any()
+            return []
+        pos = np.arange(n)
+        mark = np.where(above, 1, np.where(level < self.off, 0, -1))
+        last_mark = np.maximum.accumulate(np.where(mark >= 0, pos, -1))
+        high = np.where(last_mark >= 0, mark[last_mark] == 1, self.high)
+        rising = high.copy()
+        rising[1:] &= ~high[:-1]
+        rising[0] &= not self.high
+        self.high = bool(high[-1])
+
+        fired = []
+        for k in np.flatnonzero(rising).tolist():
+            if t[k] - self.last >= self.cooldown:
+                fired.append(k)
+                self.last = float(t[k])
+        return fired
+
+    def push(self, t, level):
+        """One reading: True if it fires."""
+        if level < self.on:
+            if level < self.off:
+                self.high = False
+            return False
+        rising, self.high = not self.high, True
+        if rising and t - self.last >= self.cooldown:
+            self.last = t
+            return True
+        return False
+
+
+class WindowMean:
+    """
+    Mean of the readings over `window` seconds as a running sum / count
+    (constant memory at any rate). `zero_run` consecutive readings at
+    semitone 0 (sensor out of range) stop the ambience and restart the
+    window; those readings are not averaged.
+    """
+    def __init__(self, window, now=0.0, zero_run=2):
+        self.window = window
+        self.zero_run = zero_run
+        self.start = now
+        self.total = 0
+        self.count = 0
+        self.zeros = 0  # current run of zero readings (capped at zero_run)
+
+    def process(self, t, values, zero):
+        """
+        Feeds a batch (times, values, zero mask); returns [(i, mean)] for
+        each window closed at reading i, and (i, None) where the ambience
+        stops.
+        """
+        n = len(values)
+        if not n:
+            return []
+        if not zero.any() and t[-1] - self.start < self.window:  # common case: accumulate
+            self.total += values.sum().item()
+            self.count += n
+            self.zeros = 0
+            return []
+        pos = np.arange(n)
+        last_nz = np.maximum.accumulate(np.where(zero, -1, pos))
+        run = np.where(last_nz >= 0, pos - last_nz, self.zeros + pos + 1)
+        used = run < self.zero_run
+        csum = np.cumsum(np.where(used, values, 0))
+        ccnt = np.cumsum(used)
+
+        events = []
+        base_sum, base_cnt = 0, 0  # cumulative totals already folded into a closed window
+        i = 0
+        for stop in np.flatnonzero(run == self.zero_run).tolist() + [n]:
+            while i < stop:
+                due = used[i:stop] & ((t[i:stop] - self.start) >= self.window)
+                k = i + int(np.argmax(due))
+                if not due[k - i]:
+                    break
+                total = self.total + csum[k].item() - base_sum
+                count = self.count + int(ccnt[k]) - base_cnt
+                events.append((k, total / count))
+                self.total, self.count = 0, 0
+                base_sum, base_cnt = csum[k].item(), int(ccnt[k])
+                self.start = float(t[k])
+                i = k + 1
+            if stop < n:
+                events.append((stop, None))
+                self.total, self.count = 0, 0
+                base_sum, base_cnt = csum[stop].item(), int(ccnt[stop])
+                self.start = float(t[stop])
+                i = stop + 1
+
+        self.total += csum[-1].item() - base_sum
+        self.count += int(ccnt[-1]) - base_cnt
+        self.zeros = min(int(run[-1]), self.zero_run)
+        return events
+
+    def push(self, t, value, zero):
+        """One reading: same events as process() on a batch of one (index 0)."""
+        run = self.zeros + 1 if zero else 0
+        self.zeros = min(run, self.zero_run)
+        if run == self.zero_run:
+            self.total, self.count = 0, 0
+            self.start = t
+            return [(0, None)]
+        if run > self.zero_run:
+            return []
+        self.total += value
+        self.count += 1
+        if t - self.start < self.window:
+            return []
+        mean = self.total / self.count
+        self.total, self.count = 0, 0
+        self.start = t
+        return [(0, mean)]
 
-    PORT = "COM5"
-    BAUD = 9600
 
+# -----------------------------
+# SENSOR MAPPING (humidity/bio → notes)
+# -----------------------------
+class SensorMapper:
+    """
+    Turns (hum_raw, bio_raw) readings into synth notes, a batch at a time:
+    - humidity averaged over AMB_WINDOW_SEC → one ambient voice per window
+    - bio median + EMA filtered (rate independent: PULSE_MEDIAN_SEC /
+      PULSE_SMOOTH_SEC, about raw at 20 Hz), then a pulse voice on each onset
+      at PULSE_MIN_SEMIS_TO_PLAY, re-armed below PULSE_REARM_SEMIS (cooldown)
+    `now` is whatever clock the caller uses (wall clock live, audio clock offline).
+    `group` / `pan`: voice group and stereo position of the plant (multi-plant mode).
+    `scale`: SCALES name or cents of the degrees, for both mappings (see Tuning).
+    """
     AMB_BASE_ROOT = 36  # C2
     H_MIN = 200
     H_MAX = 400
@@ -717,108 +3160,796 @@ async def serial_reader(synth):
     PULSE_BASE_ROOT = 24
     PULSE_SEMIS_MAX = 60
     PULSE_MIN_SEMIS_TO_PLAY = 12
+    PULSE_REARM_SEMIS = 11
     PULSE_COOLDOWN = 0.2
+    PULSE_MEDIAN_SEC = 0.002  # glitch rejection window (1 reading below 500 Hz)
+    PULSE_SMOOTH_SEC = 0.002  # EMA time constant
+
+    def __init__(self, synth, now=0.0, group=0, pan=0.5, scale="major"):
+        self.synth = synth
+        self.group = group
+        self.pan = pan
+        self.amb_tuning = Tuning(scale, base_root=self.AMB_BASE_ROOT, span=36, value_min=self.H_MIN, value_max=self.H_MAX)
+        self.pulse_tuning = Tuning(scale, base_root=self.PULSE_BASE_ROOT, span=self.PULSE_SEMIS_MAX)
+        self.ambient_midi = None  # note of the newest ambient voice
+        self.ambience = WindowMean(self.AMB_WINDOW_SEC, now=now)
+        self.bio_median = MedianFilter()
+        self.bio_smooth = EmaFilter(self.PULSE_SMOOTH_SEC)
+        self.onsets = OnsetDetector(self.PULSE_MIN_SEMIS_TO_PLAY, self.PULSE_REARM_SEMIS, self.PULSE_COOLDOWN)
+        self.last_t = None
+
+    def set_scale(self, scale):
+        """Retunes both mappings (tables rebuilt only if the scale changed)."""
+        self.amb_tuning.configure(scale=scale)
+        self.pulse_tuning.configure(scale=scale)
+
+    def process(self, hum_raw, bio_raw, now):
+        """Feeds one reading; returns the MIDI note of the pulse it triggered, or None."""
+        pulses = self.process_batch(np.array([now]), np.array([hum_raw]), np.array([bio_raw]))
+        return pulses[0][1] if pulses else None
+
+    def process_batch(self, ts, hums, bios):
+        """
+        Feeds a batch of readings (arrays, oldest first): mapping, filters and
+        onset detection run on the whole batch. Returns the [(t, midi)] pulses
+        it triggered.
+        """
+        n = len(ts)
+        if n == 1:
+            return self._process_one(ts.item(0), hums.item(0), bios.item(0))
+        if not n:
+            return []
+        if self.last_t is not None:
+            dt = (ts[-1] - self.last_t) / n
+        else:
+            dt = (ts[-1] - ts[0]) / (n - 1)
+        dt = max(float(dt), 1e-6)
+        self.last_t = float(ts[-1])
+
+        # ---- AMBIENCE ----
+        _, _, hum_semis = self.amb_tuning.map(hums)
+        for k, avg_h in self.ambience.process(ts, hums, hum_semis == 0):
+            self._ambience(avg_h, float(ts[k]))
+
+        # ---- PULSE ----
+        level = self.bio_median.process(bios, round(self.PULSE_MEDIAN_SEC / dt))
+        level = np.rint(self.bio_smooth.process(level, dt))
+        pulse_midi, _, pulse_semis = self.pulse_tuning.map(level)
+        pulses = []
+        for k in self.onsets.process(ts, pulse_semis):
+            now, midi = float(ts[k]), pulse_midi[k].item()
+            self.synth.add_pulse_voice(midi, pan=self.pan, stamp=now, group=self.group)
+            pulses.append((now, midi))
+        return pulses
+
+    def _process_one(self, t, hum, bio):
+        """
+        process_batch() of a single reading (the live 20 Hz case) with the
+        filters' scalar steps: same results, without setting up arrays of
+        one element.
+        """
+        dt = max(t - self.last_t if self.last_t is not None else 1.0, 1e-6)
+        self.last_t = t
+
+        _, hum_semis = self.amb_tuning.lookup(min(max(int(hum), 0), Tuning.ADC_MAX))
+        for _, avg_h in self.ambience.push(t, hum, hum_semis == 0):
+            self._ambience(avg_h, t)
+
+        level = self.bio_median.push(float(bio), round(self.PULSE_MEDIAN_SEC / dt))
+        level = round(self.bio_smooth.push(level, dt))
+        midi, semis = self.pulse_tuning.lookup(min(max(level, 0), Tuning.ADC_MAX))
+        if not self.onsets.push(t, semis):
+            return []
+        self.synth.add_pulse_voice(midi, pan=self.pan, stamp=t, group=self.group)
+        return [(t, midi)]
+
+    def _ambience(self, avg_h, t):
+        """A closed humidity window: one ambient voice, or None: the ambience stops."""
+        if avg_h is None:
+            self.synth.clear_ambient(self.group)
+            self.ambient_midi = None
+        else:
+            amb_midi, _ = self.amb_tuning.note(avg_h)
+            self.synth.add_ambient_voice_moving(amb_midi, volume=0.12, pan=self.pan, stamp=t, group=self.group)
+            self.ambient_midi = amb_midi
 
-    try:
-        ser = serial.Serial(PORT, BAUD, timeout=1)
-        print(f"Connected to Arduino on {PORT}")
-    except Exception as e:
-        print(f"⚠️  ERROR: unable to connect to Arduino on {PORT}")
-        print(f"   {e}")
-        print("   The program will continue without Arduino (WebSocket testing only)")
-        ser = None
-
-    hum_samples = []
-    amb_window_start = time.time()
-    zero_semis_streak = 0
-    amb_stopped_due_zero = False
-    last_pulse_trig = 0.0
 
-    try:
-        while True:
-            if ser:
-                line = ser.readline().decode("utf-8", errors="ignore").strip()
+# -----------------------------
+# SENSOR SAMPLE RING (reader thread → asyncio)
+# -----------------------------
+class SampleRing:
+    """
+    Bounded single-producer / single-consumer ring of timestamped
+    (hum_raw, bio_raw) readings in preallocated arrays. The producer only
+    moves `head`, the consumer only moves `tail`. When full, new readings
+    are dropped and counted (the consumer is expected to keep up).
+    """
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.t = np.zeros(capacity, dtype=np.float64)
+        self.hum = np.zeros(capacity, dtype=np.int32)
+        self.bio = np.zeros(capacity, dtype=np.int32)
+        self.head = 0  # total readings written
+        self.tail = 0  # total readings consumed
+        self.dropped = 0
+
+    def push(self, t, hum_raw, bio_raw) -> bool:
+        h = self.head
+        if h - self.tail >= self.capacity:
+            self.dropped += 1
+            return False
+        k = h % self.capacity
+        self.t[k] = t
+        self.hum[k] = hum_raw
+        self.bio[k] = bio_raw
+        self.head = h + 1
+        return True
+
+    def push_many(self, t, hum, bio) -> int:
+        """Vectorized push of whole arrays; returns how many fitted (rest dropped)."""
+        h = self.head
+        n = len(hum)
+        fit = min(n, self.capacity - (h - self.tail))
+        idx = np.arange(h, h + fit) % self.capacity
+        self.t[idx] = t if np.ndim(t) == 0 else t[:fit]
+        self.hum[idx] = hum[:fit]
+        self.bio[idx] = bio[:fit]
+        self.dropped += n - fit
+        self.head = h + fit
+        return fit
+
+    def pop_batch(self, max_n=None):
+        """Returns (t, hum, bio) copies of the pending readings, oldest first."""
+        lo, hi = self.tail, self.head
+        if max_n is not None:
+            hi = min(hi, lo + max_n)
+        idx = np.arange(lo, hi) % self.capacity
+        batch = (self.t[idx], self.hum[idx], self.bio[idx])
+        self.tail = hi
+        return batch
+
+    def __len__(self):
+        return self.head - self.tail
+
+
+# -----------------------------
+# BINARY SERIAL PROTOCOL
+# -----------------------------
+# Optional compact frame sent by the sketch (USE_BINARY_PROTOCOL), 6 bytes:
+#   0xA5 sync | seq u8 | hum (10 bit) + bio (10 bit) packed little endian
+#   in 3 bytes, top 4 bits zero | checksum = (seq + 3 data bytes) & 0xFF
+FRAME_SYNC = 0xA5
+FRAME_SIZE = 6
+
+def encode_frames(seq0, hum, bio):
+    """Packs readings into consecutive frames starting at sequence number seq0."""
+    hum = np.asarray(hum, dtype=np.uint32) & 0x3FF
+    bio = np.asarray(bio, dtype=np.uint32) & 0x3FF
+    packed = hum | (bio << 10)
+    frames = np.empty((len(hum), FRAME_SIZE), dtype=np.uint8)
+    frames[:, 0] = FRAME_SYNC
+    frames[:, 1] = (seq0 + np.arange(len(hum))) & 0xFF
+    frames[:, 2] = packed & 0xFF
+    frames[:, 3] = (packed >> 8) & 0xFF
+    frames[:, 4] = packed >> 16
+    frames[:, 5] = frames[:, 1:5].sum(axis=1, dtype=np.uint32) & 0xFF
+    return frames.tobytes()
+
+def decode_frames(data):
+    """
+    Finds every valid frame in `data` in one vectorized pass.
+    Returns (hum, bio, seq, end): int arrays of the decoded readings and the
+    offset after the last frame (or where unread bytes start to be kept).
+    Overlapping candidates (a sync byte inside a payload that also passes
+    the checksum) are resolved in favour of the earlier frame.
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    n = len(buf) - FRAME_SIZE + 1
+    empty = np.zeros(0, dtype=np.int64)
+    if n <= 0:
+        return empty, empty, empty, 0
+    pos = np.flatnonzero(buf[:n] == FRAME_SYNC)
+    if len(pos):
+        b = buf[pos[:, None] + np.arange(1, FRAME_SIZE)].astype(np.int64)
+        ok = ((b[:, 0] + b[:, 1] + b[:, 2] + b[:, 3]) & 0xFF == b[:, 4]) & (b[:, 3] < 16)
+        pos, b = pos[ok], b[ok]
+    if len(pos) > 1:
+        keep = np.ones(len(pos), dtype=bool)
+        keep[1:] = np.diff(pos) >= FRAME_SIZE
+        pos, b = pos[keep], b[keep]
+    if not len(pos):
+        # no frame: keep only a possible partial frame at the end
+        return empty, empty, empty, n
+    packed = b[:, 1] | (b[:, 2] << 8) | (b[:, 3] << 16)
+    return packed & 0x3FF, packed >> 10, b[:, 0], int(pos[-1]) + FRAME_SIZE
+
+
+# -----------------------------
+# SENSOR SOURCES
+# -----------------------------
+class SensorSource:
+    """
+    Base of the sensor inputs: a dedicated thread producing timestamped
+    (hum_raw, bio_raw) readings into `self.samples`, so the asyncio loop
+    (HTTP, WebSocket) never waits on the input. Subclasses implement
+    `_run()` and optionally `open()` / `close()`.
+    """
+    name = "source"
+
+    def __init__(self, capacity=4096):
+        self.samples = SampleRing(capacity)
+        self.lines = 0
+        self.parse_failures = 0
+        self.lost_frames = 0
+        self.connected = False
+        self._stop = threading.Event()
+        self._thread = None
+        self._rate_mark = (time.time(), 0)
+
+    def open(self) -> bool:
+        return True
+
+    def close(self):
+        pass
+
+    def start(self):
+        if not self.open():
+            return False
+        self.connected = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        if self.connected:
+            self.close()
+            self.connected = False
+
+    def _run(self):
+        raise NotImplementedError
+
+    def feed_line(self, line, now):
+        """Parses one text line; comments and timeouts (empty lines) are skipped."""
+        line = line.strip()
+        if not line or line.startswith("#"):
+            return
+        self.lines += 1
+        parts = line.split(",")
+        try:
+            hum_raw = int(parts[0])
+            bio_raw = int(parts[1])
+        except (ValueError, IndexError):
+            self.parse_failures += 1
+            return
+        self.samples.push(now, hum_raw, bio_raw)
+
+    def stats(self):
+        """Ingestion metrics; lines/s is measured since the previous call."""
+        now = time.time()
+        t0, lines0 = self._rate_mark
+        self._rate_mark = (now, self.lines)
+        return {
+            "source": self.name,
+            "connected": self.connected,
+            "lines": self.lines,
+            "lines_per_sec": (self.lines - lines0) / max(1e-9, now - t0),
+            "parse_failures": self.parse_failures,
+            "lost_frames": self.lost_frames,
+            "queue_depth": len(self.samples),
+            "dropped": self.samples.dropped,
+        }
+
+
+class SerialReader(SensorSource):
+    """
+    The Arduino (or any serial device, e.g. FakeSerialDevice.path). Reads
+    whatever is waiting in one call and decodes it as binary frames or
+    legacy "hum_raw,bio_raw" CSV lines. protocol="auto" accepts CSV and
+    switches to binary for good once two valid frames show up.
+    """
+    name = "serial"
+
+    def __init__(self, port="COM5", baud=9600, protocol="auto", capacity=4096):
+        super().__init__(capacity)
+        if protocol not in ("auto", "csv", "binary"):
+            raise ValueError(f"Unknown serial protocol '{protocol}' (use auto, csv or binary)")
+        self.port = port
+        self.baud = baud
+        self.protocol = protocol
+        self._pending = b""
+        self._last_seq = None
+
+    def open(self):
+        try:
+            self.ser = serial.Serial(self.port, self.baud, timeout=1)
+            print(f"Connected to Arduino on {self.port}")
+        except Exception as e:
+            print(f"⚠️  ERROR: unable to connect to Arduino on {self.port}")
+            print(f"   {e}")
+            print("   The program will continue without Arduino (WebSocket testing only)")
+            return False
+        return True
+
+    def close(self):
+        self.ser.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                # blocks up to the 1 s timeout for the first byte, then takes
+                # everything already received
+                raw = self.ser.read(max(1, self.ser.in_waiting))
+            except Exception as e:
+                print(f"⚠️  Serial read error: {e}")
+                break
+            if raw:
+                self.feed_bytes(raw, time.time())
+
+    def feed_bytes(self, data, now):
+        """Decodes a chunk of the byte stream (frames and/or CSV lines)."""
+        buf = self._pending + data
+        if self.protocol != "csv":
+            hum, bio, seq, end = decode_frames(buf)
+            if len(hum) >= 2 or (len(hum) and self.protocol == "binary"):
+                self.protocol = "binary"
+                prev = seq[0] - 1 if self._last_seq is None else self._last_seq
+                self.lost_frames += int(((np.diff(seq, prepend=prev) - 1) & 0xFF).sum())
+                self._last_seq = int(seq[-1])
+                self.lines += len(hum)
+                self.samples.push_many(now, hum, bio)
+            if self.protocol == "binary":
+                self._pending = buf[end:]
+                return
+        # CSV: complete lines only, the tail waits for the next chunk
+        cut = buf.rfind(b"\n") + 1
+        self._pending = buf[cut:]
+        for line in buf[:cut].decode("utf-8", errors="ignore").split("\n"):
+            self.feed_line(line, now)
+
+    def stats(self):
+        stats = super().stats()
+        stats["protocol"] = self.protocol
+        return stats
+
+
+def load_capture(path):
+    """
+    Loads a recorded session as an (N, 3) float64 array of (t_sec, hum_raw, bio_raw).
+    .npy: (N, 3) array, or (N, 2) sampled at 20 Hz. .csv/.txt: "t,hum,bio" or
+    "hum,bio" lines (20 Hz); "#" comments and a header line are skipped.
+    """
+    path = str(path)
+    if path.endswith(".npy"):
+        data = np.load(path).astype(np.float64)
+    else:
+        rows = []
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
                 if not line or line.startswith("#"):
-                    await asyncio.sleep(0.001)
                     continue
+                try:
+                    rows.append([float(x) for x in line.split(",")])
+                except ValueError:
+                    continue  # header
+        data = np.array(rows, dtype=np.float64)
+    if data.ndim != 2 or data.shape[1] not in (2, 3):
+        raise ValueError(f"{path}: expected (t, hum, bio) or (hum, bio) columns")
+    if data.shape[1] == 2:
+        t = np.arange(data.shape[0]) / 20.0
+        data = np.column_stack((t, data))
+    return data
+
+
+class ReplaySource(SensorSource):
+    """Replays a capture (see load_capture) at its own timing, `speed` times faster."""
+    name = "replay"
+
+    def __init__(self, path, speed=1.0, loop=False, capacity=4096):
+        super().__init__(capacity)
+        self.path = path
+        self.speed = float(speed)
+        self.loop = loop
+
+    def open(self):
+        try:
+            self.data = load_capture(self.path)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  ERROR: unable to load capture {self.path}: {e}")
+            return False
+        print(f"Replaying {self.path} ({len(self.data)} readings, {self.speed:g}x)")
+        return len(self.data) > 0
+
+    def _run(self):
+        t = self.data[:, 0] - self.data[0, 0]
+        hum = self.data[:, 1].astype(int).tolist()
+        bio = self.data[:, 2].astype(int).tolist()
+        span = t[-1] + (np.median(np.diff(t)) if len(t) > 1 else 0.05)
+        start = time.time()
+        offsets = (t / self.speed).tolist()
+        while not self._stop.is_set():
+            for k, off in enumerate(offsets):
+                wait = start + off - time.time()
+                if wait > 0.001:
+                    if self._stop.wait(wait):
+                        return
+                self.lines += 1
+                self.samples.push(time.time(), hum[k], bio[k])
+            if not self.loop:
+                return
+            start += span / self.speed
 
-                parts = line.split(",")
-                if len(parts) < 2:
-                    await asyncio.sleep(0.001)
-                    continue
 
-                try:
-                    hum_raw = int(parts[0])
-                    bio_raw = int(parts[1])
-                except:
-                    await asyncio.sleep(0.001)
+SYNTHETIC_NOISE = ("clean", "white", "spiky", "dropout")
+
+def synthetic_signal(t, rng, noise="spiky"):
+    """
+    Plant-like (hum_raw, bio_raw) int arrays at times `t`: humidity drifting
+    over ~90 s, bio around 120. Noise profiles: clean (no noise), white
+    (gaussian), spiky (white + bio spikes that trigger pulses), dropout
+    (spiky + short runs of zero humidity, which stop the ambience).
+    """
+    hum = 300 + 80 * np.sin(2 * np.pi * t / 90.0)
+    bio = 120 + 40 * np.sin(2 * np.pi * t / 7.0)
+    if noise != "clean":
+        hum = hum + rng.normal(0, 4, t.shape)
+        bio = bio + rng.normal(0, 30, t.shape)
+    if noise in ("spiky", "dropout"):
+        spikes = rng.random(t.shape) < 0.08
+        bio[spikes] += rng.uniform(300, 800, int(spikes.sum()))
+    if noise == "dropout":
+        hum[(t % 30.0) > 29.0] = 0
+    return np.clip(hum, 0, 1023).astype(int), np.clip(bio, 0, 1023).astype(int)
+
+
+class SyntheticSource(SensorSource):
+    """Generated readings at `rate_hz` (20 Hz like the sketch, up to several kHz)."""
+    name = "synthetic"
+
+    def __init__(self, rate_hz=20.0, noise="spiky", seed=None, capacity=4096):
+        super().__init__(capacity)
+        if noise not in SYNTHETIC_NOISE:
+            raise ValueError(f"Unknown noise profile '{noise}' (use one of {', '.join(SYNTHETIC_NOISE)})")
+        self.rate_hz = float(rate_hz)
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+
+    def _run(self):
+        # Readings are produced in small batches: every wakeup emits all the
+        # readings due since the start, each stamped with its due time
+        start = time.time()
+        produced = 0
+        while not self._stop.wait(0.002):
+            due = int((time.time() - start) * self.rate_hz) + 1  # readings with t <= now
+            if due <= produced:
+                continue
+            t = np.arange(produced, due) / self.rate_hz
+            hum, bio = synthetic_signal(t, self.rng, self.noise)
+            for ts, h, b in zip((start + t).tolist(), hum.tolist(), bio.tolist()):
+                self.samples.push(ts, h, b)
+            self.lines += due - produced
+            produced = due
+
+
+class FakeSerialDevice:
+    """
+    Local pty pretending to be the Arduino: writes synthetic readings at
+    `rate_hz` as CSV lines or binary frames (`protocol`); open `self.path`
+    with SerialReader to exercise the real serial path (POSIX only).
+    """
+    def __init__(self, rate_hz=20.0, noise="spiky", seed=None, protocol="csv"):
+        import pty  # POSIX only
+        self.master, self.slave = pty.openpty()
+        self.path = os.ttyname(self.slave)
+        self.rate_hz = float(rate_hz)
+        self.noise = noise
+        self.protocol = protocol
+        self.rng = np.random.default_rng(seed)
+        self.lines_written = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=2.0)
+        os.close(self.master)
+        os.close(self.slave)
+
+    def _run(self):
+        start = time.time()
+        produced = 0
+        while not self._stop.wait(0.002):
+            due = int((time.time() - start) * self.rate_hz) + 1  # readings with t <= now
+            if due <= produced:
+                continue
+            t = np.arange(produced, due) / self.rate_hz
+            hum, bio = synthetic_signal(t, self.rng, self.noise)
+            if self.protocol == "binary":
+                data = encode_frames(produced, hum, bio)
+            else:
+                data = "".join(f"{h},{b}\r\n" for h, b in zip(hum.tolist(), bio.tolist())).encode()
+            try:
+                os.write(self.master, data)
+            except OSError:
+                return
+            self.lines_written += due - produced
+            produced = due
+
+
+# -----------------------------
+# PLANTS (one per sensor device)
+# -----------------------------
+class Plant:
+    """
+    One sensor device and the state that belongs to it: its SensorSource
+    (own reader thread), its voice group and stereo position in the shared
+    CombinedSynth, its loop recording and the loops it plays. Every plant is
+    mixed by the same audio engine; single-plant setups have one Plant.
+    """
+    def __init__(self, name, source, group=0, pan=0.5, scale="major"):
+        self.name = name
+        self.source = source
+        self.group = group
+        self.pan = pan
+        self.scale = scale
+
+        # Recording state
+        self.is_recording = False
+        self.rec_start_t = 0.0
+        self.rec_events = []
+        self.recording_lock = threading.Lock()
+
+        # Loops playing ({"id", "events", "dur"}), stored in the LoopLibrary
+        self.loops = []
+        self.loops_lock = threading.Lock()
+
+        # Latest mapping results, for /plants and the WebSocket namespace
+        self.mapper = None
+        self.readings = 0
+        self.pulses = 0
+        self.last_hum = None
+        self.last_bio = None
+        self.last_pulse_midi = None
+
+    def start_recording(self):
+        with self.recording_lock:
+            if self.is_recording:
+                return False
+            self.is_recording = True
+            self.rec_start_t = time.time()
+            self.rec_events = []
+            return True
+
+    def stop_recording(self):
+        """Ends the recording: (events, duration), or None if not recording."""
+        with self.recording_lock:
+            if not self.is_recording:
+                return None
+            self.is_recording = False
+            dur = max(LOOP_MIN_DUR, time.time() - self.rec_start_t)
+            return loop_events(self.rec_events), dur
+
+    def play_loop(self, synth, loop):
+        """Adds a loop (the oldest playing one stops past MAX_LOOPS); False if already playing."""
+        with self.loops_lock:
+            if any(lp["id"] == loop["id"] for lp in self.loops):
+                return False
+            self.loops.append(loop)
+            if len(self.loops) > MAX_LOOPS:
+                self.loops.pop(0)
+            synth.set_loops(self.loops, group=self.group, pan=self.pan)
+        return True
+
+    def stop_loops(self, synth, loop_id=None):
+        """Stops one loop (or all of them); False if it was not playing."""
+        with self.loops_lock:
+            kept = [] if loop_id is None else [lp for lp in self.loops if lp["id"] != loop_id]
+            if len(kept) == len(self.loops):
+                return False
+            self.loops[:] = kept
+            synth.set_loops(self.loops, group=self.group, pan=self.pan)
+        return True
+
+    def playing(self):
+        with self.loops_lock:
+            return [lp["id"] for lp in self.loops]
+
+    def set_scale(self, scale):
+        """Retunes the plant's mapping (ValueError on a bad scale, nothing changed)."""
+        scale_offsets(scale, 12)
+        self.scale = list(scale) if not isinstance(scale, str) else scale
+        if self.mapper is not None:
+            self.mapper.set_scale(self.scale)
+
+    def tuning(self):
+        """Scale and both mapping tables' parameters (JSON-ready)."""
+        out = {"name": self.name, "scale": self.scale}
+        if self.mapper is not None:
+            out["ambient"] = self.mapper.amb_tuning.describe()
+            out["pulse"] = self.mapper.pulse_tuning.describe()
+        return out
+
+    def status(self):
+        """Plant summary (JSON-ready)."""
+        return {
+            "type": "plant", "name": self.name, "group": self.group, "pan": self.pan,
+            "connected": self.source.connected,
+            "readings": self.readings, "pulses": self.pulses,
+            "hum": self.last_hum, "bio": self.last_bio,
+            "ambient_midi": self.mapper.ambient_midi if self.mapper is not None else None,
+            "pulse_midi": self.last_pulse_midi, "scale": self.scale,
+            "recording": self.is_recording, "loops": self.playing(),
+        }
+
+
+def plant_pans(n):
+    """Stereo positions spreading `n` plants across the room (centre for one)."""
+    if n <= 1:
+        return [0.5] * n
+    return [0.15 + 0.7 * k / (n - 1) for k in range(n)]
+
+# Plants by name, in configuration order (filled by main)
+plants = {}
+
+
+async def serial_reader(synth, reader=None, batch_interval=0.01, plant=None):
+    """
+    Consumes a plant's SensorSource readings in batches and generates audio.
+    One task per plant; without `plant`, `reader` is wrapped in a single one.
+    """
+    if plant is None:
+        plant = Plant("plant", reader if reader is not None else SerialReader())
+    reader = plant.source
+    reader.start()
+
+    mapper = plant.mapper = SensorMapper(synth, now=time.time(), group=plant.group, pan=plant.pan, scale=plant.scale)
+
+    try:
+        while True:
+            await asyncio.sleep(batch_interval)
+            ts, hums, bios = reader.samples.pop_batch()
+            if not len(ts):
+                continue
+            plant.readings += len(ts)
+            plant.last_hum = int(hums[-1])
+            plant.last_bio = int(bios[-1])
+
+            # Notes only while audio is playing
+            with audio_state_lock:
+                if not is_audio_playing:
                     continue
+                pulses = mapper.process_batch(ts, hums, bios)
 
-                now = time.time()
-
-                # ---- AMBIENCE (only if audio is playing) ----
-                with audio_state_lock:
-                    if is_audio_playing:
-                        _, hum_semis_now = humidity_to_note(hum_raw, base_root=AMB_BASE_ROOT, h_min=H_MIN, h_max=H_MAX)
-
-                        if hum_semis_now == 0:
-                            zero_semis_streak += 1
-                        else:
-                            zero_semis_streak = 0
-                            amb_stopped_due_zero = False
-
-                        if zero_semis_streak >= 2:
-                            if not amb_stopped_due_zero:
-                                synth.clear_ambient()
-                                hum_samples.clear()
-                                amb_window_start = now
-                                amb_stopped_due_zero = True
-                        else:
-                            hum_samples.append(hum_raw)
-
-                            if (now - amb_window_start) >= AMB_WINDOW_SEC and hum_samples:
-                                avg_h = sum(hum_samples) / len(hum_samples)
-                                amb_midi, _ = humidity_to_note(avg_h, base_root=AMB_BASE_ROOT, h_min=H_MIN, h_max=H_MAX)
-                                synth.add_ambient_voice_moving(amb_midi, volume=0.12, pan=0.5)
-                                hum_samples.clear()
-                                amb_window_start = now
-
-                        # ---- PULSE (only if audio is playing) ----
-                        _, pulse_semis_raw = midi_from_adc_semitones(bio_raw, base_root=PULSE_BASE_ROOT, semis_max=PULSE_SEMIS_MAX)
-                        pulse_semis = quantize_to_major(pulse_semis_raw, PULSE_SEMIS_MAX)
-                        pulse_midi = PULSE_BASE_ROOT + pulse_semis
-
-                        if (pulse_semis >= PULSE_MIN_SEMIS_TO_PLAY) and ((now - last_pulse_trig) >= PULSE_COOLDOWN):
-                            synth.add_pulse_voice(pulse_midi)
-                            last_pulse_trig = now
-
-                            with recording_lock:
-                                if is_recording:
-                                    rec_events.append((now - rec_start_t, pulse_midi))
-
-            await asyncio.sleep(0.001)
+            if pulses:
+                plant.pulses += len(pulses)
+                plant.last_pulse_midi = pulses[-1][1]
+                with plant.recording_lock:
+                    if plant.is_recording:
+                        plant.rec_events.extend((now - plant.rec_start_t, midi) for now, midi in pulses)
 
-    except KeyboardInterrupt:
+    except (KeyboardInterrupt, asyncio.CancelledError):
         pass
     finally:
-        if ser:
-            ser.close()
+        reader.stop()
+
+
+# -----------------------------
+# OFFLINE RENDER (no audio device)
+# -----------------------------
+def render_offline(synth, readings=(), duration=None, wav_path=None):
+    """
+    Renders a plant session as fast as the CPU allows, block by block through
+    synth.render() (same voices/reverb/limiter as the live callback).
+
+    readings: iterable of (t_sec, hum_raw, bio_raw) sorted by time, t measured
+              from the start of the render; fed to a SensorMapper with the same
+              semantics as serial_reader (a reading is applied before the first
+              block that starts at or after it).
+    duration: seconds to render (default: up to the last reading + 1 s).
+    wav_path: optional 16-bit stereo WAV output.
+
+    Returns a (frames, 2) float32 array.
+    """
+    readings = np.asarray(list(readings), dtype=np.float64).reshape(-1, 3)
+    if duration is None:
+        duration = (readings[-1, 0] + 1.0) if len(readings) else 1.0
+
+    sr = synth.sr
+    B = synth.blocksize
+    total = int(round(duration * sr))
+    out = np.zeros((total, 2), dtype=np.float32)
+    mapper = SensorMapper(synth, now=0.0)
+
+    k = 0
+    pos = 0
+    while pos < total:
+        block_t = pos / sr
+        end = int(np.searchsorted(readings[:, 0], block_t, side="right"))
+        if end > k:
+            t, hum, bio = readings[k:end].T
+            mapper.process_batch(t, hum, bio)
+            k = end
+
+        frames = min(B, total - pos)
+        bufL, bufR = synth.render(frames)
+        out[pos:pos + frames, 0] = bufL
+        out[pos:pos + frames, 1] = bufR
+        pos += frames
+
+    if wav_path:
+        write_wav(wav_path, out, sr)
+    return out
+
+def write_wav(path, data, sr):
+    """Writes float samples in [-1, 1] as 16-bit PCM WAV."""
+    pcm = (np.clip(data, -1.0, 1.0) * 32767.0).astype("<i2")
+    with wave.open(str(path), "wb") as wf:
+        wf.setnchannels(pcm.shape[1] if pcm.ndim > 1 else 1)
+        wf.setsampwidth(2)
+        wf.setframerate(int(sr))
+        wf.writeframes(pcm.tobytes())
 
 
 # -----------------------------
 # MAIN
 # -----------------------------
-async def main():
+async def blocksize_governor(synth, interval=0.5):
+    """Low-latency mode: lets the synth re-pick its blocksize from the measured load."""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        # reopening the stream waits for the running callback: off the event loop
+        new = await loop.run_in_executor(None, synth.adapt_blocksize)
+        if new is not None:
+            print(f"[AUDIO] Blocksize → {new} frames ({new / synth.sr * 1e3:.1f} ms)")
+
+
+async def main(source=None, low_latency=False, loop_library=LOOP_LIBRARY_PATH, workers=False,
+               sessions=SESSIONS_PATH, session_format="wav", session_minutes=60.0, scale="major",
+               polyphony_governor=True):
+    """
+    `source`: the SensorSource feeding the mapping (default: Arduino on COM5),
+              or {plant name: SensorSource} for several plants.
+    `low_latency`: adaptive blocksize (128–2048 frames) instead of fixed 2048.
+    `loop_library`: file the recorded loops are kept in across restarts.
+    `workers`: render the ambient / pulse buses in two worker processes.
+    `sessions` / `session_format` / `session_minutes`: where and how
+                POST /start_session archives the mix (new file every N minutes).
+    `scale`: scale of the sensor → note mapping (SCALES name or cents), see POST /tuning.
+    `polyphony_governor`: steal voices when rendering nears the block deadline
+                          (in-callback rendering only, off with `workers`).
+    """
     global synth
 
+    if source is None:
+        source = SerialReader(port="COM5", baud=9600)
+    sources = source if isinstance(source, dict) else {"plant1": source}
+    n_plants = len(sources)
+    max_voices = max(24, MAX_VOICES_PER_PLANT * n_plants)
+
     # Create synth
-    synth = CombinedSynth(max_ambient_voices=24, max_pulse_voices=24)
+    synth = CombinedSynth(max_ambient_voices=max_voices, max_pulse_voices=max_voices,
+                          low_latency=low_latency, workers=workers,
+                          polyphony_governor=polyphony_governor and not workers)
     synth.start()
     print("✅ Audio engine activated (sounddevice)")
+    if workers:
+        print("✅ Ambient / pulse buses rendered in worker processes")
+    if low_latency:
+        asyncio.create_task(blocksize_governor(synth))
+        print(f"✅ Low-latency mode: blocksize adapts between {synth.blocksizes[0]} and {synth.blocksizes[-1]} frames")
+    if synth.polyphony_governor:
+        print(f"✅ Polyphony governor: voices stolen above {synth.steal_load:.0%} of the block deadline")
 
-    # Start loop player
-    threading.Thread(target=loop_player_thread, args=(synth,), daemon=True).start()
-    print("✅ Loop player activated")
+    # Loops play from the audio callback (sample-accurate, no player thread)
+    print("✅ Loop scheduler on the audio timeline")
 
     # Start WebSocket server
     ws_server = await websockets.serve(websocket_handler, "localhost", 8765)
@@ -830,6 +3961,14 @@ async def main():
     # Configure HTTP server
     app = web.Application()
     app['synth'] = synth
+    for (name, src), pan in zip(sources.items(), plant_pans(n_plants)):
+        plants[name] = Plant(name, src, group=len(plants), pan=pan, scale=scale)
+    app['plants'] = plants
+    print(f"✅ Plants: {', '.join(f'{p.name} ({p.source.name}, pan {p.pan:.2f})' for p in plants.values())}")
+    app['loops'] = library = LoopLibrary(loop_library)
+    print(f"✅ Loop library: {len(library)} loops in {library.path}")
+    app['recorder'] = synth.recorder = SessionRecorder(sessions, samplerate=synth.sr, fmt=session_format,
+                                                       max_seconds=session_minutes * 60.0)
 
     # Routes
     app.router.add_post('/start', handle_start)
@@ -838,6 +3977,31 @@ async def main():
     app.router.add_post('/stop_rec', handle_stop_rec)
     app.router.add_post('/clear_loops', handle_clear_loops)
     app.router.add_post('/clear_ambient', handle_clear_ambient)
+    app.router.add_get('/loops', handle_list_loops)
+    app.router.add_post('/loops', handle_save_loop)
+    app.router.add_get(r'/loops/{id:\d+}', handle_get_loop)
+    app.router.add_post(r'/loops/{id:\d+}/load', handle_load_loop)
+    app.router.add_delete(r'/loops/{id:\d+}', handle_delete_loop)
+    app.router.add_get('/viz_stats', handle_viz_stats)
+    app.router.add_get('/serial_stats', handle_serial_stats)
+    app.router.add_get('/metrics', handle_metrics)
+    app.router.add_post('/start_session', handle_start_session)
+    app.router.add_post('/stop_session', handle_stop_session)
+    app.router.add_get('/session_stats', handle_session_stats)
+    app.router.add_get('/tuning', handle_tuning)
+    app.router.add_post('/tuning', handle_tuning)
+
+    # Per-plant namespace: same handlers, acting on one plant only
+    app.router.add_get('/plants', handle_plants)
+    app.router.add_post('/plants/{plant}/start_rec', handle_start_rec)
+    app.router.add_post('/plants/{plant}/stop_rec', handle_stop_rec)
+    app.router.add_post('/plants/{plant}/clear_loops', handle_clear_loops)
+    app.router.add_post('/plants/{plant}/clear_ambient', handle_clear_ambient)
+    app.router.add_get('/plants/{plant}/loops', handle_list_loops)
+    app.router.add_post(r'/plants/{plant}/loops/{id:\d+}/load', handle_load_loop)
+    app.router.add_get('/plants/{plant}/serial_stats', handle_serial_stats)
+    app.router.add_get('/plants/{plant}/tuning', handle_tuning)
+    app.router.add_post('/plants/{plant}/tuning', handle_tuning)
 
     # CORS preflight
     app.router.add_options('/start', handle_options)
@@ -846,6 +4010,18 @@ async def main():
     app.router.add_options('/stop_rec', handle_options)
     app.router.add_options('/clear_loops', handle_options)
     app.router.add_options('/clear_ambient', handle_options)
+    app.router.add_options('/loops', handle_options)
+    app.router.add_options(r'/loops/{id:\d+}', handle_options)
+    app.router.add_options(r'/loops/{id:\d+}/load', handle_options)
+    app.router.add_options('/start_session', handle_options)
+    app.router.add_options('/stop_session', handle_options)
+    app.router.add_options('/tuning', handle_options)
+    app.router.add_options('/plants/{plant}/start_rec', handle_options)
+    app.router.add_options('/plants/{plant}/stop_rec', handle_options)
+    app.router.add_options('/plants/{plant}/clear_loops', handle_options)
+    app.router.add_options('/plants/{plant}/clear_ambient', handle_options)
+    app.router.add_options(r'/plants/{plant}/loops/{id:\d+}/load', handle_options)
+    app.router.add_options('/plants/{plant}/tuning', handle_options)
 
     # Start HTTP server
     runner = web.AppRunner(app)
@@ -859,24 +4035,97 @@ async def main():
     print("🔊 Audio: PC speakers (sounddevice - HQ)")
     print("📡 Commands: HTTP POST on localhost:8080")
     print("📊 Visualization: WebSocket on localhost:8765")
-    print(f"🎵 Max loops: {MAX_LOOPS}")
-    print(f"🌿 Max ambient voices: 24")
+    print(f"🎵 Max loops playing: {MAX_LOOPS}")
+    print(f"🌿 Plants: {n_plants} | max voices per bus: {max_voices}")
     print("\n📋HTTP endpoints:")
     print("   POST /start        → Start audio + test")
     print("   POST /stop         → Stop audio")
     print("   POST /start_rec    → Start recording")
     print("   POST /stop_rec     → Stop recording")
     print("   POST /clear_loops  → Clear loops")
+    print("   GET  /loops        → Stored loops (POST stores one)")
+    print("   POST /loops/{id}/load → Play a stored loop (DELETE /loops/{id} deletes it)")
     print("   POST /clear_ambient → Clear ambient")
+    print("   GET  /viz_stats    → WebSocket bandwidth per client")
+    print("   GET  /serial_stats → Serial lines/s, parse failures, queue depth")
+    print("   GET  /metrics      → Prometheus: sensor → speaker latency, callback time, underruns")
+    print("   POST /start_session → Archive the mix to disk (POST /stop_session, GET /session_stats)")
+    print("   GET  /plants       → Plants; /plants/{name}/start_rec, stop_rec, ... act on one plant")
+    print("   WS   /plants/{name} → Visualization + that plant's status")
     print("\n⚠️  Press Ctrl+C to exit\n")
 
-    # Start serial reader
-    await serial_reader(synth)
+    # One reader (own thread) + batch consumer per plant
+    await asyncio.gather(*(serial_reader(synth, plant=plant) for plant in plants.values()))
+
+
+def parse_args(argv=None):
+    """Command line of the controller."""
+    import argparse
+    parser = argparse.ArgumentParser(description="Live Planting audio controller")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--port", help="serial port of the Arduino (default COM5)")
+    group.add_argument("--replay", metavar="PATH", help="replay a CSV/NPY capture instead of the Arduino")
+    group.add_argument("--synthetic", metavar="HZ", type=float, help="generated readings at HZ")
+    group.add_argument("--fake-serial", metavar="HZ", type=float, help="generated readings through a local pty serial device")
+    parser.add_argument("--baud", type=int, default=9600, help="serial baud rate (115200 for the binary sketch)")
+    parser.add_argument("--protocol", choices=("auto", "csv", "binary"), default="auto", help="serial data format")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed factor (default 1x)")
+    parser.add_argument("--noise", choices=SYNTHETIC_NOISE, default="spiky", help="synthetic noise profile")
+    parser.add_argument("--low-latency", action="store_true", help="adaptive 128–2048 frame blocks instead of fixed 2048")
+    parser.add_argument("--loops", metavar="PATH", default=LOOP_LIBRARY_PATH, help=f"loop library file (default {LOOP_LIBRARY_PATH})")
+    group.add_argument("--plant", metavar="[NAME=]PORT", action="append", help="one plant per serial port (repeat for each plant)")
+    parser.add_argument("--plants", metavar="N", type=int, default=1, help="N simulated plants (with --replay / --synthetic / --fake-serial)")
+    parser.add_argument("--workers", action="store_true", help="render the ambient / pulse buses in two worker processes")
+    parser.add_argument("--fixed-polyphony", action="store_true", help="no CPU-aware voice stealing (voices capped by count only)")
+    parser.add_argument("--sessions", metavar="DIR", default=SESSIONS_PATH, help=f"session recordings directory (default {SESSIONS_PATH})")
+    parser.add_argument("--session-format", choices=SessionRecorder.FORMATS, default="wav", help="session recording format (flac needs soundfile)")
+    parser.add_argument("--session-minutes", type=float, default=60.0, help="start a new session file every N minutes")
+    parser.add_argument("--scale", default="major", help=f"note mapping scale: {', '.join(SCALES)} or comma-separated cents (e.g. 0,250,500,700,950)")
+    args = parser.parse_args(argv)
+    if args.scale not in SCALES:
+        try:
+            args.scale = [float(c) for c in args.scale.split(",")]
+            scale_offsets(args.scale, 12)
+        except ValueError as e:
+            parser.error(f"--scale: {e}")
+    if args.plants > 1 and not (args.replay or args.synthetic or args.fake_serial):
+        parser.error("--plants needs a simulated source (--replay, --synthetic or --fake-serial); use --plant for serial ports")
+    return args
+
+
+def source_from_args(args, seed=None):
+    """Sensor source chosen on the command line (default: Arduino on COM5)."""
+    if args.replay:
+        return ReplaySource(args.replay, speed=args.speed, loop=True)
+    if args.synthetic:
+        return SyntheticSource(rate_hz=args.synthetic, noise=args.noise, seed=seed)
+    if args.fake_serial:
+        protocol = "binary" if args.protocol == "binary" else "csv"
+        device = FakeSerialDevice(rate_hz=args.fake_serial, noise=args.noise, seed=seed, protocol=protocol).start()
+        print(f"Fake serial device on {device.path} ({protocol})")
+        return SerialReader(port=device.path, baud=115200, protocol=args.protocol)
+    return SerialReader(port=args.port or "COM5", baud=args.baud, protocol=args.protocol)
+
+
+def plants_from_args(args):
+    """{plant name: SensorSource} from --plant NAME=PORT ... or --plants N."""
+    if args.plant:
+        sources = {}
+        for k, spec in enumerate(args.plant):
+            name, _, port = spec.rpartition("=")
+            sources[name or f"plant{k + 1}"] = SerialReader(port=port, baud=args.baud, protocol=args.protocol)
+        return sources
+    return {f"plant{k + 1}": source_from_args(args, seed=k if args.plants > 1 else None)
+            for k in range(max(1, args.plants))}
 
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        args = parse_args()
+        asyncio.run(main(plants_from_args(args), low_latency=args.low_latency,
+                         loop_library=args.loops, workers=args.workers, sessions=args.sessions,
+                         session_format=args.session_format, session_minutes=args.session_minutes,
+                         scale=args.scale, polyphony_governor=not args.fixed_polyphony))
     except KeyboardInterrupt:
         print("\n🛑 Shutting down...")
         print("✅ All closed. Goodbye!")
@@ -0,0 +1,1152 @@
+"""
+🌱 Live Planting - Benchmarks
+=============================
+
+Offline measurements of the audio engine, run from the repository root:
+
+    python benchmarks.py reverb
+    python benchmarks.py callback --json callback.json   # machine-readable results
+
+Benchmarks:
+- reverb     → per-block cost of SchroederReverb + accuracy vs the per-sample reference
+- oscillator → wavetable vs np.sin partials: accuracy and synth cost per voice count
+- alloc      → allocations per steady-state callback (scratch counter + tracemalloc)
+- offline    → headless render of a synthetic plant session: realtime factor
+- callback   → _callback cost vs the real-time deadline over a config matrix
+- contention → callback jitter while a control thread floods voice commands (lock vs command ring)
+- workers    → in-callback rendering vs multiprocess bus workers at high polyphony (paced in real time)
+- sensor     → sensor → mapping throughput and latency from synthetic / fake-serial sources at 20 Hz–kHz
+- broadcast  → viz frame rate to 50–400 WebSocket viewers with stalled clients (sequential vs fan-out)
+- loops      → loop library: store, reopen (index only) and load cost for 100–1000 loops, bytes per event
+- timeline   → loop scheduling cost per block for 10–1000 playing loops (per-loop scan vs merged timeline)
+- plants     → multi-plant mode: mapping + rendering cost for 1–12 plants, plants per core
+- recorder   → callback cost with the session recorder off / on / on a slow disk (paced in real time)
+- tuning     → reading → note mapping: per-reading functions vs tuning tables vs one batch lookup, table rebuild cost
+- conditioning → previous per-reading mapping vs streaming conditioning stage at 20 Hz … 10 kHz: cost, pulses/s, state size
+- governor   → voice storm with / without the CPU-aware polyphony governor: blocks over deadline, polyphony, steals
+"""
+
+import io, os, sys, time, json, socket, asyncio, argparse, contextlib, itertools, platform, threading, tracemalloc
+import numpy as np
+
+import audio_controller_http as ac
+
+
+# -----------------------------
+# HELPERS
+# -----------------------------
+def timed(fn, repeats):
+    """Runs fn() `repeats` times, returns the list of durations in seconds."""
+    out = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        out.append(time.perf_counter() - t0)
+    return out
+
+def summarize(durations):
+    d = np.asarray(durations, dtype=np.float64)
+    return {
+        "p50_ms": float(np.percentile(d, 50) * 1e3),
+        "p99_ms": float(np.percentile(d, 99) * 1e3),
+        "max_ms": float(d.max() * 1e3),
+    }
+
+
+# -----------------------------
+# REVERB
+# -----------------------------
+class RefComb(ac.Comb):
+    """Original per-sample comb (reference for accuracy checks)."""
+    def process(self, x):
+        y = np.empty_like(x, dtype=np.float32)
+        buf, i, fb, n = self.buf, self.i, self.fb, self.buf.shape[0]
+        for k in range(x.shape[0]):
+            out = buf[i]
+            buf[i] = float(x[k]) + fb * out
+            y[k] = out
+            i += 1
+            if i >= n:
+                i = 0
+        self.i = i
+        return y
+
+class RefAllpass(ac.Allpass):
+    """Original per-sample allpass (reference for accuracy checks)."""
+    def process(self, x):
+        y = np.empty_like(x, dtype=np.float32)
+        buf, i, g, n = self.buf, self.i, self.g, self.buf.shape[0]
+        for k in range(x.shape[0]):
+            b = buf[i]
+            inp = float(x[k])
+            out = -g * inp + b
+            buf[i] = inp + g * out
+            y[k] = out
+            i += 1
+            if i >= n:
+                i = 0
+        self.i = i
+        return y
+
+class RefReverb(ac.SchroederReverb):
+    """Original per-sample Schroeder reverb (reference for accuracy checks)."""
+    def __init__(self, sr):
+        super().__init__(sr)
+        for bank in (self.combL, self.combR):
+            for k, c in enumerate(bank):
+                bank[k] = RefComb(c.buf.shape[0], c.fb)
+        for bank in (self.apL, self.apR):
+            for k, ap in enumerate(bank):
+                bank[k] = RefAllpass(ap.buf.shape[0], ap.g)
+
+    def _lp(self, x, z):
+        a = float(self.pre_lp)
+        y = np.empty_like(x, dtype=np.float32)
+        y0 = float(z)
+        b = 1.0 - a
+        for i in range(x.shape[0]):
+            y0 = a * y0 + b * float(x[i])
+            y[i] = y0
+        return y, y0
+
+    def process(self, xL, xR):
+        inL, self.zL = self._lp(xL, self.zL)
+        inR, self.zR = self._lp(xR, self.zR)
+
+        yL = np.zeros_like(inL, dtype=np.float32)
+        yR = np.zeros_like(inR, dtype=np.float32)
+        for c in self.combL:
+            yL += c.process(inL)
+        for c in self.combR:
+            yR += c.process(inR)
+
+        yL *= (1.0 / len(self.combL))
+        yR *= (1.0 / len(self.combR))
+
+        for ap in self.apL:
+            yL = ap.process(yL)
+        for ap in self.apR:
+            yR = ap.process(yR)
+
+        outL = self.dry * xL + self.wet * yL
+        outR = self.dry * xR + self.wet * yR
+        return outL.astype(np.float32), outR.astype(np.float32)
+
+
+def bench_reverb(sr=48000, blocksize=2048, blocks=200):
+    rng = np.random.default_rng(0)
+    # Sparse pulses + noise, close to what the pulse bus feeds the reverb
+    sig = (rng.standard_normal(sr * 2) * 0.05).astype(np.float32)
+    sig[::4800] += 0.8
+    n_blocks = sig.shape[0] // blocksize
+
+    fast, ref = ac.SchroederReverb(sr), RefReverb(sr)
+    max_err = 0.0
+    for b in range(n_blocks):
+        x = sig[b * blocksize:(b + 1) * blocksize]
+        fL, fR = fast.process(x, x[::-1].copy())
+        rL, rR = ref.process(x, x[::-1].copy())
+        max_err = max(max_err, float(np.max(np.abs(fL - rL))), float(np.max(np.abs(fR - rR))))
+
+    x = sig[:blocksize]
+    rev = ac.SchroederReverb(sr)
+    t_fast = summarize(timed(lambda: rev.process(x, x), blocks))
+    rev_ref = RefReverb(sr)
+    t_ref = summarize(timed(lambda: rev_ref.process(x, x), max(5, blocks // 20)))
+
+    deadline_ms = blocksize / sr * 1e3
+    print(f"🔊 Reverb @ {sr} Hz, block {blocksize} (deadline {deadline_ms:.1f} ms)")
+    print(f"   vectorized : p50 {t_fast['p50_ms']:.3f} ms | p99 {t_fast['p99_ms']:.3f} ms")
+    print(f"   per-sample : p50 {t_ref['p50_ms']:.3f} ms | p99 {t_ref['p99_ms']:.3f} ms")
+    print(f"   speedup    : x{t_ref['p50_ms'] / max(1e-9, t_fast['p50_ms']):.1f}")
+    print(f"   max |diff| : {max_err:.3g} over {n_blocks} blocks")
+    return {"fast": t_fast, "reference": t_ref, "max_abs_diff": max_err}
+
+
+# -----------------------------
+# OSCILLATOR
+# -----------------------------
+def make_synth(n_ambient, n_pulse, cls=ac.CombinedSynth, **kwargs):
+    """Synth with `n_ambient` + `n_pulse` voices, same random voice params for every call."""
+    kwargs.setdefault("realtime", False)
+    synth = cls(max_ambient_voices=n_ambient, max_pulse_voices=n_pulse, **kwargs)
+    np.random.seed(0)
+    for k in range(n_ambient):
+        synth.add_ambient_voice_moving(36 + (k * 5) % 36, volume=0.12 / max(1, n_ambient / 8))
+    for k in range(n_pulse):
+        synth.add_pulse_voice(24 + (k * 7) % 60, duration=30.0, volume=0.58 / max(1, n_pulse / 8))
+    return synth
+
+def render_blocks(synth, blocks, frames):
+    ac.is_audio_playing = True
+    out = np.zeros((frames, 2), dtype=np.float32)
+    chunks, durations = [], []
+    for _ in range(blocks):
+        t0 = time.perf_counter()
+        synth._callback(out, frames, None, None)
+        durations.append(time.perf_counter() - t0)
+        chunks.append(out.copy())
+    return np.concatenate(chunks), durations
+
+def bench_oscillator(frames=2048, blocks=40, voice_counts=(8, 24, 96, 256)):
+    # Raw partials: 3 x np.sin vs 1 table lookup on a (32 x frames) phase block
+    rng = np.random.default_rng(0)
+    phase = np.cumsum(rng.uniform(0.01, 0.3, (32, frames)), axis=1).astype(np.float32)
+    h = {f: np.float32(v) for f, v in zip(("h1", "h2", "h3"), ac.PULSE_HARMONICS)}
+    table = ac.Wavetable(ac.PULSE_HARMONICS)
+    exact = ac.CombinedSynth._partials(h, phase.astype(np.float64), None)
+    err = float(np.max(np.abs(table(phase) - exact)))
+    t_sin = summarize(timed(lambda: ac.CombinedSynth._partials(h, phase, None), 50))
+    t_tab = summarize(timed(lambda: table(phase), 50))
+
+    print(f"🎛️  Oscillator partials (32 voices x {frames} frames)")
+    print(f"   np.sin    : p50 {t_sin['p50_ms']:.3f} ms")
+    print(f"   wavetable : p50 {t_tab['p50_ms']:.3f} ms | max |err| {err:.2e}")
+
+    results = {"partials": {"sine": t_sin, "wavetable": t_tab, "max_abs_err": err}, "synth": []}
+    for n in voice_counts:
+        sig_sin, d_sin = render_blocks(make_synth(n, n, oscillator="sine"), blocks, frames)
+        sig_tab, d_tab = render_blocks(make_synth(n, n, oscillator="wavetable"), blocks, frames)
+        diff = float(np.max(np.abs(sig_sin - sig_tab)))
+        s_sin, s_tab = summarize(d_sin), summarize(d_tab)
+        print(f"   {n:>3}+{n:<3} voices: sine {s_sin['p50_ms']:.2f} ms | wavetable {s_tab['p50_ms']:.2f} ms"
+              f" | max |diff| {diff:.2e}")
+        results["synth"].append({"voices": n, "sine": s_sin, "wavetable": s_tab, "max_abs_diff": diff})
+    return results
+
+
+# -----------------------------
+# ALLOCATIONS
+# -----------------------------
+def bench_alloc(blocksizes=(256, 2048, 8192), warmup=5, blocks=20):
+    """
+    Steady-state allocations of the callback. ScratchPool.allocations must not
+    move once warm; tracemalloc's transient peak per block must not grow with
+    the blocksize (what remains is Python view/dict objects, not array data:
+    visualization frames are written in place into the viz ring).
+    """
+    results = []
+    print("🧮 Allocations per steady-state block (24+24 voices)")
+    for osc in ("sine", "wavetable"):
+        for frames in blocksizes:
+            synth = make_synth(24, 24, oscillator=osc)
+            render_blocks(synth, warmup, frames)
+            pool_before = synth.scratch.allocations
+
+            out = np.zeros((frames, 2), dtype=np.float32)
+            tracemalloc.start()
+            peaks = []
+            for _ in range(blocks):
+                tracemalloc.reset_peak()
+                base, _ = tracemalloc.get_traced_memory()
+                synth._callback(out, frames, None, None)
+                peaks.append(tracemalloc.get_traced_memory()[1] - base)
+            tracemalloc.stop()
+
+            pool_new = synth.scratch.allocations - pool_before
+            row = {"oscillator": osc, "blocksize": frames, "scratch_allocations": pool_new,
+                   "transient_bytes_max": max(peaks), "block_bytes": frames * 4}
+            results.append(row)
+            print(f"   {osc:<9} block {frames:>5}: scratch allocs {pool_new} | transient peak "
+                  f"{max(peaks):>6} B (one float32 block = {frames * 4} B)")
+    return results
+
+
+# -----------------------------
+# OFFLINE RENDER
+# -----------------------------
+def synthetic_readings(seconds, rate_hz=20.0, seed=0):
+    """Plant-like (t, hum_raw, bio_raw) readings: drifting humidity, noisy bio with spikes."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * rate_hz)) / rate_hz
+    hum = 300 + 80 * np.sin(2 * np.pi * t / 90.0) + rng.normal(0, 4, t.shape)
+    bio = rng.normal(120, 30, t.shape)
+    spikes = rng.random(t.shape) < 0.08
+    bio[spikes] += rng.uniform(300, 800, int(spikes.sum()))
+    hum = np.clip(hum, 0, 1023).astype(int)
+    bio = np.clip(bio, 0, 1023).astype(int)
+    return list(zip(t.tolist(), hum.tolist(), bio.tolist()))
+
+def bench_offline(seconds=120.0, blocksize=2048):
+    readings = synthetic_readings(seconds)
+    synth = ac.CombinedSynth(blocksize=blocksize, realtime=False)
+    np.random.seed(0)
+    t0 = time.perf_counter()
+    audio = ac.render_offline(synth, readings, duration=seconds)
+    elapsed = time.perf_counter() - t0
+    factor = seconds / elapsed
+    print(f"📼 Offline render: {seconds:.0f} s of audio ({len(readings)} readings) in {elapsed:.2f} s"
+          f" → x{factor:.1f} realtime | peak {float(np.max(np.abs(audio))):.3f}")
+    return {"audio_sec": seconds, "elapsed_sec": elapsed, "realtime_factor": factor,
+            "readings": len(readings)}
+
+
+# -----------------------------
+# CALLBACK BUDGET
+# -----------------------------
+CALLBACK_MATRIX = {
+    "blocksize": (256, 512, 2048),
+    "samplerate": (44100, 48000),
+    "voices": ((0, 0), (24, 24), (96, 96)),   # (ambient, pulse)
+    "reverb": (True, False),
+    "viz_decimation": (1, 4),
+}
+
+def bench_callback(matrix=None, blocks=60, warmup=5):
+    """
+    Drives CombinedSynth._callback with synthetic outdata buffers for every
+    configuration of the matrix and reports callback time as a fraction of the
+    block deadline (frames / samplerate). Blocks over the deadline count as xruns.
+    """
+    matrix = dict(CALLBACK_MATRIX, **(matrix or {}))
+    rows = []
+    print("⏱️  Callback cost vs deadline (p50 / p99 / max, % of deadline)")
+    keys = ("blocksize", "samplerate", "voices", "reverb", "viz_decimation")
+    for frames, sr, (n_amb, n_pul), reverb, viz_dec in itertools.product(*(matrix[k] for k in keys)):
+        synth = make_synth(n_amb, n_pul, samplerate=sr, blocksize=frames)
+        synth.reverb_enabled = reverb
+        synth.viz_decimation = viz_dec
+        render_blocks(synth, warmup, frames)
+        _, durations = render_blocks(synth, blocks, frames)
+
+        deadline = frames / sr
+        d = np.asarray(durations) / deadline
+        row = {
+            "blocksize": frames, "samplerate": sr,
+            "ambient_voices": n_amb, "pulse_voices": n_pul,
+            "reverb": reverb, "viz_decimation": viz_dec,
+            "deadline_ms": deadline * 1e3,
+            "p50": float(np.percentile(d, 50)),
+            "p99": float(np.percentile(d, 99)),
+            "max": float(d.max()),
+            "xruns": int(np.count_nonzero(d >= 1.0)),
+            "blocks": blocks,
+        }
+        rows.append(row)
+        print(f"   block {frames:>4} @ {sr} | voices {n_amb:>3}+{n_pul:<3} | reverb {'on ' if reverb else 'off'}"
+              f" | viz 1/{viz_dec} → {row['p50'] * 100:5.1f}% / {row['p99'] * 100:5.1f}% / {row['max'] * 100:5.1f}%"
+              f"{'  ⚠️ xruns: ' + str(row['xruns']) if row['xruns'] else ''}")
+    return rows
+
+
+# -----------------------------
+# CONTENTION
+# -----------------------------
+class LockedSynth(ac.CombinedSynth):
+    """Previous design: one lock shared by the control threads and the whole render."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.lock_wait = []
+
+    def _post(self, cmd):
+        with self.lock:
+            self._apply_command(cmd)
+            time.sleep(0)  # a producer preempted while holding the lock
+
+    def render(self, frames):
+        t0 = time.perf_counter()
+        with self.lock:
+            self.lock_wait.append(time.perf_counter() - t0)
+            return super().render(frames)
+
+def bench_contention(frames=512, blocks=400, voices=(24, 24), rate_hz=2000.0):
+    """
+    Renders `blocks` callbacks while a second thread posts pulse voices at
+    `rate_hz` (the serial reader + loop player under load). Compares the old
+    lock around render/add with the per-thread command rings.
+    """
+    rows = []
+    print(f"🔒 Callback under command load ({rate_hz:.0f} cmd/s, block {frames}; p50 / p99 / max, % of deadline)")
+    for label, cls in (("lock", LockedSynth), ("ring", ac.CombinedSynth)):
+        synth = make_synth(*voices, cls=cls, blocksize=frames)
+        render_blocks(synth, 5, frames)
+
+        stop = threading.Event()
+        def producer():
+            k = 0
+            while not stop.is_set():
+                synth.add_pulse_voice(24 + (k * 7) % 60, duration=2.0, volume=0.1)
+                k += 1
+                time.sleep(1.0 / rate_hz)
+        th = threading.Thread(target=producer, daemon=True)
+        th.start()
+        _, durations = render_blocks(synth, blocks, frames)
+        stop.set()
+        th.join()
+
+        d = np.asarray(durations) / (frames / synth.sr)
+        row = {
+            "design": label, "blocksize": frames, "rate_hz": rate_hz,
+            "p50": float(np.percentile(d, 50)),
+            "p99": float(np.percentile(d, 99)),
+            "max": float(d.max()),
+            "xruns": int(np.count_nonzero(d >= 1.0)),
+        }
+        if label == "lock":
+            w = np.asarray(synth.lock_wait) * 1e3
+            row["lock_wait_p99_ms"] = float(np.percentile(w, 99))
+            row["lock_wait_max_ms"] = float(w.max())
+            extra = f" | lock wait p99 {row['lock_wait_p99_ms']:.3f} ms, max {row['lock_wait_max_ms']:.3f} ms"
+        else:
+            row["commands"] = synth.command_stats()
+            extra = (f" | {row['commands']['applied']} cmds applied, max {row['commands']['max_per_block']}/block,"
+                     f" {row['commands']['dropped']} dropped")
+        rows.append(row)
+        print(f"   {label:<4} → {row['p50'] * 100:5.1f}% / {row['p99'] * 100:5.1f}% / {row['max'] * 100:5.1f}%{extra}")
+    return rows
+
+
+# -----------------------------
+# WORKERS
+# -----------------------------
+def bench_workers(frames=1024, seconds=5.0, voice_counts=((24, 24), (96, 96), (192, 192))):
+    """
+    Pulls callbacks at the real-time pace (one per block deadline) and
+    compares rendering in the callback with the multiprocess bus workers.
+    In worker mode the callback only mixes, so its cost should stay flat;
+    underruns count blocks the workers did not deliver in time.
+    """
+    rows = []
+    print(f"🧵 Callback cost: in-callback vs bus workers (block {frames}; p50 / p99 / max, % of deadline)")
+    for n_amb, n_pul in voice_counts:
+        for workers in (False, True):
+            synth = make_synth(n_amb, n_pul, blocksize=frames, workers=workers)
+            deadline = frames / synth.sr
+            out = np.zeros((frames, 2), dtype=np.float32)
+            ac.is_audio_playing = True
+            if workers:
+                time.sleep(2.0)  # worker processes start up and fill their rings
+            durations = []
+            t_next = time.perf_counter()
+            for _ in range(int(seconds / deadline)):
+                t0 = time.perf_counter()
+                synth._callback(out, frames, None, None)
+                durations.append(time.perf_counter() - t0)
+                t_next += deadline
+                time.sleep(max(0.0, t_next - time.perf_counter()))
+            underruns = sum(w.underruns for w in synth.workers.values())
+            synth.stop()
+
+            d = np.asarray(durations) / deadline
+            row = {
+                "workers": workers, "ambient_voices": n_amb, "pulse_voices": n_pul,
+                "blocksize": frames, "deadline_ms": deadline * 1e3,
+                "p50": float(np.percentile(d, 50)),
+                "p99": float(np.percentile(d, 99)),
+                "max": float(d.max()),
+                "xruns": int(np.count_nonzero(d >= 1.0)),
+                "worker_underruns": underruns,
+            }
+            rows.append(row)
+            print(f"   voices {n_amb:>3}+{n_pul:<3} | {'workers ' if workers else 'callback'} → {row['p50'] * 100:5.1f}%"
+                  f" / {row['p99'] * 100:5.1f}% / {row['max'] * 100:5.1f}% | xruns {row['xruns']}, underruns {underruns}")
+    return rows
+
+
+# -----------------------------
+# SENSOR PIPELINE
+# -----------------------------
+def consume(source, synth, seconds, batch_interval=0.01):
+    """serial_reader's consumer loop, timed: returns (readings, latencies in s)."""
+    mapper = ac.SensorMapper(synth, now=time.time())
+    latencies = []
+    n = 0
+    t_end = time.time() + seconds
+    while time.time() < t_end:
+        time.sleep(batch_interval)
+        ts, hums, bios = source.samples.pop_batch()
+        mapper.process_batch(ts, hums, bios)
+        done = time.time()
+        latencies.extend((done - ts).tolist())
+        n += len(ts)
+        synth._drain_commands()  # stands in for the audio thread
+    return n, latencies
+
+def bench_sensor(seconds=3.0, rates=(20, 200, 2000, 8000), noise="spiky"):
+    """
+    Feeds the humidity/bio mapping from a synthetic source (and from the
+    pty fake serial device, CSV and binary frames, where available) at
+    increasing rates; reports
+    readings/s handled and reading → mapped latency (p50 / p99 / max).
+    """
+    kinds = ["synthetic"]
+    if hasattr(__import__("os"), "openpty"):
+        kinds += ["fake-serial", "fake-binary"]
+    rows = []
+    print(f"🌿 Sensor → mapping ({seconds:g} s per run, {noise} noise; latency p50 / p99 / max)")
+    for kind in kinds:
+        for rate in rates:
+            synth = ac.CombinedSynth(realtime=False)
+            device = None
+            if kind == "synthetic":
+                source = ac.SyntheticSource(rate_hz=rate, noise=noise, seed=0, capacity=1 << 16)
+            else:
+                protocol = "binary" if kind == "fake-binary" else "csv"
+                device = ac.FakeSerialDevice(rate_hz=rate, noise=noise, seed=0, protocol=protocol).start()
+                source = ac.SerialReader(port=device.path, baud=115200, capacity=1 << 16)
+            source.start()
+            n, lat = consume(source, synth, seconds)
+            stats = source.stats()
+            source.stop()
+            if device is not None:
+                device.stop()
+
+            lat = np.asarray(lat) * 1e3 if lat else np.zeros(1)
+            row = {
+                "source": kind, "rate_hz": rate,
+                "readings": n, "readings_per_sec": n / seconds,
+                "latency_p50_ms": float(np.percentile(lat, 50)),
+                "latency_p99_ms": float(np.percentile(lat, 99)),
+                "latency_max_ms": float(lat.max()),
+                "parse_failures": stats["parse_failures"], "dropped": stats["dropped"],
+                "lost_frames": stats["lost_frames"],
+            }
+            rows.append(row)
+            print(f"   {kind:<11} {rate:>5} Hz → {row['readings_per_sec']:7.0f} readings/s | "
+                  f"{row['latency_p50_ms']:6.2f} / {row['latency_p99_ms']:6.2f} / {row['latency_max_ms']:6.2f} ms"
+                  f"{'  ⚠️ dropped: ' + str(row['dropped']) if row['dropped'] else ''}")
+    return rows
+
+
+# -----------------------------
+# VISUALIZATION BROADCAST
+# -----------------------------
+async def sequential_broadcaster(synth):
+    """Previous design: awaits each client's send in turn (0.2 s timeout)."""
+    ring = synth.viz_ring
+    ring.attach(asyncio.get_running_loop())
+    seq = 0
+    while True:
+        timestamp, block, _ = await ring.next_frame()
+        with ac.ws_clients_lock:
+            clients = list(ac.websocket_clients.values())
+        frames = {}
+        for client in clients:
+            key = (client.points, client.format, client.channels)
+            if key not in frames:
+                frames[key] = ac.encode_viz_frame(seq, timestamp, synth.sr, block, *key)
+        for client in clients:
+            try:
+                await asyncio.wait_for(client.websocket.send(frames[(client.points, client.format, client.channels)]), 0.2)
+            except Exception:
+                pass
+        seq += 1
+
+async def broadcast_run(broadcaster, viewers, slow, seconds, blocksize=2048):
+    """One load test: returns (published fps, fps of every reading viewer, clients evicted)."""
+    import websockets
+    synth = ac.CombinedSynth(realtime=False, blocksize=blocksize)
+    ac.is_audio_playing = True
+    stop = threading.Event()
+
+    def audio_thread():
+        out = np.zeros((blocksize, 2), dtype=np.float32)
+        t_next = time.perf_counter()
+        while not stop.is_set():
+            synth._callback(out, blocksize, None, None)
+            t_next += blocksize / synth.sr
+            time.sleep(max(0.0, t_next - time.perf_counter()))
+
+    async def reader(ws, counts, k):
+        try:
+            async for msg in ws:
+                if not isinstance(msg, str):
+                    counts[k] += 1
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    def stalled_client(port, hello):
+        # raw socket: handshake + hello (masked with a zero key), then never reads
+        sock = socket.socket()
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        sock.connect(("localhost", port))
+        sock.sendall(f"GET / HTTP/1.1\r\nHost: localhost:{port}\r\nUpgrade: websocket\r\n"
+                     "Connection: Upgrade\r\nSec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+                     "Sec-WebSocket-Version: 13\r\n\r\n".encode())
+        payload = json.dumps(hello).encode()
+        sock.sendall(bytes((0x81, 0x80 | len(payload), 0, 0, 0, 0)) + payload)
+        return sock
+
+    async def handler(ws):
+        # small kernel buffers, as over a real network: a stalled client
+        # backs up into the server within seconds instead of megabytes
+        ws.transport.get_extra_info("socket").setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 16384)
+        await ac.websocket_handler(ws)
+
+    with contextlib.redirect_stdout(io.StringIO()):  # per-connection log lines
+        server = await websockets.serve(handler, "localhost", 0)
+        port = server.sockets[0].getsockname()[1]
+        task = asyncio.create_task(broadcaster(synth))
+        url = f"ws://localhost:{port}"
+        # live_listening.js desktop settings for readers, the largest frames for stalled clients
+        fast = [await websockets.connect(url) for _ in range(viewers)]
+        for ws in fast:
+            await ws.send(json.dumps({"type": "hello", "points": 512, "format": "int16", "channels": 1}))
+        big = {"type": "hello", "points": ac.VIZ_MAX_POINTS, "format": "float32", "channels": 2}
+        stalled = [stalled_client(port, big) for _ in range(slow)]
+        await asyncio.sleep(0.5)
+        with ac.ws_clients_lock:
+            clients = list(ac.websocket_clients.values())
+        counts = [0] * viewers
+        readers = [asyncio.create_task(reader(ws, counts, k)) for k, ws in enumerate(fast)]
+
+        th = threading.Thread(target=audio_thread, daemon=True)
+        th.start()
+        await asyncio.sleep(1.0)  # warm up
+        c0, h0, t0 = list(counts), synth.viz_ring.head, time.perf_counter()
+        await asyncio.sleep(seconds)
+        c1, h1, t1 = list(counts), synth.viz_ring.head, time.perf_counter()
+        stop.set()
+        th.join()
+
+        evicted = sum(c.evicted for c in clients)
+        task.cancel()
+        for t in readers:
+            t.cancel()
+        for sock in stalled:
+            sock.close()
+        for ws in fast:
+            await ws.close()
+        server.close()
+        await server.wait_closed()
+        ac.websocket_clients.clear()
+
+    dt = t1 - t0
+    return (h1 - h0) / dt, [(b - a) / dt for a, b in zip(c0, c1)], evicted
+
+def bench_broadcast(viewers=(50, 200, 400), slow=2, seconds=8.0):
+    """
+    Visualization stream load test on localhost: a websockets server running
+    websocket_handler, `viewers` clients reading every frame (live_listening
+    desktop settings) and `slow` clients that stop reading. Reports the frame
+    rate the readers get (min / median) against the rate the audio thread
+    publishes, for the old sequential broadcaster and the concurrent fan-out.
+    """
+    rows = []
+    print(f"📡 Viz broadcast ({seconds:g} s per run, {slow} stalled clients; frames/s min / median of the readers)")
+    for design, broadcaster in (("sequential", sequential_broadcaster), ("fan-out", ac.viz_broadcaster)):
+        for n in viewers:
+            published, fps, evicted = asyncio.run(broadcast_run(broadcaster, n, slow, seconds))
+            row = {
+                "design": design, "viewers": n, "stalled": slow,
+                "published_fps": published,
+                "viewer_fps_min": float(min(fps)), "viewer_fps_median": float(np.median(fps)),
+                "stalled_disconnected": evicted,
+            }
+            rows.append(row)
+            print(f"   {design:<10} {n:>4} viewers → {row['viewer_fps_min']:5.2f} / {row['viewer_fps_median']:5.2f}"
+                  f" fps (published {published:.2f}) | stalled disconnected: {evicted}/{slow}")
+    return rows
+
+
+# -----------------------------
+# LOOP LIBRARY
+# -----------------------------
+def tuple_loop_bytes(events):
+    """Python object footprint of a loop kept as a list of (t, midi) tuples."""
+    return sys.getsizeof(events) + sum(sys.getsizeof(ev) + sys.getsizeof(ev[0]) for ev in events)
+
+def bench_loops(counts=(100, 1000), events_per_loop=64, seed=0):
+    """
+    Stores `counts` loops of `events_per_loop` notes in a fresh library file,
+    then reopens it (header scan only) and reads every loop back. Reports
+    save / reopen / load-all times and the bytes per event on disk against
+    the (t, midi) tuple lists the loops used to be kept as.
+    """
+    import tempfile
+    rng = np.random.default_rng(seed)
+    rows = []
+    print(f"🔁 Loop library ({events_per_loop} events per loop)")
+    for n in counts:
+        loops = []
+        for _ in range(n):
+            t = np.sort(rng.uniform(0.0, 8.0, events_per_loop))
+            loops.append(list(zip(t.tolist(), rng.integers(36, 84, events_per_loop).tolist())))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "loops.lpl")
+            library = ac.LoopLibrary(path)
+            t0 = time.perf_counter()
+            for events in loops:
+                library.save(events, 8.0)
+            save_s = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            library = ac.LoopLibrary(path)
+            reopen_s = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            for e in library.list():
+                library.get(e["id"])
+            load_s = time.perf_counter() - t0
+            size = os.path.getsize(path)
+
+        row = {
+            "loops": n, "events_per_loop": events_per_loop,
+            "save_ms_per_loop": save_s / n * 1e3,
+            "reopen_ms": reopen_s * 1e3,
+            "load_all_ms": load_s * 1e3,
+            "file_bytes_per_event": size / (n * events_per_loop),
+            "tuple_list_bytes_per_event": sum(map(tuple_loop_bytes, loops)) / (n * events_per_loop),
+        }
+        rows.append(row)
+        print(f"   {n:>5} loops → save {row['save_ms_per_loop']:6.3f} ms/loop (fsync) | reopen {row['reopen_ms']:7.2f} ms"
+              f" | load all {row['load_all_ms']:7.2f} ms | {row['file_bytes_per_event']:.1f} B/event on disk"
+              f" vs {row['tuple_list_bytes_per_event']:.0f} B as tuples")
+    return rows
+
+
+class ScanLoopSynth(ac.CombinedSynth):
+    """Previous loop scheduler: every loop's state checked at every block."""
+    def _schedule_loops(self, frames):
+        start = self.frame_clock
+        end = start + frames
+        bank = self.pulse_voices
+        for st in self._loops.values():
+            offs = st["frames"]
+            while st["t0"] + offs[st["i"]] < end:
+                at = st["t0"] + offs[st["i"]] - start
+                slot = bank.add(**st["voices"][st["i"]])
+                if slot >= 0:
+                    bank.cols["t"][slot] = -max(0, at) / self.sr
+                st["i"] += 1
+                if st["i"] >= len(offs):
+                    st["i"] = 0
+                    st["t0"] += st["dur"]
+
+def bench_timeline(loop_counts=(10, 100, 1000), events_per_loop=8, loop_sec=8.0, frames=256, blocks=2000, seed=0):
+    """
+    Loop scheduling alone (_schedule_loops, no rendering) with `loop_counts`
+    sparse loops playing, at a 256-frame block. Reports the cost per block
+    (p50 / p99) and per triggered note, and checks that both schedulers
+    start the same notes at the same frames.
+    """
+    rng = np.random.default_rng(seed)
+    rows = []
+    print(f"⏱️  Loop timeline ({events_per_loop} notes per {loop_sec:g} s loop, {frames}-frame blocks; p50 / p99 per block)")
+    for n in loop_counts:
+        loops = [{"id": k, "dur": loop_sec,
+                  "events": list(zip(np.sort(rng.uniform(0.0, loop_sec, events_per_loop)).tolist(),
+                                     rng.integers(36, 84, events_per_loop).tolist()))}
+                 for k in range(n)]
+        results = {}
+        for design, cls in (("scan", ScanLoopSynth), ("timeline", ac.CombinedSynth)):
+            synth = cls(realtime=False, max_pulse_voices=64)
+            synth.set_loops(loops)
+            synth._drain_commands()
+            bank = synth.pulse_voices
+            starts, durations = [], []
+            for _ in range(blocks):
+                t0 = time.perf_counter()
+                synth._schedule_loops(frames)
+                durations.append(time.perf_counter() - t0)
+                # (note frequency, start age) of the notes started in this block
+                starts.append(sorted(zip(bank["freq_base"].tolist(), bank["t"].tolist())))
+                synth.frame_clock += frames
+                bank.clear()
+            notes = sum(map(len, starts))
+            results[design] = (summarize(durations), notes, starts)
+            row = {"design": design, "loops": n, "notes": notes,
+                   **{f"block_{k}": v for k, v in results[design][0].items()},
+                   "us_per_note": float(np.sum(durations)) / max(1, notes) * 1e6}
+            rows.append(row)
+            print(f"   {design:<8} {n:>5} loops → {row['block_p50_ms'] * 1e3:8.1f} / {row['block_p99_ms'] * 1e3:8.1f} µs"
+                  f" | {row['us_per_note']:6.1f} µs per note ({notes} notes)")
+        same = results["scan"][2] == results["timeline"][2]
+        print(f"   {'':<8} {n:>5} loops → same notes per block: {'✅' if same else '❌'}")
+    return rows
+
+
+# -----------------------------
+# MULTI-PLANT
+# -----------------------------
+def bench_plants(plant_counts=(1, 2, 4, 8, 12), seconds=30.0, blocksize=2048, rate_hz=20.0):
+    """
+    One engine, `plant_counts` plants each with its own SensorMapper (voice
+    group, stereo position) fed synthetic 20 Hz readings, rendered offline
+    block by block. Every plant starts with its steady-state ambient voices.
+    Reports block cost (mapping + render, p50 / p99 as % of the deadline),
+    CPU load and how many plants one core would carry at that rate.
+    """
+    rows = []
+    deadline = blocksize / 48000
+    print(f"🌿 Multi-plant engine ({seconds:g} s per run, {blocksize}-frame blocks, {rate_hz:g} Hz readings per plant)")
+    for n in plant_counts:
+        voices = max(24, ac.MAX_VOICES_PER_PLANT * n)
+        synth = ac.CombinedSynth(blocksize=blocksize, realtime=False, max_ambient_voices=voices, max_pulse_voices=voices)
+        np.random.seed(0)
+        mappers, readings = [], []
+        for k, pan in enumerate(ac.plant_pans(n)):
+            mappers.append(ac.SensorMapper(synth, now=0.0, group=k, pan=pan))
+            readings.append(tuple(np.asarray(col) for col in zip(*synthetic_readings(seconds, rate_hz=rate_hz, seed=k))))
+            for v in range(voices // n):
+                synth.add_ambient_voice_moving(36 + (k * 5 + v * 7) % 36, volume=0.12, pan=pan, group=k)
+        ac.is_audio_playing = True
+
+        pos = [0] * n
+        durations = []
+        for b in range(int(seconds * 48000 / blocksize)):
+            block_t = b * deadline
+            t0 = time.perf_counter()
+            for k, mapper in enumerate(mappers):
+                t, hum, bio = readings[k]
+                end = int(np.searchsorted(t, block_t, side="right"))
+                mapper.process_batch(t[pos[k]:end], hum[pos[k]:end], bio[pos[k]:end])
+                pos[k] = end
+            synth.render(blocksize)
+            durations.append(time.perf_counter() - t0)
+
+        d = np.asarray(durations) / deadline * 100
+        load = float(np.mean(durations)) / deadline
+        row = {
+            "plants": n, "voices_per_bus": voices,
+            "block_p50_pct": float(np.percentile(d, 50)), "block_p99_pct": float(np.percentile(d, 99)),
+            "cpu_load": load, "plants_per_core": n / load if load > 0 else float("inf"),
+        }
+        rows.append(row)
+        print(f"   {n:>3} plants ({voices:>3} voices/bus) → {row['block_p50_pct']:5.1f} / {row['block_p99_pct']:5.1f} % of deadline"
+              f" | load {load * 100:5.1f} % → ~{row['plants_per_core']:.0f} plants per core")
+    return rows
+
+
+# -----------------------------
+# SESSION RECORDER
+# -----------------------------
+class SlowDiskRecorder(ac.SessionRecorder):
+    """Writer stalled like a disk that only takes `speed` x real time."""
+    speed = 0.5
+
+    def _write_frames(self, frames):
+        time.sleep(frames.shape[0] / self.sr / self.speed)
+        super()._write_frames(frames)
+
+def bench_recorder(frames=512, seconds=4.0, voices=(24, 24)):
+    """
+    Pulls callbacks at the real-time pace (like the audio device) with the
+    session recorder off, writing WAV to a temp dir, and writing to a disk
+    at half real-time speed with a 1 s ring. The callback cost must not
+    change; on the slow disk the overflow is dropped and counted.
+    """
+    import tempfile
+    rows = []
+    print(f"🎙️  Session recorder: callback cost (block {frames}, {voices[0]}+{voices[1]} voices; p50 / p99 / max, % of deadline)")
+    for mode in ("off", "wav", "slow-disk"):
+        with tempfile.TemporaryDirectory() as tmp:
+            synth = make_synth(*voices, blocksize=frames)
+            if mode == "wav":
+                synth.recorder = ac.SessionRecorder(tmp, samplerate=synth.sr)
+            elif mode == "slow-disk":
+                synth.recorder = SlowDiskRecorder(tmp, samplerate=synth.sr, ring_seconds=1.0, chunk_seconds=0.25)
+            if synth.recorder is not None:
+                synth.recorder.start()
+                # /session_stats before any chunk is written must be strict JSON (no NaN)
+                json.loads(json.dumps(synth.recorder.stats(), allow_nan=False))
+            deadline = frames / synth.sr
+            out = np.zeros((frames, 2), dtype=np.float32)
+            ac.is_audio_playing = True
+            durations = []
+            t_next = time.perf_counter()
+            for _ in range(int(seconds / deadline)):
+                t0 = time.perf_counter()
+                synth._callback(out, frames, None, None)
+                durations.append(time.perf_counter() - t0)
+                t_next += deadline
+                time.sleep(max(0.0, t_next - time.perf_counter()))
+            stats = {"seconds_written": 0.0, "dropped_frames": 0}
+            if synth.recorder is not None:
+                synth.recorder.stop()
+                stats = synth.recorder.stats()
+
+        d = np.asarray(durations) / deadline
+        row = {
+            "mode": mode, "blocksize": frames,
+            "p50": float(np.percentile(d, 50)), "p99": float(np.percentile(d, 99)), "max": float(d.max()),
+            "seconds_played": len(durations) * deadline,
+            "seconds_written": stats["seconds_written"], "dropped_frames": stats["dropped_frames"],
+        }
+        rows.append(row)
+        print(f"   {mode:<9} → {row['p50'] * 100:5.1f}% / {row['p99'] * 100:5.1f}% / {row['max'] * 100:5.1f}%"
+              f" | written {row['seconds_written']:.2f} of {row['seconds_played']:.2f} s, dropped {row['dropped_frames']} frames")
+    return rows
+
+
+# -----------------------------
+# TUNING TABLES
+# -----------------------------
+def scalar_mapping(hums, bios):
+    """Previous mapping: per-reading arithmetic + nearest-degree search."""
+    out = []
+    for h, b in zip(hums, bios):
+        amb, _ = ac.humidity_to_note(h, base_root=ac.SensorMapper.AMB_BASE_ROOT,
+                                     h_min=ac.SensorMapper.H_MIN, h_max=ac.SensorMapper.H_MAX)
+        _, semis_raw = ac.midi_from_adc_semitones(b, base_root=ac.SensorMapper.PULSE_BASE_ROOT,
+                                                  semis_max=ac.SensorMapper.PULSE_SEMIS_MAX)
+        out.append((amb, ac.SensorMapper.PULSE_BASE_ROOT + ac.quantize_to_major(semis_raw, ac.SensorMapper.PULSE_SEMIS_MAX)))
+    return out
+
+def bench_tuning(batch_sizes=(10, 100, 1000, 10000), seed=0):
+    """
+    Maps batches of random ADC readings (humidity → ambient note, bio →
+    pulse note, major scale) with the per-reading functions, with
+    Tuning.lookup per reading and with one Tuning.map per batch. Reports the
+    cost per reading, checks all three agree on every reading, and times a
+    table rebuild (scale change) and a no-op configure().
+    """
+    rng = np.random.default_rng(seed)
+    amb = ac.Tuning("major", base_root=ac.SensorMapper.AMB_BASE_ROOT, span=36,
+                    value_min=ac.SensorMapper.H_MIN, value_max=ac.SensorMapper.H_MAX)
+    pulse = ac.Tuning("major", base_root=ac.SensorMapper.PULSE_BASE_ROOT, span=ac.SensorMapper.PULSE_SEMIS_MAX)
+    rows = []
+    print("🎼 Tuning tables: reading → (ambient, pulse) note, µs per reading")
+    for n in batch_sizes:
+        hums = rng.integers(0, 1024, n)
+        bios = rng.integers(0, 1024, n)
+        h_list, b_list = hums.tolist(), bios.tolist()
+        repeats = max(3, 20000 // n)
+
+        ref = scalar_mapping(h_list, b_list)
+        lut = [(amb.lookup(h)[0], pulse.lookup(b)[0]) for h, b in zip(h_list, b_list)]
+        batch = list(zip(amb.map(hums)[0].tolist(), pulse.map(bios)[0].tolist()))
+        exact = ref == lut == batch
+
+        t_ref = np.median(timed(lambda: scalar_mapping(h_list, b_list), repeats)) / n
+        t_lut = np.median(timed(lambda: [(amb.lookup(h), pulse.lookup(b)) for h, b in zip(h_list, b_list)], repeats)) / n
+        t_batch = np.median(timed(lambda: (amb.map(hums), pulse.map(bios)), repeats)) / n
+        row = {
+            "batch": n,
+            "scalar_us": float(t_ref * 1e6), "lookup_us": float(t_lut * 1e6), "batch_us": float(t_batch * 1e6),
+            "speedup_batch": float(t_ref / t_batch), "exact": bool(exact),
+        }
+        rows.append(row)
+        print(f"   batch {n:>6} → functions {row['scalar_us']:6.3f} | lookup {row['lookup_us']:6.3f}"
+              f" | batch {row['batch_us']:7.4f} ({row['speedup_batch']:5.0f}x) | exact: {'✅' if exact else '❌'}")
+
+    scales = itertools.cycle(("minor", "major"))
+    rebuild = summarize(timed(lambda: pulse.configure(scale=next(scales)), 50))
+    noop = summarize(timed(lambda: pulse.configure(scale=pulse.params["scale"]), 50))
+    print(f"   rebuild on scale change {rebuild['p50_ms'] * 1e3:.0f} µs | unchanged configure() {noop['p50_ms'] * 1e3:.1f} µs")
+    rows.append({"rebuild_ms": rebuild["p50_ms"], "noop_configure_ms": noop["p50_ms"]})
+    return rows
+
+
+# -----------------------------
+# SENSOR CONDITIONING
+# -----------------------------
+class LegacyMapper(ac.SensorMapper):
+    """Previous mapping: every humidity reading kept for the window, raw bio threshold + cooldown per reading."""
+    def __init__(self, synth, now=0.0, **kw):
+        super().__init__(synth, now=now, **kw)
+        self.hum_samples = []
+        self.amb_window_start = now
+        self.zero_semis_streak = 0
+        self.amb_stopped_due_zero = False
+        self.last_pulse_trig = float("-inf")
+
+    def process_batch(self, ts, hums, bios):
+        pulses = []
+        for now, hum_raw, bio_raw in zip(ts.tolist(), hums.tolist(), bios.tolist()):
+            _, hum_semis_now = self.amb_tuning.lookup(hum_raw)
+            if hum_semis_now == 0:
+                self.zero_semis_streak += 1
+            else:
+                self.zero_semis_streak = 0
+                self.amb_stopped_due_zero = False
+            if self.zero_semis_streak >= 2:
+                if not self.amb_stopped_due_zero:
+                    self.synth.clear_ambient(self.group)
+                    self.ambient_midi = None
+                    self.hum_samples.clear()
+                    self.amb_window_start = now
+                    self.amb_stopped_due_zero = True
+            else:
+                self.hum_samples.append(hum_raw)
+                if (now - self.amb_window_start) >= self.AMB_WINDOW_SEC and self.hum_samples:
+                    amb_midi, _ = self.amb_tuning.note(sum(self.hum_samples) / len(self.hum_samples))
+                    self.synth.add_ambient_voice_moving(amb_midi, volume=0.12, pan=self.pan, stamp=now, group=self.group)
+                    self.ambient_midi = amb_midi
+                    self.hum_samples.clear()
+                    self.amb_window_start = now
+
+            pulse_midi, pulse_semis = self.pulse_tuning.lookup(bio_raw)
+            if pulse_semis >= self.PULSE_MIN_SEMIS_TO_PLAY and (now - self.last_pulse_trig) >= self.PULSE_COOLDOWN:
+                self.synth.add_pulse_voice(pulse_midi, pan=self.pan, stamp=now, group=self.group)
+                self.last_pulse_trig = now
+                pulses.append((now, pulse_midi))
+        return pulses
+
+class NoteLog:
+    """Synth stand-in recording what the mapping plays: [(kind, t, midi)]."""
+    def __init__(self):
+        self.notes = []
+
+    def add_ambient_voice_moving(self, midi, stamp=None, **kw):
+        self.notes.append(("ambient", stamp, midi))
+
+    def add_pulse_voice(self, midi, stamp=None, **kw):
+        self.notes.append(("pulse", stamp, midi))
+
+    def clear_ambient(self, group=None):
+        self.notes.append(("stop", None, None))
+
+def mapper_state_bytes(mapper):
+    """Footprint of the per-channel state a mapper keeps between batches."""
+    if isinstance(mapper, LegacyMapper):
+        return sys.getsizeof(mapper.hum_samples) + sum(sys.getsizeof(h) for h in mapper.hum_samples)
+    return mapper.bio_median.tail.nbytes + 8 * 6
+
+def bench_conditioning(rates=(20, 1000, 10000), seconds=60.0, batch_interval=0.01, seed=0):
+    """
+    Feeds `seconds` of synthetic readings in 10 ms batches to the previous
+    per-reading mapping and to the conditioning stage (window running mean,
+    median + EMA bio filters, hysteresis onsets), "spiky" noise at 20 Hz
+    (spikes are the signal) and "white" noise above (no spikes: every pulse
+    is noise). Reports µs per reading (the conditioning stage costs mostly
+    per batch), pulses per second, the state kept between batches, and
+    whether the ambient notes are identical.
+    """
+    rows = []
+    print(f"🧹 Sensor conditioning ({seconds:g} s of readings in {batch_interval * 1e3:g} ms batches)")
+    for rate in rates:
+        noise = "spiky" if rate <= 20 else "white"
+        t = np.arange(int(seconds * rate)) / rate
+        hum, bio = ac.synthetic_signal(t, np.random.default_rng(seed), noise)
+        hum[(t % 30.0) > 29.0] = 0  # sensor lifted once per 30 s: ambience stops
+        step = max(1, int(rate * batch_interval))
+        res = {}
+        for name, cls in (("legacy", LegacyMapper), ("conditioned", ac.SensorMapper)):
+            log = NoteLog()
+            mapper = cls(log, now=0.0)
+            peak = 0
+            t0 = time.perf_counter()
+            for lo in range(0, len(t), step):
+                mapper.process_batch(t[lo:lo + step], hum[lo:lo + step], bio[lo:lo + step])
+                if lo % (step * 256) == 0:
+                    peak = max(peak, mapper_state_bytes(mapper))
+            elapsed = time.perf_counter() - t0
+            res[name] = (elapsed / len(t), log.notes, peak)
+
+        ambient = {name: [n for n in notes if n[0] != "pulse"] for name, (_, notes, _) in res.items()}
+        row = {"rate_hz": rate, "noise": noise, "ambient_identical": ambient["legacy"] == ambient["conditioned"]}
+        for name, (per_reading, notes, peak) in res.items():
+            row[f"{name}_us_per_reading"] = per_reading * 1e6
+            row[f"{name}_cpu_pct"] = per_reading * rate * 100
+            row[f"{name}_pulses_per_s"] = sum(n[0] == "pulse" for n in notes) / seconds
+            row[f"{name}_state_bytes"] = peak
+        rows.append(row)
+        print(f"   {rate:>6} Hz ({noise:<5}) → legacy {row['legacy_us_per_reading']:5.2f} µs/reading"
+              f" ({row['legacy_cpu_pct']:5.2f}% CPU), {row['legacy_pulses_per_s']:4.1f} pulses/s, {row['legacy_state_bytes'] / 1024:7.1f} KiB"
+              f" | conditioned {row['conditioned_us_per_reading']:5.2f} µs/reading"
+              f" ({row['conditioned_cpu_pct']:5.2f}% CPU), {row['conditioned_pulses_per_s']:4.1f} pulses/s, {row['conditioned_state_bytes'] / 1024:3.1f} KiB"
+              f" | ambient identical: {'✅' if row['ambient_identical'] else '❌'}")
+    return rows
+
+
+# -----------------------------
+# POLYPHONY GOVERNOR
+# -----------------------------
+def bench_governor(frames=256, seconds=6.0, capacity=384, notes_per_sec=300.0, seed=0):
+    """
+    Voice storm: 32 ambient voices, then pulse notes (3 s long) arriving at
+    `notes_per_sec` until both banks of `capacity` voices are full, rendered
+    block by block through the callback with the governor off and on.
+    Reports the blocks over their deadline, callback p50 / p99 (% of the
+    deadline), the voices rendered, the lowest cap, the voices stolen and
+    the scratch buffers allocated after the first block (the storm and the
+    first steals included: they must all be allocated up front).
+    """
+    rows = []
+    deadline = frames / 48000
+    blocks = int(seconds / deadline)
+    print(f"🎚️  Polyphony governor: voice storm ({frames}-frame blocks, up to {capacity}+{capacity} voices,"
+          f" {notes_per_sec:g} notes/s)")
+    for governor in (False, True):
+        synth = ac.CombinedSynth(blocksize=frames, realtime=False, max_ambient_voices=capacity,
+                                 max_pulse_voices=capacity, polyphony_governor=governor)
+        rng = np.random.default_rng(seed)
+        np.random.seed(seed)
+        for k in range(32):
+            synth.add_ambient_voice_moving(36 + (k * 5) % 36, volume=0.02)
+        ac.is_audio_playing = True
+        out = np.zeros((frames, 2), dtype=np.float32)
+        durations, voices, caps = [], [], []
+        due = 0.0
+        for b in range(blocks):
+            due += notes_per_sec * deadline
+            while due >= 1.0:
+                synth.add_pulse_voice(int(rng.integers(36, 84)), volume=0.05, duration=3.0)
+                due -= 1.0
+            t0 = time.perf_counter()
+            synth._callback(out, frames, None, None)
+            durations.append(time.perf_counter() - t0)
+            voices.append(len(synth.ambient_voices) + len(synth.pulse_voices))
+            caps.append(synth.voice_cap)
+            if b == 0:
+                allocs = synth.scratch.allocations
+
+        d = np.asarray(durations) / deadline
+        tail = d[len(d) // 2:]  # second half: the storm at its peak
+        row = {
+            "governor": governor, "blocksize": frames,
+            "over_deadline_pct": float(np.mean(tail > 1.0) * 100),
+            "p50": float(np.percentile(tail, 50)), "p99": float(np.percentile(tail, 99)),
+            "voices_mean": float(np.mean(voices[len(voices) // 2:])), "voice_cap_min": int(min(caps)),
+            "stolen": dict(synth.voices_stolen), "scratch_allocs": synth.scratch.allocations - allocs,
+        }
+        rows.append(row)
+        print(f"   governor {'on ' if governor else 'off'} → over deadline {row['over_deadline_pct']:5.1f}% of blocks"
+              f" | p50 {row['p50'] * 100:5.1f}% / p99 {row['p99'] * 100:5.1f}% | {row['voices_mean']:5.0f} voices"
+              f" (cap ≥ {row['voice_cap_min']}) | stolen {row['stolen']['ambient']} ambient, {row['stolen']['pulse']} pulse"
+              f" | scratch allocs {row['scratch_allocs']}")
+    return rows
+
+
+# -----------------------------
+# MAIN
+# -----------------------------
+BENCHMARKS = {
+    "reverb": bench_reverb,
+    "oscillator": bench_oscillator,
+    "alloc": bench_alloc,
+    "offline": bench_offline,
+    "callback": bench_callback,
+    "contention": bench_contention,
+    "workers": bench_workers,
+    "sensor": bench_sensor,
+    "broadcast": bench_broadcast,
+    "loops": bench_loops,
+    "timeline": bench_timeline,
+    "plants": bench_plants,
+    "recorder": bench_recorder,
+    "tuning": bench_tuning,
+    "conditioning": bench_conditioning,
+    "governor": bench_governor,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Live Planting engine benchmarks")
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run ({', '.join(BENCHMARKS)}); default: all")
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON")
+    args = parser.parse_args()
+
+    names = args.names or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"⚠️  Unknown benchmark '{name}'. Available: {', '.join(BENCHMARKS)}")
+            sys.exit(1)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+        },
+        "results": {},
+    }
+    for name in names:
+        report["results"][name] = BENCHMARKS[name]()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"📄 Results written to {args.json}")
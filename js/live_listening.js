@@ -16,6 +16,20 @@ class LiveAudioController {
         this.vizBuffer = new Float32Array(256);
         this.vizIndex = 0;
 
+        // Viz frame settings asked to the server: small int8 frames on phones,
+        // higher resolution on desktop. The spectrum and levels are computed
+        // by the server on the full-rate mix ("bands" log-spaced bands)
+        const isMobile = window.matchMedia('(pointer: coarse)').matches || window.innerWidth < 768;
+        this.vizSettings = isMobile
+            ? { points: 128, format: 'int8', channels: 1, bands: 16 }
+            : { points: 512, format: 'int16', channels: 1, bands: 32 };
+        this.vizLastSeq = null;
+        this.vizDroppedFrames = 0;
+
+        // Latest features frame: spectrum bands (0..1) and RMS level
+        this.spectrum = new Float32Array(0);
+        this.level = 0;
+
         // DOM Elements
         this.waveformDiv = document.getElementById('waveform');
         this.startButton = document.getElementById('startButton');
@@ -151,11 +165,23 @@ class LiveAudioController {
             this.websocket.onopen = () => {
                 console.log('WebSocket connected! (visualization active)');
                 this.isWsConnected = true;
+                this.vizLastSeq = null;
+                this.websocket.send(JSON.stringify({ type: 'hello', ...this.vizSettings }));
             };
 
             this.websocket.onmessage = (event) => {
                 if (event.data instanceof ArrayBuffer) {
-                    this.handleVisualizationData(event.data);
+                    const magic = new Uint8Array(event.data, 0, Math.min(2, event.data.byteLength));
+                    if (magic[0] === 0x4C && magic[1] === 0x46) {
+                        this.handleFeaturesData(event.data);
+                    } else {
+                        this.handleVisualizationData(event.data);
+                    }
+                } else if (typeof event.data === 'string') {
+                    const msg = JSON.parse(event.data);
+                    if (msg.type === 'welcome') {
+                        console.log('Viz settings:', msg.points, 'points,', msg.format + ',', msg.bands, 'bands');
+                    }
                 }
             };
 
@@ -172,11 +198,73 @@ class LiveAudioController {
     }
 
     handleVisualizationData(arrayBuffer) {
-        const floatData = new Float32Array(arrayBuffer);
-        for (let i = 0; i < floatData.length && i < this.vizBuffer.length; i++) {
-            this.vizBuffer[(this.vizIndex + i) % this.vizBuffer.length] = floatData[i];
+        // Header (little endian): "LP", version u8, format u8, seq u32,
+        // timestamp u64, samplerate u32, channels u16, points u16 = 24 bytes
+        const HEADER_SIZE = 24;
+        if (arrayBuffer.byteLength < HEADER_SIZE) {
+            return;
+        }
+        const view = new DataView(arrayBuffer);
+        if (view.getUint8(0) !== 0x4C || view.getUint8(1) !== 0x50 || view.getUint8(2) !== 1) {
+            return; // not a version 1 viz frame
+        }
+        const format = view.getUint8(3);
+        const seq = view.getUint32(4, true);
+        const points = view.getUint16(22, true);
+
+        if (this.vizLastSeq !== null && seq !== ((this.vizLastSeq + 1) >>> 0)) {
+            this.vizDroppedFrames += (seq - this.vizLastSeq - 1) >>> 0;
+        }
+        this.vizLastSeq = seq;
+
+        // Only the first channel is drawn
+        let samples;
+        let scale;
+        if (format === 0) {
+            samples = new Float32Array(arrayBuffer, HEADER_SIZE, points);
+            scale = 1.0;
+        } else if (format === 1) {
+            samples = new Int16Array(arrayBuffer, HEADER_SIZE, points);
+            scale = 1.0 / 32767.0;
+        } else {
+            samples = new Int8Array(arrayBuffer, HEADER_SIZE, points);
+            scale = 1.0 / 127.0;
+        }
+
+        if (this.vizBuffer.length !== points) {
+            this.vizBuffer = new Float32Array(points);
+            this.vizIndex = 0;
         }
-        this.vizIndex = (this.vizIndex + floatData.length) % this.vizBuffer.length;
+        for (let i = 0; i < points; i++) {
+            this.vizBuffer[(this.vizIndex + i) % points] = samples[i] * scale;
+        }
+        this.vizIndex = (this.vizIndex + points) % points;
+    }
+
+    handleFeaturesData(arrayBuffer) {
+        // Same 24-byte header with magic "LF"; channels = number of float32
+        // levels (RMS L/R, peak L/R, ambient RMS, pulse RMS), points = number
+        // of uint8 bands (0 = -96 dBFS, 255 = 0 dBFS)
+        const HEADER_SIZE = 24;
+        if (arrayBuffer.byteLength < HEADER_SIZE) {
+            return;
+        }
+        const view = new DataView(arrayBuffer);
+        if (view.getUint8(2) !== 1) {
+            return;
+        }
+        const nLevels = view.getUint16(20, true);
+        const nBands = view.getUint16(22, true);
+        const levels = new Float32Array(arrayBuffer, HEADER_SIZE, nLevels);
+        const bands = new Uint8Array(arrayBuffer, HEADER_SIZE + nLevels * 4, nBands);
+
+        if (this.spectrum.length !== nBands) {
+            this.spectrum = new Float32Array(nBands);
+        }
+        for (let i = 0; i < nBands; i++) {
+            this.spectrum[i] = bands[i] / 255.0;
+        }
+        this.level = Math.max(levels[0], levels[1]);
     }
 
     startVisualization() {
@@ -189,6 +277,18 @@ class LiveAudioController {
 
             ctx.fillStyle = '#F5F5DC';
             ctx.fillRect(0, 0, width, height);
+
+            // Spectrum bars behind the waveform
+            const nBands = this.spectrum.length;
+            if (nBands > 0) {
+                const barWidth = width / nBands;
+                ctx.fillStyle = `rgba(139, 195, 74, ${0.25 + Math.min(1.0, this.level * 2.0) * 0.35})`;
+                for (let i = 0; i < nBands; i++) {
+                    const barHeight = this.spectrum[i] * height;
+                    ctx.fillRect(i * barWidth + 1, height - barHeight, barWidth - 2, barHeight);
+                }
+            }
+
             ctx.lineWidth = 3;
             ctx.strokeStyle = '#4A90E2';
             ctx.beginPath();